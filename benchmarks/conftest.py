@@ -0,0 +1,67 @@
+import tracemalloc
+from typing import Any, Callable
+
+import pytest
+
+DEFAULT_SIZES = "100,1000,10000"
+
+# Above this many rows, use a fixed number of rounds instead of calibrating
+LARGE_ROWS = 100_000
+LARGE_ROUNDS = 3
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--bench-sizes",
+        default=DEFAULT_SIZES,
+        help=f"Comma-separated numbers of rows to benchmark, default {DEFAULT_SIZES}, "
+        "e.g. 100,10000,1000000 for the full range",
+    )
+
+
+def pytest_generate_tests(metafunc):
+    if "n_rows" in metafunc.fixturenames:
+        sizes = [int(float(size)) for size in metafunc.config.getoption("bench_sizes").split(",")]
+        metafunc.parametrize("n_rows", sizes)
+
+
+@pytest.fixture
+def record_peak_memory(benchmark) -> Callable:
+    """Run func once under tracemalloc, and store the peak (MB) with the benchmark.
+
+    Traced separately from the timed rounds, as tracemalloc slows down the parsers.
+    """
+
+    def _record(func: Callable, *args) -> float:
+        tracemalloc.start()
+        try:
+            func(*args)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        peak_mb = peak / 1024**2
+        benchmark.extra_info["peak_memory_mb"] = round(peak_mb, 3)
+        return peak_mb
+
+    return _record
+
+
+@pytest.fixture
+def measure(benchmark, record_peak_memory: Callable) -> Callable:
+    """Benchmark func(arg) on n_rows in group, and record its peak memory"""
+
+    def _measure(func: Callable, arg: Any, n_rows: int, group: str = "") -> Any:
+        benchmark.group = group or func.__name__
+        benchmark.extra_info["rows"] = n_rows
+
+        if n_rows >= LARGE_ROWS:
+            result = benchmark.pedantic(func, args=(arg,), rounds=LARGE_ROUNDS, iterations=1)
+        else:
+            result = benchmark(func, arg)
+
+        record_peak_memory(func, arg)
+
+        return result
+
+    return _measure
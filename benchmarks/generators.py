@@ -0,0 +1,187 @@
+"""Synthetic scheduler outputs for benchmarking the status parsers.
+
+Outputs are cached, as they are shared between the benchmarks of the same
+size. Copy generated frames before changing them.
+"""
+
+import datetime
+import functools
+import random
+from typing import List, Tuple
+
+import pandas as pd  # type: ignore
+
+QSTAT_HEADER = (
+    "job-ID     prior   name       user         state submit/start at     "
+    "queue                          jclass                         slots ja-task-ID"
+)
+QSTAT_XML_HEADER = """<?xml version='1.0'?>
+<job_info  xmlns:xsd="http://arc.liv.ac.uk/repos/darcs/sge/source/dist/util/resources/schemas/qstat/qstat.xsd">
+"""
+
+START_TIME = datetime.datetime(2025, 5, 19, 9, 18, 15)
+
+
+def generate_qstat_rows(n_rows: int, n_jobs: int = 100, seed: int = 42) -> List[Tuple]:
+    """Generate (job_id, user, state, queue, slots, tasks) rows.
+
+    Every job has one pending row with the remaining task range, the rest of
+    its rows are running tasks.
+    """
+
+    rng = random.Random(seed)
+    n_jobs = max(1, min(n_jobs, n_rows))
+    rows_per_job = n_rows // n_jobs
+
+    rows: List[Tuple] = []
+    for i in range(n_jobs):
+        job_id = str(10000000 + i)
+        user = f"user{i % 20:02d}"
+        slots = rng.choice([1, 2, 4, 8])
+        n_running = rows_per_job - 1 if i < n_jobs - 1 else n_rows - len(rows) - 1
+
+        for task in range(1, n_running + 1):
+            queue = f"some.q@node{rng.randrange(1000):04d}.server.eu"
+            rows.append((job_id, user, "r", queue, slots, str(task)))
+
+        pending = f"{n_running + 1}-{n_running + 1000}:1"
+        rows.append((job_id, user, "qw", "", slots, pending))
+
+    return rows
+
+
+@functools.lru_cache(maxsize=None)
+def generate_qstat_text(n_rows: int, n_jobs: int = 100, seed: int = 42) -> str:
+    """Generate the fixed-width output of qstat -u"""
+
+    date = START_TIME.strftime("%m/%d/%Y %H:%M:%S")
+    lines = [QSTAT_HEADER, "-" * len(QSTAT_HEADER)]
+    for job_id, user, state, queue, slots, tasks in generate_qstat_rows(n_rows, n_jobs, seed):
+        line = (
+            f"{job_id:<10} 0.5019  {'job':<10} {user:<12} {state:<5} {date} "
+            f"{queue:<30} {'':<30} {slots:<5} {tasks}"
+        )
+        lines.append(line)
+
+    return "\n".join(lines) + "\n"
+
+
+@functools.lru_cache(maxsize=None)
+def generate_qstat_xml(n_rows: int, n_jobs: int = 100, seed: int = 42) -> str:
+    """Generate the output of qstat -xml -u"""
+
+    date = START_TIME.isoformat()
+    running: List[str] = []
+    pending: List[str] = []
+    for job_id, user, state, queue, slots, tasks in generate_qstat_rows(n_rows, n_jobs, seed):
+        time_tag = "JAT_start_time" if state == "r" else "JB_submission_time"
+        category = "running" if state == "r" else "pending"
+        element = f"""    <job_list state="{category}">
+      <JB_job_number>{job_id}</JB_job_number>
+      <JAT_prio>0.50190</JAT_prio>
+      <JB_name>job</JB_name>
+      <JB_owner>{user}</JB_owner>
+      <state>{state}</state>
+      <{time_tag}>{date}</{time_tag}>
+      <queue_name>{queue}</queue_name>
+      <jclass_name></jclass_name>
+      <slots>{slots}</slots>
+      <tasks>{tasks}</tasks>
+    </job_list>
+"""
+        (running if state == "r" else pending).append(element)
+
+    return (
+        QSTAT_XML_HEADER
+        + "  <queue_info>\n"
+        + "".join(running)
+        + "  </queue_info>\n  <job_info>\n"
+        + "".join(pending)
+        + "  </job_info>\n</job_info>\n"
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def generate_qstat_frame(n_rows: int, n_jobs: int = 100, seed: int = 42) -> pd.DataFrame:
+    """Generate the DataFrame parse_qstat returns"""
+
+    rows = generate_qstat_rows(n_rows, n_jobs, seed)
+    pdf = pd.DataFrame(rows, columns=["job-ID", "user", "state", "queue", "slots", "ja-task-ID"])
+
+    return pdf
+
+
+@functools.lru_cache(maxsize=None)
+def generate_qacctj_text(n_tasks: int, job_id: int = 10000000, seed: int = 42) -> str:
+    """Generate the output of qacct -j for a task-array"""
+
+    rng = random.Random(seed)
+    date = START_TIME.strftime("%m/%d/%Y %H:%M:%S.000")
+
+    blocks = []
+    for task in range(1, n_tasks + 1):
+        wallclock = rng.uniform(10, 3600)
+        blocks.append(
+            f"""==============================================================
+qname                    some.q
+hostname                 node{rng.randrange(1000):04d}.server.eu
+group                    some_group
+owner                    username
+jobname                  job
+jobnumber                {job_id}
+taskid                   {task}
+qsub_time                {date}
+start_time               {date}
+end_time                 {date}
+granted_pe               smp
+slots                    {rng.choice([1, 2, 4, 8])}
+failed                   0
+exit_status              {rng.choice([0] * 9 + [1])}
+ru_wallclock             {wallclock:.3f}
+ru_maxrss                {rng.randrange(10**6)}
+cpu                      {wallclock * 0.9:.3f}
+mem                      {rng.uniform(0, 100):.3f}
+maxvmem                  {rng.uniform(0.1, 16):.3f}G
+"""
+        )
+
+    return "".join(blocks)
+
+
+@functools.lru_cache(maxsize=None)
+def generate_qstatj_text(n_rows: int, n_jobs: int = 100, seed: int = 42) -> str:
+    """Generate the output of qstat -j for several task-array jobs.
+
+    Rows are the per-task lines, split over the jobs, as running task-arrays
+    print a job_state and a usage line for each task.
+    """
+
+    rng = random.Random(seed)
+    n_jobs = max(1, min(n_jobs, n_rows))
+    date = START_TIME.strftime("%m/%d/%Y %H:%M:%S.000")
+
+    blocks = []
+    for i in range(n_jobs):
+        job_id = 10000000 + i
+        n_tasks = n_rows // (2 * n_jobs) or 1
+        lines = [
+            "=" * 62,
+            f"{'job_number:':<28}{job_id}",
+            f"{'submission_time:':<28}{date}",
+            f"{'owner:':<28}user{i % 20:02d}",
+            f"{'sge_o_workdir:':<28}/home/user{i % 20:02d}/scratch",
+            f"{'job_name:':<28}job",
+            f"{'hard resource_list:':<28}h_rt=3600,m_mem_free=4G",
+            f"{'parallel environment:':<28}smp range: {rng.choice([1, 2, 4, 8])}",
+            f"{'job-array tasks:':<28}1-{n_tasks}:1",
+        ]
+        for task in range(1, n_tasks + 1):
+            lines.append(f"{'job_state':<19}{task:>4}:".ljust(28) + "r")
+            lines.append(
+                f"{'usage':<19}{task:>4}:".ljust(28)
+                + f"wallclock=00:{rng.randrange(60):02d}:00, cpu={rng.uniform(0, 3600):.3f}s, "
+                + f"mem={rng.uniform(0, 100):.3f} GBs, io=0.100 GB, vmem=1.2G, maxvmem=1.5G"
+            )
+        blocks.append("\n".join(lines))
+
+    return "\n".join(blocks) + "\n"
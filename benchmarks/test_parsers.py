@@ -0,0 +1,61 @@
+"""Wall time and peak memory of the status parsers on the polling path
+
+usage:
+    python -m pytest benchmarks/
+    python -m pytest benchmarks/ --bench-sizes 100,10000,1000000 --benchmark-autosave
+    python -m pytest benchmarks/ --benchmark-compare
+
+Peak memory is stored in the extra_info of each benchmark, and shown with
+--benchmark-json or in the saved runs.
+"""
+
+import pandas as pd  # type: ignore
+
+from benchmarks.generators import (
+    generate_qacctj_text,
+    generate_qstat_frame,
+    generate_qstat_text,
+    generate_qstat_xml,
+    generate_qstatj_text,
+)
+from hpce_utils.managers.uge import status
+
+
+def count_slots(stdout: str) -> int:
+    """Running slots streamed from qstat -xml, as get_cluster_usage does"""
+    return sum(job.slots for job in status.iter_qstat_xml(stdout))
+
+
+def test_parse_qstat(measure, n_rows):
+    pdf = measure(status.parse_qstat, generate_qstat_text(n_rows), n_rows)
+    assert len(pdf) == n_rows
+
+
+def test_parse_qstat_xml(measure, n_rows):
+    pdf = measure(status.parse_qstat_xml, generate_qstat_xml(n_rows), n_rows)
+    assert len(pdf) == n_rows
+
+
+def test_iter_qstat_xml(measure, n_rows):
+    slots = measure(count_slots, generate_qstat_xml(n_rows), n_rows, group="iter_qstat_xml")
+    assert slots > 0
+
+
+def test_parse_taskarray(measure, n_rows):
+    pdf = measure(status.parse_taskarray, generate_qstat_frame(n_rows).copy(), n_rows)
+    assert isinstance(pdf, pd.DataFrame)
+
+
+def test_parse_qstatj_bulk(measure, n_rows):
+    qstatjs = measure(status.parse_qstatj_bulk, generate_qstatj_text(n_rows), n_rows)
+    assert len(qstatjs) == min(100, n_rows)
+
+
+def test_parse_qacctj(measure, n_rows):
+    records = measure(status.parse_qacctj, generate_qacctj_text(n_rows), n_rows)
+    assert len(records) >= n_rows
+
+
+def test_parse_qacctj_typed(measure, n_rows):
+    pdf = measure(status.parse_qacctj_typed, generate_qacctj_text(n_rows), n_rows)
+    assert len(pdf) == n_rows
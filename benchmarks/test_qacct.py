@@ -0,0 +1,68 @@
+"""Parsing and aggregating qacct -j output, as dicts converted by hand and as a typed frame"""
+
+import timeit
+
+import pandas as pd  # type: ignore
+import pytest
+
+from benchmarks.generators import generate_qacctj_text
+from hpce_utils.managers.uge import status
+
+UNITS = {"K": 1024, "M": 1024**2, "G": 1024**3}
+
+# Below this many rows, the fixed cost of typing every column dominates
+COMPARE_MIN_ROWS = 10_000
+COMPARE_REPEATS = 3
+
+
+def aggregate(pdf: pd.DataFrame) -> pd.DataFrame:
+    return pdf.groupby("hostname", observed=True).agg(
+        {"maxvmem": "max", "ru_wallclock": "sum", "exit_status": "max"}
+    )
+
+
+def aggregate_dicts(stdout: str) -> pd.DataFrame:
+    """parse_qacctj, with the aggregated columns converted by hand"""
+
+    rows = []
+    for record in status.parse_qacctj(stdout):
+        if "hostname" not in record:
+            continue
+        maxvmem = record["maxvmem"]
+        rows.append(
+            {
+                "hostname": record["hostname"],
+                "maxvmem": float(maxvmem[:-1]) * UNITS.get(maxvmem[-1], 1),
+                "ru_wallclock": float(record["ru_wallclock"]),
+                "exit_status": int(record["exit_status"]),
+            }
+        )
+
+    return aggregate(pd.DataFrame(rows))
+
+
+def aggregate_typed(stdout: str) -> pd.DataFrame:
+    return aggregate(status.parse_qacctj_typed(stdout))
+
+
+def test_aggregate_qacctj_dicts(measure, n_rows):
+    pdf = measure(aggregate_dicts, generate_qacctj_text(n_rows), n_rows, group="aggregate_qacctj")
+    assert pdf["ru_wallclock"].sum() > 0
+
+
+def test_aggregate_qacctj_typed(measure, n_rows):
+    pdf = measure(aggregate_typed, generate_qacctj_text(n_rows), n_rows, group="aggregate_qacctj")
+    assert pdf["ru_wallclock"].sum() > 0
+
+
+def test_aggregate_qacctj_typed_not_slower(n_rows):
+
+    if n_rows < COMPARE_MIN_ROWS:
+        pytest.skip(f"Paths are not compared below {COMPARE_MIN_ROWS} rows")
+
+    stdout = generate_qacctj_text(n_rows)
+
+    def _best(func) -> float:
+        return min(timeit.repeat(lambda: func(stdout), number=1, repeat=COMPARE_REPEATS))
+
+    assert _best(aggregate_typed) <= _best(aggregate_dicts)
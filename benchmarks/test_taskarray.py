@@ -0,0 +1,84 @@
+"""Scaling of parse_taskarray with the number of jobs, against the per-job loop it replaced"""
+
+import re
+
+import pandas as pd  # type: ignore
+import pytest
+
+from benchmarks.generators import generate_qstat_frame
+from hpce_utils.managers.uge import status
+
+ROWS_PER_JOB = 5
+
+# The loop is too slow to benchmark with more jobs
+LOOP_MAX_JOBS = 1_000
+
+
+def parse_taskarray_loop(pdf: pd.DataFrame) -> pd.DataFrame:
+    """The per-job loop parse_taskarray was before, kept for reference.
+
+    Task ranges are counted inclusively, so both count the same tasks.
+    """
+
+    col_id = "job-ID"
+    col_state = "state"
+    col_array = "ja-task-ID"
+
+    job_ids = pdf[col_id].unique()
+
+    def _parse(line):
+        count = 0
+
+        lines = line.split(",")
+        for task in lines:
+            if "-" not in task:
+                count += 1
+                continue
+
+            start, stop, step = re.split(",|:|-|!", task)
+            count += len(range(int(start), int(stop) + 1, int(step)))
+
+        return count
+
+    rows = []
+
+    for job_id in job_ids:
+        jobs = pdf[pdf[col_id] == job_id]
+
+        pending_jobs = jobs[jobs[col_state].isin(status.pending_tags)]
+        running_jobs = jobs[jobs[col_state].isin(status.running_tags)]
+        error_jobs = jobs[jobs[col_state].isin(status.error_tags)]
+
+        pending_count = pending_jobs[col_array].apply(_parse)
+        error_count = error_jobs[col_array].apply(_parse)
+
+        rows.append(
+            {
+                "job": job_id,
+                "running": len(running_jobs),
+                "pending": int(pending_count.astype(int).sum()),
+                "error": int(error_count.astype(int).sum()),
+            }
+        )
+
+    return pd.DataFrame(rows)
+
+
+def get_frame(n_rows: int) -> pd.DataFrame:
+    return generate_qstat_frame(n_rows, max(1, n_rows // ROWS_PER_JOB)).copy()
+
+
+def test_parse_taskarray_jobs(measure, n_rows):
+    pdf = measure(status.parse_taskarray, get_frame(n_rows), n_rows, group="parse_taskarray_jobs")
+    assert len(pdf) == max(1, n_rows // ROWS_PER_JOB)
+
+
+def test_parse_taskarray_jobs_loop(measure, n_rows):
+
+    if n_rows // ROWS_PER_JOB > LOOP_MAX_JOBS:
+        pytest.skip(f"Loop is not benchmarked above {LOOP_MAX_JOBS} jobs")
+
+    frame = get_frame(n_rows)
+    pdf = measure(parse_taskarray_loop, frame, n_rows, group="parse_taskarray_jobs")
+
+    pd.testing.assert_frame_equal(status.parse_taskarray(frame), pdf, check_dtype=False)
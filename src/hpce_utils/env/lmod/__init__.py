@@ -7,7 +7,7 @@ from functools import lru_cache
 from pathlib import Path
 from typing import Any, Dict, List, Optional, Tuple
 
-from hpce_utils.shell import which
+from hpce_utils.shell import timing, which
 
 _logger = logging.getLogger("lmod")
 
@@ -43,13 +43,14 @@ def module(
 
     _logger.debug(execution)
 
-    with subprocess.Popen(
+    with timing.measure(execution) as measurement, subprocess.Popen(
         execution,
         stdout=subprocess.PIPE,
         stderr=subprocess.PIPE,
     ) as popen:
 
         bstdout, bstderr = popen.communicate()
+        measurement.set_output(popen.returncode, bstdout, bstderr)
 
         stdout = bstdout.decode("utf-8")
         stderr = bstderr.decode("utf-8")
@@ -0,0 +1,384 @@
+"""Wait for files to appear, without hammering the filesystem.
+
+Local filesystems are watched with inotify, when the platform has it. On
+network filesystems (NFS, Lustre, GPFS, ...) inotify does not see changes
+made by other hosts, so the existence of the file is checked with a stat
+loop that backs off exponentially.
+"""
+
+import asyncio
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import threading
+import time
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Set, Union
+
+logger = logging.getLogger(__name__)
+
+# From <sys/inotify.h>
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+IN_FILE_APPEARED = IN_CREATE | IN_MOVED_TO | IN_ATTRIB | IN_CLOSE_WRITE
+
+INOTIFY_EVENT = struct.Struct("iIII")
+
+NETWORK_FILESYSTEMS = [
+    "nfs",
+    "nfs4",
+    "lustre",
+    "gpfs",
+    "cifs",
+    "smbfs",
+    "smb3",
+    "beegfs",
+    "cephfs",
+    "ceph",
+    "glusterfs",
+    "fuse.sshfs",
+    "panfs",
+    "wekafs",
+]
+
+
+def get_filesystem_type(path: Union[str, Path]) -> Optional[str]:
+    """Get filesystem type of path, from the longest matching mount point"""
+
+    path_ = os.path.realpath(path)
+
+    try:
+        with open("/proc/self/mounts") as f:
+            mounts = [line.split() for line in f]
+    except OSError:
+        return None
+
+    fs_type = None
+    fs_mount = ""
+
+    for mount in mounts:
+        if len(mount) < 3:
+            continue
+
+        mount_point = mount[1]
+        is_parent = path_ == mount_point or path_.startswith(mount_point.rstrip("/") + "/")
+
+        if is_parent and len(mount_point) >= len(fs_mount):
+            fs_mount = mount_point
+            fs_type = mount[2]
+
+    return fs_type
+
+
+def is_network_filesystem(path: Union[str, Path]) -> bool:
+    """Check if path is on a filesystem shared between hosts"""
+
+    fs_type = get_filesystem_type(path)
+
+    if fs_type is None:
+        return False
+
+    return fs_type in NETWORK_FILESYSTEMS
+
+
+class Inotify:
+    """Minimal inotify wrapper, for watching a directory for new files"""
+
+    _libc: Optional[ctypes.CDLL] = None
+
+    def __init__(self) -> None:
+        libc = self.get_libc()
+        if libc is None:
+            raise OSError("inotify is not available")
+
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+    @classmethod
+    def get_libc(cls) -> Optional[ctypes.CDLL]:
+
+        if cls._libc is not None:
+            return cls._libc
+
+        libc_name = ctypes.util.find_library("c")
+        if libc_name is None:
+            return None
+
+        libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            return None
+
+        cls._libc = libc
+        return libc
+
+    @classmethod
+    def is_available(cls, path: Union[str, Path]) -> bool:
+        """inotify exists and will see changes to path"""
+        return cls.get_libc() is not None and not is_network_filesystem(path)
+
+    def add_watch(self, path: Union[str, Path], mask: int = IN_FILE_APPEARED) -> None:
+        assert self._libc is not None
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(str(path)), mask)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {path}")
+
+    def read(self, timeout: Optional[float] = 0.0) -> List[str]:
+        """Read names of changed files, waiting at most timeout seconds for events"""
+
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+
+        try:
+            buffer = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        names = []
+        offset = 0
+        while offset < len(buffer):
+            _, _, _, length = INOTIFY_EVENT.unpack_from(buffer, offset)
+            offset += INOTIFY_EVENT.size
+            name = buffer[offset : offset + length].rstrip(b"\0")
+            offset += length
+            names.append(os.fsdecode(name))
+
+        return names
+
+    def close(self) -> None:
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+    def __enter__(self) -> "Inotify":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+def _open_inotify(directory: Path) -> Optional[Inotify]:
+    """Watch directory with inotify, if that will see the changes"""
+
+    if not Inotify.is_available(directory):
+        return None
+
+    try:
+        inotify = Inotify()
+        inotify.add_watch(directory)
+    except OSError as exc:
+        logger.debug(f"Not using inotify for {directory}: {exc}")
+        return None
+
+    return inotify
+
+
+def wait_for_file(
+    path: Union[str, Path],
+    timeout: Optional[float] = None,
+    min_interval: float = 1.0,
+    max_interval: float = 60.0,
+    growth: float = 1.5,
+) -> bool:
+    """Wait for path to exist.
+
+    Uses inotify on local filesystems, otherwise checks with a stat loop
+    where the interval grows from min_interval to max_interval.
+
+    :returns: True if the file exists, False if timeout was reached
+    """
+
+    path = Path(path)
+    start_time = time.monotonic()
+    interval = min_interval
+    inotify = _open_inotify(path.parent)
+
+    try:
+        while not path.exists():
+
+            wait = interval
+            if timeout is not None:
+                remaining = timeout - (time.monotonic() - start_time)
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+
+            if inotify is not None:
+                inotify.read(timeout=wait)
+            else:
+                time.sleep(wait)
+
+            interval = min(interval * growth, max_interval)
+
+    finally:
+        if inotify is not None:
+            inotify.close()
+
+    return True
+
+
+async def wait_for_file_async(
+    path: Union[str, Path],
+    timeout: Optional[float] = None,
+    min_interval: float = 1.0,
+    max_interval: float = 60.0,
+    growth: float = 1.5,
+) -> bool:
+    """Asyncio version of wait_for_file"""
+
+    path = Path(path)
+    loop = asyncio.get_running_loop()
+    start_time = loop.time()
+    interval = min_interval
+    event = asyncio.Event()
+    inotify = _open_inotify(path.parent)
+
+    if inotify is not None:
+        loop.add_reader(inotify.fd, event.set)
+
+    try:
+        while not path.exists():
+
+            wait = interval
+            if timeout is not None:
+                remaining = timeout - (loop.time() - start_time)
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+
+            try:
+                await asyncio.wait_for(event.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+
+            if inotify is not None:
+                event.clear()
+                inotify.read()
+
+            interval = min(interval * growth, max_interval)
+
+    finally:
+        if inotify is not None:
+            loop.remove_reader(inotify.fd)
+            inotify.close()
+
+    return True
+
+
+class DirectoryWatcher:
+    """Wait for many files in one directory, from many threads or tasks.
+
+    All waiters share the same directory listing, which is refreshed with
+    one os.scandir at most once per interval. The interval backs off while
+    nothing new appears, and is reset when files appear.
+    """
+
+    def __init__(
+        self,
+        directory: Union[str, Path],
+        min_interval: float = 1.0,
+        max_interval: float = 60.0,
+        growth: float = 1.5,
+    ) -> None:
+        self.directory = Path(directory)
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.growth = growth
+        self.interval = min_interval
+        self.n_scans = 0
+
+        self._filenames: Set[str] = set()
+        self._last_scan: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def scan(self) -> Set[str]:
+        """Filenames in the directory, listed at most once per interval"""
+
+        with self._lock:
+
+            now = time.monotonic()
+            if self._last_scan is not None and now - self._last_scan < self.interval:
+                return self._filenames
+
+            try:
+                with os.scandir(self.directory) as entries:
+                    filenames = {entry.name for entry in entries}
+            except FileNotFoundError:
+                filenames = set()
+
+            if filenames - self._filenames:
+                self.interval = self.min_interval
+            else:
+                self.interval = min(self.interval * self.growth, self.max_interval)
+
+            self.n_scans += 1
+            self._filenames = filenames
+            self._last_scan = now
+
+            return filenames
+
+    def _get_wait(self, start_time: float, timeout: Optional[float]) -> Optional[float]:
+
+        wait = self.interval
+        if timeout is not None:
+            remaining = timeout - (time.monotonic() - start_time)
+            if remaining <= 0:
+                return None
+            wait = min(wait, remaining)
+
+        return wait
+
+    def wait(self, filename: str, timeout: Optional[float] = None) -> bool:
+        """Wait for filename to exist in the directory"""
+
+        start_time = time.monotonic()
+
+        while filename not in self.scan():
+            wait = self._get_wait(start_time, timeout)
+            if wait is None:
+                return False
+            time.sleep(wait)
+
+        return True
+
+    async def wait_async(self, filename: str, timeout: Optional[float] = None) -> bool:
+        """Asyncio version of wait"""
+
+        start_time = time.monotonic()
+
+        while filename not in self.scan():
+            wait = self._get_wait(start_time, timeout)
+            if wait is None:
+                return False
+            await asyncio.sleep(wait)
+
+        return True
+
+    def iter_created(
+        self, filenames: Iterable[str], timeout: Optional[float] = None
+    ) -> Iterator[str]:
+        """Yield the filenames as they appear in the directory"""
+
+        start_time = time.monotonic()
+        waiting = set(filenames)
+
+        while len(waiting):
+            created = waiting & self.scan()
+            waiting -= created
+            yield from sorted(created)
+
+            if not len(waiting):
+                break
+
+            wait = self._get_wait(start_time, timeout)
+            if wait is None:
+                return
+            time.sleep(wait)
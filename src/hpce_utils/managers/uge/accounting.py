@@ -0,0 +1,719 @@
+"""Read the SGE/UGE accounting file directly, instead of through qacct.
+
+qacct scans the whole accounting file for every query. Here the file is
+indexed once, as job_number to byte offsets, and the index is extended by
+tailing the file from the last checkpointed offset. Lookups of finished jobs
+are then seeks to the stored offsets.
+
+See accounting(5) for the file format.
+"""
+
+import csv
+import fcntl
+import fnmatch
+import hashlib
+import io
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd  # type: ignore
+
+logger = logging.getLogger(__name__)
+
+# Path to the accounting file, to read it instead of calling qacct
+ENVIRON_ACCOUNTING = "HPCE_UTILS_ACCOUNTING"
+
+# Colon-separated fields of an accounting line, as in accounting(5). Newer
+# versions append more fields, which are named field_{index}.
+ACCOUNTING_FIELDS = [
+    "qname",
+    "hostname",
+    "group",
+    "owner",
+    "job_name",
+    "job_number",
+    "account",
+    "priority",
+    "submission_time",
+    "start_time",
+    "end_time",
+    "failed",
+    "exit_status",
+    "ru_wallclock",
+    "ru_utime",
+    "ru_stime",
+    "ru_maxrss",
+    "ru_ixrss",
+    "ru_ismrss",
+    "ru_idrss",
+    "ru_isrss",
+    "ru_minflt",
+    "ru_majflt",
+    "ru_nswap",
+    "ru_inblock",
+    "ru_oublock",
+    "ru_msgsnd",
+    "ru_msgrcv",
+    "ru_nsignals",
+    "ru_nvcsw",
+    "ru_nivcsw",
+    "project",
+    "department",
+    "granted_pe",
+    "slots",
+    "task_number",
+    "cpu",
+    "mem",
+    "io",
+    "category",
+    "iow",
+    "pe_taskid",
+    "maxvmem",
+    "arid",
+    "ar_submission_time",
+]
+FIELD_JOB_NUMBER = ACCOUNTING_FIELDS.index("job_number")
+
+# Accounting field names, as printed by qacct -j
+QACCT_KEYS = {
+    "job_name": "jobname",
+    "job_number": "jobnumber",
+    "task_number": "taskid",
+    "submission_time": "qsub_time",
+}
+
+# Column types of typed qacct frames, by qacct -j key
+CATEGORY_COLUMNS = [
+    "qname",
+    "hostname",
+    "group",
+    "owner",
+    "project",
+    "department",
+    "account",
+    "granted_pe",
+]
+INTEGER_COLUMNS = [
+    "jobnumber",
+    "taskid",
+    "slots",
+    "failed",
+    "exit_status",
+    "arid",
+    "ioops",
+    "ru_minflt",
+    "ru_majflt",
+    "ru_nswap",
+    "ru_inblock",
+    "ru_oublock",
+    "ru_msgsnd",
+    "ru_msgrcv",
+    "ru_nsignals",
+    "ru_nvcsw",
+    "ru_nivcsw",
+]
+# Seconds, written with or without an "s" suffix
+SECONDS_COLUMNS = ["ru_wallclock", "ru_utime", "ru_stime", "cpu", "iow", "wallclock"]
+# Bytes, written with or without a K/M/G/T suffix
+BYTES_COLUMNS = ["maxvmem", "maxrss", "maxpss"]
+# Kilobytes from getrusage
+KILOBYTES_COLUMNS = ["ru_maxrss"]
+# GB seconds and GB
+FLOAT_COLUMNS = ["priority", "mem", "io"]
+TIME_COLUMNS = ["qsub_time", "start_time", "end_time", "ar_submission_time"]
+TIME_FORMATS = ["%m/%d/%Y %H:%M:%S.%f", "%m/%d/%Y %H:%M:%S"]
+
+BYTE_UNITS = {"": 1, "B": 1, "K": 1024, "M": 1024**2, "G": 1024**3, "T": 1024**4, "P": 1024**5}
+
+INDEX_RECORD = np.dtype([("job", "<u8"), ("offset", "<u8")])
+
+# Appended index records are kept apart, until they are this fraction of the index
+INDEX_TAIL_FRACTION = 0.1
+INDEX_TAIL_MIN = 4096
+
+_DEFAULT_INDEX: Optional["AccountingIndex"] = None
+
+
+def get_accounting_path() -> Path:
+    """Path of the accounting file, from the environment"""
+
+    path = os.environ.get(ENVIRON_ACCOUNTING)
+    if path:
+        return Path(path)
+
+    sge_root = os.environ.get("SGE_ROOT", "/usr/SGE")
+    sge_cell = os.environ.get("SGE_CELL", "default")
+
+    return Path(sge_root) / sge_cell / "common" / "accounting"
+
+
+def get_index_path(accounting_path: Path) -> Path:
+    """Default index location, in the user cache, keyed by the accounting path"""
+
+    cache_home = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    key = hashlib.sha1(str(accounting_path.resolve()).encode()).hexdigest()
+
+    return Path(cache_home) / "hpce_utils" / "accounting" / f"{key}.idx"
+
+
+def parse_accounting_line(line: Union[str, bytes]) -> Dict[str, str]:
+    """Parse one accounting line into a dict of raw strings"""
+
+    if isinstance(line, bytes):
+        line = line.decode(errors="replace")
+
+    values = line.rstrip("\n").split(":")
+    keys = ACCOUNTING_FIELDS + [
+        f"field_{index}" for index in range(len(ACCOUNTING_FIELDS), len(values))
+    ]
+
+    return dict(zip(keys, values))
+
+
+def _to_number(values: pd.Series) -> Tuple[pd.Series, pd.Series]:
+    """Split values as "12.3G" into numbers and unit suffixes"""
+
+    units = pd.Series("", index=values.index, dtype=object)
+
+    # Plain numbers convert much faster without coercion
+    try:
+        return pd.Series(values.to_numpy().astype(float), index=values.index), units
+    except (TypeError, ValueError):
+        pass
+
+    # Numbers with a unit suffix, as "12.3G" or "58.4s"
+    strings = values.astype(str)
+    heads = strings.str.rstrip("BKMGTPbs")
+    try:
+        numbers = pd.Series(heads.to_numpy().astype(float), index=values.index)
+    except (TypeError, ValueError):
+        numbers = pd.to_numeric(heads, errors="coerce")
+    suffixes = [string[len(head) :] for string, head in zip(strings.to_numpy(), heads.to_numpy())]
+    units = pd.Series(suffixes, index=values.index, dtype=object).where(values.notna(), "")
+
+    # Only values that are neither go through more string methods
+    missing = numbers.isna() & values.notna()
+    if missing.any():
+        # As "100 : assumedly after job"
+        heads = strings[missing].str.split(" ", n=1).str[0]
+        numbers[missing] = pd.to_numeric(heads.str.rstrip("BKMGTPbs"), errors="coerce")
+        units[missing] = heads.str.lstrip("0123456789.+-")
+
+    return numbers, units
+
+
+def _to_datetime(values: pd.Series) -> pd.Series:
+    """Timestamps as epoch seconds or milliseconds, or as formatted by qacct"""
+
+    try:
+        numbers = pd.Series(values.to_numpy().astype(float), index=values.index)
+    except (TypeError, ValueError):
+        numbers = None
+
+    if numbers is not None and len(numbers) and numbers.notna().all():
+        # Newer UGE versions write milliseconds, and 0 for never
+        unit = "ms" if numbers.max() > 1e11 else "s"
+        return pd.to_datetime(numbers.where(numbers > 0), unit=unit)
+
+    values = values.astype("string")
+    times = pd.to_datetime(values, format=TIME_FORMATS[0], errors="coerce")
+
+    for time_format in TIME_FORMATS[1:]:
+        missing = times.isna() & values.notna()
+        if missing.any():
+            times[missing] = pd.to_datetime(values[missing], format=time_format, errors="coerce")
+
+    # Older versions print as "Mon May 19 09:18:15 2025"
+    missing = times.isna() & values.notna()
+    missing[missing] = values[missing].str.strip() != "-/-"
+    if missing.any():
+        times[missing] = pd.to_datetime(
+            values[missing], format="%a %b %d %H:%M:%S %Y", errors="coerce"
+        )
+
+    return times
+
+
+def type_qacct(pdf: pd.DataFrame) -> pd.DataFrame:
+    """Convert a frame of raw qacct strings into typed columns, column by column.
+
+    Memory is in bytes, durations in seconds, timestamps as datetime64, and
+    hosts, queues and users as categoricals. mem is in GB seconds and io in
+    GB, as reported by the scheduler. Unknown columns are kept as strings.
+    """
+
+    pdf = pdf.copy()
+
+    for column in pdf.columns:
+
+        values = pdf[column]
+
+        if column in CATEGORY_COLUMNS:
+            pdf[column] = values.astype("category")
+
+        elif column in INTEGER_COLUMNS:
+            # failed is written as "100 : assumedly after job"
+            numbers, _ = _to_number(values)
+            pdf[column] = numbers.round().astype("Int64")
+
+        elif column in SECONDS_COLUMNS or column in FLOAT_COLUMNS:
+            numbers, _ = _to_number(values)
+            pdf[column] = numbers.astype("float64")
+
+        elif column in BYTES_COLUMNS:
+            numbers, units = _to_number(values)
+            factors = units.map(
+                {unit: BYTE_UNITS.get(unit[:1].upper(), 1) for unit in units.unique()}
+            )
+            pdf[column] = (numbers * factors).astype("float64")
+
+        elif column in KILOBYTES_COLUMNS:
+            numbers, _ = _to_number(values)
+            pdf[column] = (numbers * 1024).astype("float64")
+
+        elif column in TIME_COLUMNS:
+            pdf[column] = _to_datetime(values)
+
+    return pdf
+
+
+def split_qacct_text(stdout: str) -> pd.DataFrame:
+    """Pivot "key value" lines of qacct -j output into a frame of strings.
+
+    One row per "====" separated record, and one column per key, in order of
+    appearance. Missing keys are NaN.
+
+    qacct prints every record with the same keys, padded to the same width,
+    so the lines of a key are every n-th line, and are cut into values with
+    one join and split per key. Other output is pivoted line by line.
+    """
+
+    lines = stdout.split("\n")
+
+    pdf = _split_qacct_columns(lines)
+    if pdf is None:
+        pdf = _split_qacct_lines(lines)
+
+    return pdf
+
+
+def _split_qacct_columns(lines: List[str]) -> Optional[pd.DataFrame]:
+    """Split records with the same key lines, or None if they differ"""
+
+    # Without blank lines around the records
+    first = next((index for index, line in enumerate(lines) if line), len(lines))
+    last = len(lines)
+    while last > first and not lines[last - 1]:
+        last -= 1
+
+    if first == last or lines[first][0] != "=":
+        return None
+
+    # Lines of a record, including its separator
+    stride = (
+        next((index for index in range(first + 1, last) if lines[index][:1] == "="), last) - first
+    )
+
+    if stride < 2 or (last - first) % stride:
+        return None
+
+    separators = lines[first:last:stride]
+    if not all(line[:1] == "=" for line in separators):
+        return None
+
+    columns: Dict[str, List[str]] = dict()
+
+    for offset in range(1, stride):
+
+        # Key and the blanks up to the value
+        line = lines[first + offset]
+        key = line.split(" ", 1)[0]
+        value = line[len(key) :].lstrip(" ")
+        prefix = line[: len(line) - len(value)]
+
+        if not key or key[0].isspace() or key == prefix or key in columns:
+            return None
+
+        # Every line of the key starts with the prefix, if there is a value per record
+        joined = "\n" + "\n".join(lines[first + offset : last : stride])
+        values = joined.split("\n" + prefix)[1:]
+        if len(values) != len(separators):
+            return None
+
+        columns[key] = list(map(str.strip, values))
+
+    return pd.DataFrame(columns, dtype=object)
+
+
+def _split_qacct_lines(lines: List[str]) -> pd.DataFrame:
+    """Pivot key and value lines of any layout, through codes of records and keys"""
+
+    records: List[int] = []
+    keys: List[str] = []
+    values: List[str] = []
+    record = 0
+
+    for line in lines:
+
+        # Skip empty and continued lines
+        if not line or line[0].isspace():
+            continue
+
+        if line[0] == "=":
+            record += 1
+            continue
+
+        # Keys are padded with blanks to the value column
+        key, _, value = line.partition(" ")
+        records.append(record)
+        keys.append(key)
+        values.append(value.strip())
+
+    record_codes, _ = pd.factorize(np.asarray(records))
+    key_codes, columns = pd.factorize(np.asarray(keys, dtype=object))
+
+    table = np.full((len(np.unique(record_codes)), len(columns)), np.nan, dtype=object)
+    table[record_codes, key_codes] = values
+
+    return pd.DataFrame(table, columns=list(columns), dtype=object)
+
+
+def _read_accounting_csv(
+    source: Union[Path, io.StringIO], chunksize: Optional[int] = None
+) -> Iterator[pd.DataFrame]:
+    """Read accounting lines as frames of raw strings, named by the qacct keys"""
+
+    try:
+        reader = pd.read_csv(
+            source,
+            sep=":",
+            header=None,
+            comment="#",
+            dtype=str,
+            keep_default_na=False,
+            quoting=csv.QUOTE_NONE,
+            chunksize=chunksize,
+        )
+    except pd.errors.EmptyDataError:
+        return
+
+    chunks = [reader] if chunksize is None else reader
+
+    for pdf in chunks:
+        pdf.columns = ACCOUNTING_FIELDS[: len(pdf.columns)] + [
+            f"field_{index}" for index in range(len(ACCOUNTING_FIELDS), len(pdf.columns))
+        ]
+        yield pdf.rename(columns=QACCT_KEYS)
+
+
+def read_accounting(lines: Union[str, Path, Iterable[Union[str, bytes]]]) -> pd.DataFrame:
+    """Read accounting lines, or a whole accounting file, into a typed frame"""
+
+    if isinstance(lines, (str, Path)):
+        source: Union[Path, io.StringIO] = Path(lines)
+    else:
+        source = io.StringIO(
+            "".join(
+                line.decode(errors="replace") if isinstance(line, bytes) else line
+                for line in lines
+            )
+        )
+
+    pdfs = list(_read_accounting_csv(source))
+
+    if len(pdfs) == 0:
+        return pd.DataFrame({})
+
+    return type_qacct(pdfs[0])
+
+
+def read_jobs_by_name(
+    pattern: str,
+    path: Optional[Union[str, Path]] = None,
+    chunksize: int = 100_000,
+) -> pd.DataFrame:
+    """Typed records of jobs with names matching the shell pattern.
+
+    The accounting file is read in chunks, and only matching lines are kept.
+    """
+
+    if path is None:
+        path = get_accounting_path()
+
+    regex = fnmatch.translate(pattern)
+
+    pdfs = [
+        pdf[pdf["jobname"].str.match(regex)]
+        for pdf in _read_accounting_csv(Path(path), chunksize=chunksize)
+    ]
+
+    if len(pdfs) == 0:
+        return pd.DataFrame({})
+
+    pdf = pd.concat(pdfs, ignore_index=True)
+
+    return type_qacct(pdf)
+
+
+def _get_job_number(line: bytes) -> Optional[int]:
+
+    if line.startswith(b"#"):
+        return None
+
+    fields = line.split(b":", FIELD_JOB_NUMBER + 1)
+    if len(fields) <= FIELD_JOB_NUMBER:
+        return None
+
+    job_number = fields[FIELD_JOB_NUMBER]
+    if not job_number.isdigit():
+        return None
+
+    return int(job_number)
+
+
+def iter_accounting(path: Union[str, Path], offset: int = 0) -> Iterator[Tuple[int, int, bytes]]:
+    """Stream (offset, job_number, line) of complete accounting lines from offset"""
+
+    with open(path, "rb") as f:
+        f.seek(offset)
+
+        for line in f:
+
+            # The scheduler might be half-way through writing the last line
+            if not line.endswith(b"\n"):
+                break
+
+            job_number = _get_job_number(line)
+            if job_number is not None:
+                yield offset, job_number, line
+
+            offset += len(line)
+
+
+class AccountingIndex:
+    """Persistent index of job_number to byte offsets in the accounting file.
+
+    The index is stored as fixed-size (job, offset) records, next to a
+    checkpoint with the offset and inode of the accounting file. update()
+    only reads the lines appended after the checkpoint, and rebuilds the
+    index if the accounting file was rotated.
+    """
+
+    def __init__(
+        self,
+        accounting_path: Optional[Union[str, Path]] = None,
+        index_path: Optional[Union[str, Path]] = None,
+    ) -> None:
+
+        if accounting_path is None:
+            accounting_path = get_accounting_path()
+
+        self.accounting_path = Path(accounting_path)
+
+        if index_path is None:
+            index_path = get_index_path(self.accounting_path)
+
+        self.index_path = Path(index_path)
+        self.checkpoint_path = self.index_path.with_suffix(".json")
+        self.lock_path = self.index_path.with_suffix(".lock")
+
+        # Sorted copy of the index for lookups, and of the records appended since
+        self._jobs: np.ndarray = np.zeros(0, dtype="<u8")
+        self._offsets: np.ndarray = np.zeros(0, dtype="<u8")
+        self._tail_jobs: np.ndarray = np.zeros(0, dtype="<u8")
+        self._tail_offsets: np.ndarray = np.zeros(0, dtype="<u8")
+        self._loaded: Optional[Tuple[int, int]] = None
+        self._lock = threading.Lock()
+
+    def _read_checkpoint(self) -> Optional[Dict[str, int]]:
+        try:
+            with open(self.checkpoint_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_checkpoint(self, checkpoint: Dict[str, int]) -> None:
+        tmp_path = self.checkpoint_path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(checkpoint, f)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def update(self) -> int:
+        """Index lines appended since the last checkpoint, return number of new lines"""
+
+        stat = os.stat(self.accounting_path)
+        self.index_path.parent.mkdir(parents=True, exist_ok=True)
+
+        with open(self.lock_path, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                checkpoint = self._read_checkpoint()
+
+                is_valid = (
+                    checkpoint is not None
+                    and checkpoint["inode"] == stat.st_ino
+                    and checkpoint["offset"] <= stat.st_size
+                    and self.index_path.exists()
+                    and self.index_path.stat().st_size == checkpoint["size"]
+                )
+
+                if not is_valid:
+                    logger.info(f"Building index of {self.accounting_path}")
+                    checkpoint = {"inode": stat.st_ino, "offset": 0, "size": 0}
+                    self.index_path.write_bytes(b"")
+
+                assert checkpoint is not None
+                if checkpoint["offset"] == stat.st_size:
+                    return 0
+
+                records = []
+                offset = checkpoint["offset"]
+                for line_offset, job_number, line in iter_accounting(self.accounting_path, offset):
+                    records.append((job_number, line_offset))
+                    offset = line_offset + len(line)
+
+                index = np.array(records, dtype=INDEX_RECORD)
+                with open(self.index_path, "ab") as f:
+                    index.tofile(f)
+
+                checkpoint = {
+                    "inode": stat.st_ino,
+                    "offset": offset,
+                    "size": checkpoint["size"] + index.nbytes,
+                }
+                self._write_checkpoint(checkpoint)
+
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+        return len(records)
+
+    def _load(self) -> None:
+        """Load the index sorted by job, or only the records appended since last load"""
+
+        try:
+            stat = os.stat(self.index_path)
+        except FileNotFoundError:
+            return
+
+        key = (stat.st_ino, stat.st_size)
+        if self._loaded == key:
+            return
+
+        if self._loaded is None or self._loaded[0] != key[0] or self._loaded[1] > key[1]:
+            index = np.fromfile(self.index_path, dtype=INDEX_RECORD)
+            self._jobs, self._offsets = _sort_index(index)
+            self._tail_jobs = self._tail_jobs[:0]
+            self._tail_offsets = self._tail_offsets[:0]
+            self._loaded = key
+            return
+
+        n_records = (key[1] - self._loaded[1]) // INDEX_RECORD.itemsize
+        index = np.fromfile(
+            self.index_path, dtype=INDEX_RECORD, count=n_records, offset=self._loaded[1]
+        )
+
+        # New records are sorted apart, and merged into the index once in a while
+        tail = np.concatenate(
+            [
+                np.rec.fromarrays([self._tail_jobs, self._tail_offsets], dtype=INDEX_RECORD),
+                index,
+            ]
+        )
+        self._tail_jobs, self._tail_offsets = _sort_index(tail)
+
+        if len(self._tail_jobs) > max(INDEX_TAIL_MIN, INDEX_TAIL_FRACTION * len(self._jobs)):
+            positions = np.searchsorted(self._jobs, self._tail_jobs, side="right")
+            self._jobs = np.insert(self._jobs, positions, self._tail_jobs)
+            self._offsets = np.insert(self._offsets, positions, self._tail_offsets)
+            self._tail_jobs = self._tail_jobs[:0]
+            self._tail_offsets = self._tail_offsets[:0]
+
+        self._loaded = (key[0], self._loaded[1] + n_records * INDEX_RECORD.itemsize)
+
+    def get_offsets(self, job_number: Union[str, int]) -> np.ndarray:
+        """Byte offsets of the accounting lines of job_number"""
+
+        with self._lock:
+            self._load()
+            job = int(job_number)
+            return np.concatenate(
+                [
+                    _search_index(self._jobs, self._offsets, job),
+                    _search_index(self._tail_jobs, self._tail_offsets, job),
+                ]
+            )
+
+    def read_lines(self, job_number: Union[str, int], update: bool = True) -> List[bytes]:
+        """Accounting lines of job_number, one per finished task"""
+
+        if update:
+            self.update()
+
+        lines = []
+        with open(self.accounting_path, "rb") as f:
+            for offset in self.get_offsets(job_number):
+                f.seek(int(offset))
+                lines.append(f.readline())
+
+        return lines
+
+    def read_job(self, job_number: Union[str, int], update: bool = True) -> List[Dict[str, str]]:
+        """Accounting records of job_number, one per finished task"""
+        return [parse_accounting_line(line) for line in self.read_lines(job_number, update)]
+
+
+def _sort_index(index: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    # Stable, so lines of a job stay in file order
+    order = np.argsort(index["job"], kind="stable")
+    return index["job"][order], index["offset"][order]
+
+
+def _search_index(jobs: np.ndarray, offsets: np.ndarray, job: int) -> np.ndarray:
+    start = np.searchsorted(jobs, job, side="left")
+    stop = np.searchsorted(jobs, job, side="right")
+    return offsets[start:stop]
+
+
+def get_job(
+    job_number: Union[str, int],
+    index: Optional[AccountingIndex] = None,
+    typed: bool = False,
+) -> pd.DataFrame:
+    """Accounting records of job_number, with the column names of qacct -j.
+
+    With typed, the columns are parsed with type_qacct.
+    """
+
+    if index is None:
+        index = AccountingIndex()
+
+    if typed:
+        return read_accounting(index.read_lines(job_number))
+
+    records = index.read_job(job_number)
+
+    pdf = pd.DataFrame(records)
+    pdf = pdf.rename(columns=QACCT_KEYS)
+
+    return pdf
+
+
+def get_default_index() -> Optional[AccountingIndex]:
+    """Shared index of the accounting file set in the environment, if readable"""
+
+    global _DEFAULT_INDEX
+
+    path = os.environ.get(ENVIRON_ACCOUNTING)
+    if not path or not os.access(path, os.R_OK):
+        return None
+
+    if _DEFAULT_INDEX is None or _DEFAULT_INDEX.accounting_path != Path(path):
+        _DEFAULT_INDEX = AccountingIndex(path)
+
+    return _DEFAULT_INDEX
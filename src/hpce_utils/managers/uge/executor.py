@@ -0,0 +1,384 @@
+"""Run Python functions on UGE with the concurrent.futures interface.
+
+usage:
+    with UGEExecutor(scr="/shared/scratch", cores=1, mem=2, hours=1) as executor:
+        results = list(executor.map(function, inputs))
+
+Calls are pickled to a directory on scr, which needs to be shared with the
+nodes, and each map is submitted as a single task-array. Functions need to
+be importable on the nodes, as they are pickled by reference. Futures are
+resolved from the task marker files, so waiting for results needs no
+scheduler call per job. The scheduler is only asked every check_interval,
+for all arrays at once, to find tasks that died without a marker.
+
+The tasks are run with python -m hpce_utils.managers.uge.executor.
+"""
+
+import getpass
+import logging
+import os
+import pickle
+import shlex
+import shutil
+import subprocess
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import CancelledError, Executor, Future, InvalidStateError
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from hpce_utils.files import generate_name
+from hpce_utils.managers.uge import status, submitting, throttle
+
+logger = logging.getLogger(__name__)
+
+INPUT_DIR = "inputs"
+OUTPUT_DIR = "outputs"
+MARKER_DIR = "markers"
+LOG_DIR = "logs"
+PICKLE_SUFFIX = ".pkl"
+
+# Checks of qstat a vanished array is given to write its last markers
+VANISHED_CHECKS = 2
+
+Call = Tuple[Callable, Tuple[Any, ...], Dict[str, Any]]
+
+
+class TaskError(RuntimeError):
+    """The array task of a call failed, without returning its result"""
+
+
+class _Array:
+    """Futures of a submitted task-array, with chunks of calls per task"""
+
+    def __init__(
+        self,
+        job_id: str,
+        path: Path,
+        futures: List[List[Future]],
+        tracker: status.TaskMarkerTracker,
+    ) -> None:
+        self.job_id = job_id
+        self.path = path
+        self.futures = futures
+        self.tracker = tracker
+        self.n_vanished = 0
+        self.has_failed = False
+
+    def is_finished(self) -> bool:
+        return all(future.done() for chunk in self.futures for future in chunk)
+
+
+class UGEExecutor(Executor):
+    """Executor that runs calls as UGE array tasks
+
+    Options such as cores, mem, hours, name and task_concurrent are passed
+    to submitting.generate_taskarray_script.
+    """
+
+    def __init__(
+        self,
+        scr: Union[str, Path],
+        poll_interval: float = 5.0,
+        check_interval: float = 60.0,
+        python: str = sys.executable,
+        keep_files: bool = False,
+        **script_options: Any,
+    ) -> None:
+        self.scr = Path(scr).resolve()
+        self.scr.mkdir(parents=True, exist_ok=True)
+        self.poll_interval = poll_interval
+        self.check_interval = check_interval
+        self.python = python
+        self.keep_files = keep_files
+        self.script_options = script_options
+
+        self._arrays: List[_Array] = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._is_shutdown = False
+
+    def submit(self, fn: Callable, /, *args: Any, **kwargs: Any) -> Future:
+        """Submit a single call as an array of one task, prefer map for many calls"""
+        return self._submit_calls([(fn, args, kwargs)], chunksize=1)[0]
+
+    def map(
+        self,
+        fn: Callable,
+        *iterables: Iterable[Any],
+        timeout: Optional[float] = None,
+        chunksize: int = 1,
+    ) -> Iterator[Any]:
+        """Submit all calls as one task-array, with chunksize calls per task"""
+
+        end_time = None if timeout is None else timeout + time.monotonic()
+
+        calls: List[Call] = [(fn, args, dict()) for args in zip(*iterables)]
+        futures = self._submit_calls(calls, chunksize=chunksize) if calls else []
+
+        def result_iterator() -> Iterator[Any]:
+            try:
+                futures.reverse()
+                while futures:
+                    if end_time is None:
+                        yield futures.pop().result()
+                    else:
+                        yield futures.pop().result(end_time - time.monotonic())
+            finally:
+                for future in futures:
+                    future.cancel()
+
+        return result_iterator()
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False) -> None:
+
+        with self._lock:
+            self._is_shutdown = True
+            arrays = list(self._arrays)
+
+        if cancel_futures:
+            for array in arrays:
+                submitting.delete_job(array.job_id)
+                for chunk in array.futures:
+                    for future in chunk:
+                        _set_exception(future, CancelledError())
+
+        self._wakeup.set()
+
+        thread = self._thread
+        if wait and thread is not None:
+            thread.join()
+
+    def _submit_calls(self, calls: List[Call], chunksize: int) -> List[Future]:
+
+        with self._lock:
+            if self._is_shutdown:
+                raise RuntimeError("Cannot submit calls after shutdown")
+
+        chunksize = max(chunksize, 1)
+        chunks = [calls[start : start + chunksize] for start in range(0, len(calls), chunksize)]
+
+        path = self.scr / f"executor.{generate_name()}"
+        for directory in (INPUT_DIR, OUTPUT_DIR, MARKER_DIR):
+            (path / directory).mkdir(parents=True)
+
+        for task_id, chunk in enumerate(chunks, 1):
+            with open(path / INPUT_DIR / f"{task_id}{PICKLE_SUFFIX}", "wb") as f:
+                pickle.dump(chunk, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+        futures: List[List[Future]] = [[Future() for _ in chunk] for chunk in chunks]
+        flat_futures = [future for chunk_futures in futures for future in chunk_futures]
+        for future in flat_futures:
+            future.set_running_or_notify_cancel()
+
+        options = {"name": "UGEExecutor", "log_dir": path / LOG_DIR, **self.script_options}
+        cmd = f"{shlex.quote(self.python)} -m {__name__} {shlex.quote(str(path))}"
+        script = submitting.generate_taskarray_script(
+            cmd,
+            task_start=1,
+            task_step=1,
+            task_stop=len(chunks),
+            marker_dir=path / MARKER_DIR,
+            **options,
+        )
+
+        try:
+            job_id, _ = submitting.submit_script(script, scr=path)
+            error = f"no job ID for {path}"
+        except (subprocess.CalledProcessError, throttle.SchedulerBusyError) as exc:
+            job_id = None
+            error = str(exc)
+
+        if job_id is None:
+            for future in flat_futures:
+                future.set_exception(TaskError(f"Submission failed: {error}"))
+            return flat_futures
+
+        logger.info(f"Submitted {len(calls)} calls as {len(chunks)} tasks of uge {job_id}")
+
+        tracker = status.TaskMarkerTracker(job_id, path / MARKER_DIR, task_stop=len(chunks))
+        array = _Array(job_id, path, futures, tracker)
+
+        with self._lock:
+            self._arrays.append(array)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._follow, daemon=True)
+                self._thread.start()
+
+        return flat_futures
+
+    def _follow(self) -> None:
+        """Resolve futures from new task markers, until all arrays are finished"""
+
+        last_check = time.monotonic()
+
+        while True:
+
+            with self._lock:
+                arrays = [array for array in self._arrays if not array.is_finished()]
+                if not arrays:
+                    self._arrays = []
+                    self._thread = None
+                    return
+
+            for array in arrays:
+                for task_id in array.tracker.update_task_ids():
+                    self._resolve_task(array, task_id)
+
+            if time.monotonic() - last_check >= self.check_interval:
+                last_check = time.monotonic()
+                self._check_vanished(arrays)
+
+            for array in arrays:
+                if array.is_finished():
+                    self._cleanup(array)
+
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+    def _resolve_task(self, array: _Array, task_id: int) -> None:
+
+        futures = array.futures[task_id - 1]
+        output_path = array.path / OUTPUT_DIR / f"{task_id}{PICKLE_SUFFIX}"
+
+        try:
+            with open(output_path, "rb") as f:
+                outputs = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            exit_code = array.tracker.failed.get(task_id)
+            self._fail_task(
+                array,
+                task_id,
+                f"uge {array.job_id}.{task_id} exited with {exit_code}, see {array.path / LOG_DIR}",
+            )
+            return
+
+        for future, (is_success, value) in zip(futures, outputs):
+            if is_success:
+                _set_result(future, value)
+            else:
+                _set_exception(future, value)
+                array.has_failed = True
+
+    def _fail_task(self, array: _Array, task_id: int, message: str) -> None:
+
+        logger.error(message)
+        array.has_failed = True
+
+        for future in array.futures[task_id - 1]:
+            _set_exception(future, TaskError(message))
+
+    def _check_vanished(self, arrays: List[_Array]) -> None:
+        """Fail the tasks of arrays that left qstat without a marker, from one qstat"""
+
+        try:
+            qstat, _ = status.get_qstat_task_ids(getpass.getuser(), max_retries=0)
+        except (
+            subprocess.CalledProcessError,
+            subprocess.TimeoutExpired,
+            throttle.SchedulerBusyError,
+        ) as exc:
+            logger.warning(f"Unable to check arrays in qstat: {exc}")
+            return
+
+        rows = qstat.set_index("job").to_dict("index") if len(qstat) else dict()
+
+        for array in arrays:
+
+            row = rows.get(array.job_id)
+
+            if row is not None:
+                array.n_vanished = 0
+                for task_id in row["error"]:
+                    self._fail_task(array, task_id, f"uge {array.job_id}.{task_id} is in error")
+                continue
+
+            # Give the markers of the last tasks time to show up on the shared filesystem
+            array.n_vanished += 1
+            if array.n_vanished < VANISHED_CHECKS:
+                continue
+
+            for task_id in array.tracker.update_task_ids():
+                self._resolve_task(array, task_id)
+
+            for task_id in array.tracker.get_unfinished_task_ids():
+                self._fail_task(
+                    array, task_id, f"uge {array.job_id}.{task_id} left qstat without a result"
+                )
+
+    def _cleanup(self, array: _Array) -> None:
+
+        if self.keep_files or array.has_failed:
+            return
+
+        shutil.rmtree(array.path, ignore_errors=True)
+
+
+def _set_result(future: Future, result: Any) -> None:
+    # Futures can be cancelled by shutdown while their task finishes
+    try:
+        future.set_result(result)
+    except InvalidStateError:
+        pass
+
+
+def _set_exception(future: Future, exception: BaseException) -> None:
+    try:
+        future.set_exception(exception)
+    except InvalidStateError:
+        pass
+
+
+def run_task(path: Path, task_id: int) -> None:
+    """Run the calls of task_id, and write their results or exceptions"""
+
+    with open(path / INPUT_DIR / f"{task_id}{PICKLE_SUFFIX}", "rb") as f:
+        calls: List[Call] = pickle.load(f)
+
+    outputs: List[Tuple[bool, Any]] = []
+    for fn, args, kwargs in calls:
+        try:
+            outputs.append((True, fn(*args, **kwargs)))
+        except Exception as exc:
+            outputs.append((False, exc))
+
+    try:
+        data = pickle.dumps(outputs, protocol=pickle.HIGHEST_PROTOCOL)
+    except Exception:
+        # Results or exceptions that cannot be pickled are reported as text
+        data = pickle.dumps([_get_picklable(output) for output in outputs])
+
+    # Write and rename, so a result is never read half-written
+    output_path = path / OUTPUT_DIR / f"{task_id}{PICKLE_SUFFIX}"
+    tmp_path = output_path.with_name(f".{output_path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, output_path)
+
+
+def _get_picklable(output: Tuple[bool, Any]) -> Tuple[bool, Any]:
+
+    try:
+        pickle.dumps(output)
+    except Exception:
+        is_success, value = output
+        kind = "result" if is_success else "exception"
+        message = "".join(traceback.format_exception_only(type(value), value)).strip()
+        return False, TaskError(f"Unable to pickle {kind}: {message}")
+
+    return output
+
+
+def main(args: Optional[List[str]] = None) -> None:
+
+    args = sys.argv[1:] if args is None else args
+
+    task_id = int(os.environ["SGE_TASK_ID"])
+    run_task(Path(args[0]), task_id)
+
+
+if __name__ == "__main__":
+    main()
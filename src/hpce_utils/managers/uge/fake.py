@@ -0,0 +1,1195 @@
+"""Local stand-in for UGE, for tests and benchmarks without a cluster.
+
+Fake qsub, qstat, qacct and qdel commands share a small SQLite state store,
+and a runner process executes the submitted (task-array) scripts on local
+cores, honouring -t, -tc, -pe smp and -hold_jid. Outputs follow the formats
+of the real commands, including qstat -xml and qstat -j, and finished tasks
+are appended to an accounting file in the format of accounting(5).
+
+usage:
+    python src/hpce_utils/managers/uge/fake.py install ./bin --state ./fake_uge
+    export PATH=$PWD/bin:$PATH
+
+Only the standard library is used, as every fake command call starts a new
+interpreter on this file.
+"""
+
+import argparse
+import datetime
+import fcntl
+import fnmatch
+import getpass
+import grp
+import json
+import os
+import shlex
+import signal
+import socket
+import sqlite3
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+# Directory of the state store
+ENVIRON_STATE = "HPCE_UTILS_FAKE_UGE"
+# Number of local slots for running tasks, defaults to the number of cores
+ENVIRON_SLOTS = "HPCE_UTILS_FAKE_UGE_SLOTS"
+
+COMMANDS = ["qsub", "qstat", "qacct", "qdel"]
+QUEUE = "all.q"
+DEFAULT_PATH = "/usr/local/bin:/usr/bin:/bin"
+
+# Seconds the runner waits for new work before exiting
+RUNNER_IDLE_TIMEOUT = 2.0
+RUNNER_POLL_INTERVAL = 0.05
+
+QSTAT_HEADER = (
+    "job-ID     prior   name       user         state submit/start at     "
+    "queue                          jclass                         slots ja-task-ID"
+)
+SEPARATOR = "=" * 62
+
+# Fields of an accounting line, as in accounting(5)
+ACCOUNTING_FIELDS = [
+    "qname",
+    "hostname",
+    "group",
+    "owner",
+    "job_name",
+    "job_number",
+    "account",
+    "priority",
+    "submission_time",
+    "start_time",
+    "end_time",
+    "failed",
+    "exit_status",
+    "ru_wallclock",
+    "ru_utime",
+    "ru_stime",
+    "ru_maxrss",
+    "ru_ixrss",
+    "ru_ismrss",
+    "ru_idrss",
+    "ru_isrss",
+    "ru_minflt",
+    "ru_majflt",
+    "ru_nswap",
+    "ru_inblock",
+    "ru_oublock",
+    "ru_msgsnd",
+    "ru_msgrcv",
+    "ru_nsignals",
+    "ru_nvcsw",
+    "ru_nivcsw",
+    "project",
+    "department",
+    "granted_pe",
+    "slots",
+    "task_number",
+    "cpu",
+    "mem",
+    "io",
+    "category",
+    "iow",
+    "pe_taskid",
+    "maxvmem",
+    "arid",
+    "ar_submission_time",
+]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT,
+    owner TEXT,
+    script TEXT,
+    cwd TEXT,
+    stdout_path TEXT,
+    stderr_path TEXT,
+    environ TEXT,
+    slots INTEGER,
+    is_array INTEGER,
+    task_first INTEGER,
+    task_last INTEGER,
+    task_step INTEGER,
+    task_concurrent INTEGER,
+    hold TEXT,
+    submit_time REAL,
+    submit_cmd TEXT
+);
+CREATE TABLE IF NOT EXISTS tasks (
+    job_id INTEGER,
+    task_id INTEGER,
+    state TEXT,
+    deleted INTEGER DEFAULT 0,
+    pid INTEGER,
+    start_time REAL,
+    end_time REAL,
+    exit_status INTEGER,
+    failed INTEGER,
+    error TEXT,
+    PRIMARY KEY (job_id, task_id)
+);
+CREATE INDEX IF NOT EXISTS tasks_state ON tasks (state, job_id);
+CREATE TABLE IF NOT EXISTS runner (pid INTEGER);
+"""
+
+# Task states, as shown by qstat
+STATE_PENDING = "qw"
+STATE_HOLD = "hqw"
+STATE_RUNNING = "r"
+STATE_ERROR = "Eqw"
+STATE_DONE = "done"
+WAITING_STATES = (STATE_PENDING, STATE_HOLD)
+ACTIVE_STATES = (STATE_PENDING, STATE_HOLD, STATE_RUNNING, STATE_ERROR)
+
+Output = Tuple[str, str, int]
+
+
+def get_state_path() -> Path:
+    path = os.environ.get(ENVIRON_STATE)
+    if path:
+        return Path(path)
+    return Path.home() / ".cache" / "hpce_utils" / "fake_uge"
+
+
+def get_slots() -> int:
+    slots = os.environ.get(ENVIRON_SLOTS)
+    if slots:
+        return int(slots)
+    return os.cpu_count() or 1
+
+
+def format_time(timestamp: float) -> str:
+    """As qstat -j and qacct -j print times"""
+    date = datetime.datetime.fromtimestamp(timestamp)
+    return date.strftime("%m/%d/%Y %H:%M:%S.") + f"{date.microsecond // 1000:03d}"
+
+
+def format_task_ranges(task_ids: Sequence[int], step: int) -> str:
+    """Compress task IDs as qstat does, e.g. 1,3,5-10:1"""
+
+    ranges: List[str] = []
+    start = previous = None
+    for task_id in task_ids:
+        if previous is not None and task_id == previous + step:
+            previous = task_id
+            continue
+        if start is not None:
+            ranges.append(_format_range(start, previous, step))
+        start = previous = task_id
+
+    if start is not None:
+        ranges.append(_format_range(start, previous, step))
+
+    return ",".join(ranges)
+
+
+def _format_range(start: int, stop: Optional[int], step: int) -> str:
+    if stop is None or start == stop:
+        return str(start)
+    return f"{start}-{stop}:{step}"
+
+
+def _parse_task_range(value: str) -> Tuple[int, int, int]:
+    """Parse -t n[-m[:s]]"""
+
+    range_, _, step = value.partition(":")
+    first, _, last = range_.partition("-")
+    return int(first), int(last or first), int(step or 1)
+
+
+class FakeScheduler:
+    """State store and logic behind the fake commands"""
+
+    def __init__(self, path: Optional[Union[str, Path]] = None) -> None:
+        self.path = Path(path) if path is not None else get_state_path()
+        self.path.mkdir(parents=True, exist_ok=True)
+        (self.path / "spool").mkdir(exist_ok=True)
+        self.accounting_path = self.path / "accounting"
+        self.hostname = socket.gethostname()
+
+        self.db = sqlite3.connect(str(self.path / "state.db"), timeout=60, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self.db.close()
+
+    def _transaction(self) -> "_Transaction":
+        return _Transaction(self.db)
+
+    # qsub
+
+    def qsub(self, argv: List[str], cwd: Optional[str] = None) -> Output:
+
+        cwd = cwd or os.getcwd()
+
+        try:
+            options, script_path = _parse_qsub_args(argv)
+        except ValueError as exc:
+            return "", f"qsub: {exc}\n", 2
+
+        try:
+            script = Path(cwd, script_path).read_text()
+        except OSError:
+            return (
+                "",
+                f'Unable to read script file because of error: error opening "{script_path}"\n',
+                1,
+            )
+
+        # Embedded options, overridden by the command line
+        embedded: List[str] = []
+        for line in script.split("\n"):
+            if line.startswith("#$"):
+                embedded += shlex.split(line[2:])
+        options = {**_parse_qsub_args(embedded + ["-"])[0], **options}
+
+        name = options.get("-N") or Path(script_path).name
+        is_array = "-t" in options
+        first, last, step = _parse_task_range(options["-t"]) if is_array else (1, 1, 1)
+        task_concurrent = int(options.get("-tc") or 0)
+        slots = int(options["-pe"].split()[-1]) if "-pe" in options else 1
+        hold = options.get("-hold_jid", "")
+
+        if "-wd" in options:
+            workdir = str(Path(cwd, options["-wd"]))
+        elif "-cwd" in options:
+            workdir = cwd
+        else:
+            workdir = str(Path.home())
+
+        environ = dict(os.environ) if "-V" in options else None
+
+        with self._transaction():
+            cursor = self.db.execute(
+                "INSERT INTO jobs (name, owner, script, cwd, stdout_path, stderr_path, environ, "
+                "slots, is_array, task_first, task_last, task_step, task_concurrent, hold, "
+                "submit_time, submit_cmd) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    name,
+                    getpass.getuser(),
+                    script,
+                    workdir,
+                    options.get("-o"),
+                    options.get("-e"),
+                    json.dumps(environ) if environ is not None else None,
+                    slots,
+                    int(is_array),
+                    first,
+                    last,
+                    step,
+                    task_concurrent,
+                    hold,
+                    time.time(),
+                    shlex.join(["qsub"] + argv),
+                ),
+            )
+            job_id = cursor.lastrowid
+            assert job_id is not None
+
+            state = STATE_HOLD if self._is_held(hold) else STATE_PENDING
+            self.db.executemany(
+                "INSERT INTO tasks (job_id, task_id, state) VALUES (?, ?, ?)",
+                [(job_id, task_id, state) for task_id in range(first, last + 1, step)],
+            )
+            has_runner = self._has_runner()
+
+        (self.path / "spool" / f"{job_id}.sh").write_text(script)
+
+        if not has_runner:
+            self.start_runner()
+
+        if is_array:
+            stdout = (
+                f'Your job-array {job_id}.{first}-{last}:{step} ("{name}") has been submitted\n'
+            )
+        else:
+            stdout = f'Your job {job_id} ("{name}") has been submitted\n'
+
+        if options.get("-sync", "n").lower().startswith("y"):
+            exit_status = self.wait(job_id)
+            stdout += f"Job {job_id} exited with exit code {exit_status}.\n"
+            return stdout, "", exit_status
+
+        return stdout, "", 0
+
+    def wait(self, job_id: int, interval: float = 0.2) -> int:
+        """Wait for a job to finish, and return the highest exit status of its tasks"""
+
+        while True:
+            rows = self.db.execute(
+                "SELECT state, exit_status FROM tasks WHERE job_id = ?", (job_id,)
+            ).fetchall()
+            if not any(state in ACTIVE_STATES for state, _ in rows):
+                return max((exit_status or 0 for _, exit_status in rows), default=0)
+            time.sleep(interval)
+
+    def _is_held(self, hold: str) -> bool:
+        """Any of the jobs in hold are unfinished"""
+
+        job_ids = [job_id for job_id in hold.split(",") if job_id.strip().isdigit()]
+        if not job_ids:
+            return False
+
+        placeholders = ",".join("?" * len(job_ids))
+        (n_active,) = self.db.execute(
+            f"SELECT COUNT(*) FROM tasks WHERE job_id IN ({placeholders}) "
+            f"AND state IN ({','.join('?' * len(ACTIVE_STATES))})",
+            [int(job_id) for job_id in job_ids] + list(ACTIVE_STATES),
+        ).fetchone()
+
+        return n_active > 0
+
+    # runner
+
+    def _has_runner(self) -> bool:
+        for (pid,) in self.db.execute("SELECT pid FROM runner").fetchall():
+            try:
+                os.kill(pid, 0)
+                return True
+            except ProcessLookupError:
+                self.db.execute("DELETE FROM runner WHERE pid = ?", (pid,))
+            except PermissionError:
+                return True
+        return False
+
+    def start_runner(self) -> None:
+        """Start a detached runner process"""
+
+        environ = dict(os.environ)
+        environ[ENVIRON_STATE] = str(self.path)
+
+        with open(self.path / "runner.log", "a") as log:
+            subprocess.Popen(
+                [sys.executable, os.path.abspath(__file__), "runner"],
+                stdin=subprocess.DEVNULL,
+                stdout=log,
+                stderr=log,
+                env=environ,
+                start_new_session=True,
+            )
+
+    def run(
+        self,
+        slots: Optional[int] = None,
+        idle_timeout: float = RUNNER_IDLE_TIMEOUT,
+        poll_interval: float = RUNNER_POLL_INTERVAL,
+    ) -> None:
+        """Run pending tasks on local slots, until no work is left"""
+
+        slots = slots or get_slots()
+
+        with open(self.path / "runner.lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+
+            with self._transaction():
+                self.db.execute("INSERT INTO runner (pid) VALUES (?)", (os.getpid(),))
+
+            running: Dict[int, Tuple[int, int, float, subprocess.Popen]] = dict()
+            idle_since: Optional[float] = None
+
+            while True:
+                self._reap(running)
+                n_started = self._start_tasks(running, slots)
+
+                if running or n_started:
+                    idle_since = None
+                    time.sleep(poll_interval)
+                    continue
+
+                now = time.time()
+                idle_since = idle_since or now
+                if now - idle_since < idle_timeout:
+                    time.sleep(poll_interval)
+                    continue
+
+                # Only stop if no job was submitted meanwhile
+                with self._transaction():
+                    (n_waiting,) = self.db.execute(
+                        "SELECT COUNT(*) FROM tasks WHERE state IN (?, ?)", WAITING_STATES
+                    ).fetchone()
+                    if n_waiting == 0:
+                        self.db.execute("DELETE FROM runner WHERE pid = ?", (os.getpid(),))
+                        break
+
+                idle_since = None
+
+    def _start_tasks(
+        self, running: Dict[int, Tuple[int, int, float, subprocess.Popen]], slots: int
+    ) -> int:
+
+        n_started = 0
+
+        with self._transaction():
+
+            (n_used,) = self.db.execute(
+                "SELECT COALESCE(SUM(jobs.slots), 0) FROM tasks JOIN jobs USING (job_id) "
+                "WHERE tasks.state = ?",
+                (STATE_RUNNING,),
+            ).fetchone()
+            n_free = slots - n_used
+
+            job_ids = [
+                job_id
+                for (job_id,) in self.db.execute(
+                    "SELECT DISTINCT job_id FROM tasks WHERE state IN (?, ?) ORDER BY job_id",
+                    WAITING_STATES,
+                )
+            ]
+
+            for job_id in job_ids:
+
+                job = self._get_job(job_id)
+
+                if self._is_held(job["hold"]):
+                    self.db.execute(
+                        "UPDATE tasks SET state = ? WHERE job_id = ? AND state = ?",
+                        (STATE_HOLD, job_id, STATE_PENDING),
+                    )
+                    continue
+
+                self.db.execute(
+                    "UPDATE tasks SET state = ? WHERE job_id = ? AND state = ?",
+                    (STATE_PENDING, job_id, STATE_HOLD),
+                )
+
+                n_allowed = n_free // max(job["slots"], 1)
+                if job["task_concurrent"]:
+                    (n_running,) = self.db.execute(
+                        "SELECT COUNT(*) FROM tasks WHERE job_id = ? AND state = ?",
+                        (job_id, STATE_RUNNING),
+                    ).fetchone()
+                    n_allowed = min(n_allowed, job["task_concurrent"] - n_running)
+
+                if n_allowed <= 0:
+                    continue
+
+                task_ids = [
+                    task_id
+                    for (task_id,) in self.db.execute(
+                        "SELECT task_id FROM tasks WHERE job_id = ? AND state = ? "
+                        "ORDER BY task_id LIMIT ?",
+                        (job_id, STATE_PENDING, n_allowed),
+                    )
+                ]
+
+                for task_id in task_ids:
+                    if self._start_task(job, task_id, running):
+                        n_free -= job["slots"]
+                        n_started += 1
+
+        return n_started
+
+    def _get_job(self, job_id: int) -> Dict:
+        cursor = self.db.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,))
+        columns = [column[0] for column in cursor.description]
+        row = cursor.fetchone()
+        return dict(zip(columns, row)) if row is not None else dict()
+
+    def _get_log_path(self, job: Dict, task_id: int, path: Optional[str], kind: str) -> Path:
+        """Log file of a task, from -o or -e, which can be a directory"""
+
+        filename = f"{job['name']}.{kind}{job['job_id']}"
+        if job["is_array"]:
+            filename += f".{task_id}"
+
+        if not path:
+            return Path(job["cwd"]) / filename
+
+        log_path = Path(job["cwd"], path)
+        if path.endswith("/") or log_path.is_dir():
+            return log_path / filename
+
+        return log_path
+
+    def _start_task(
+        self, job: Dict, task_id: int, running: Dict[int, Tuple[int, int, float, subprocess.Popen]]
+    ) -> bool:
+
+        job_id = job["job_id"]
+        now = time.time()
+
+        stdout_path = self._get_log_path(job, task_id, job["stdout_path"], "o")
+        stderr_path = self._get_log_path(job, task_id, job["stderr_path"], "e")
+
+        for kind, log_path in [("stdout_path", stdout_path), ("stderr_path", stderr_path)]:
+            if not log_path.parent.is_dir():
+                directory = os.path.dirname(str(log_path.parent).rstrip("/"))
+                error = (
+                    f"{datetime.datetime.now().strftime('%m/%d/%Y %H:%M:%S')} "
+                    f"[{os.getuid()}:{os.getpid()}]: can't make directory "
+                    f'"{directory}" as {kind}: Permission denied'
+                )
+                self.db.execute(
+                    "UPDATE tasks SET state = ?, error = ? WHERE job_id = ? AND task_id = ?",
+                    (STATE_ERROR, error, job_id, task_id),
+                )
+                return False
+
+        tmpdir = self.path / "tmp" / f"{job_id}.{task_id}"
+        tmpdir.mkdir(parents=True, exist_ok=True)
+
+        if job["environ"] is not None:
+            environ = json.loads(job["environ"])
+        else:
+            environ = {
+                "PATH": DEFAULT_PATH,
+                "HOME": str(Path.home()),
+                "USER": job["owner"],
+                "LOGNAME": job["owner"],
+                "SHELL": "/bin/bash",
+            }
+
+        environ.update(
+            {
+                "JOB_ID": str(job_id),
+                "JOB_NAME": job["name"],
+                "REQUEST": job["name"],
+                "SGE_TASK_ID": str(task_id) if job["is_array"] else "undefined",
+                "SGE_TASK_FIRST": str(job["task_first"]),
+                "SGE_TASK_LAST": str(job["task_last"]),
+                "SGE_TASK_STEPSIZE": str(job["task_step"]),
+                "NSLOTS": str(job["slots"]),
+                "NHOSTS": "1",
+                "QUEUE": QUEUE,
+                "HOSTNAME": self.hostname,
+                "TMPDIR": str(tmpdir),
+                "TMP": str(tmpdir),
+                "ENVIRONMENT": "BATCH",
+                "SGE_O_WORKDIR": job["cwd"],
+                "SGE_STDOUT_PATH": str(stdout_path),
+                "SGE_STDERR_PATH": str(stderr_path),
+            }
+        )
+
+        with open(stdout_path, "a") as stdout, open(stderr_path, "a") as stderr:
+            process = subprocess.Popen(
+                ["/bin/bash", str(self.path / "spool" / f"{job_id}.sh")],
+                cwd=job["cwd"] if os.path.isdir(job["cwd"]) else None,
+                env=environ,
+                stdin=subprocess.DEVNULL,
+                stdout=stdout,
+                stderr=stderr,
+                start_new_session=True,
+            )
+
+        running[process.pid] = (job_id, task_id, now, process)
+        self.db.execute(
+            "UPDATE tasks SET state = ?, pid = ?, start_time = ? WHERE job_id = ? AND task_id = ?",
+            (STATE_RUNNING, process.pid, now, job_id, task_id),
+        )
+
+        return True
+
+    def _reap(self, running: Dict[int, Tuple[int, int, float, subprocess.Popen]]) -> None:
+        """Record finished tasks"""
+
+        finished = []
+        while running:
+            try:
+                pid, wait_status, rusage = os.wait4(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+            if pid not in running:
+                continue
+
+            job_id, task_id, start_time, process = running.pop(pid)
+            exit_code = os.waitstatus_to_exitcode(wait_status)
+            process.returncode = exit_code
+
+            # Killed by a signal is reported as 128 + signal
+            exit_status = exit_code if exit_code >= 0 else 128 - exit_code
+            finished.append((job_id, task_id, start_time, time.time(), exit_status, rusage))
+
+        if not finished:
+            return
+
+        lines = []
+        with self._transaction():
+            for job_id, task_id, start_time, end_time, exit_status, rusage in finished:
+                self.db.execute(
+                    "UPDATE tasks SET state = ?, end_time = ?, exit_status = ?, failed = 0, "
+                    "pid = NULL WHERE job_id = ? AND task_id = ?",
+                    (STATE_DONE, end_time, exit_status, job_id, task_id),
+                )
+                job = self._get_job(job_id)
+                lines.append(
+                    self._get_accounting_line(
+                        job, task_id, start_time, end_time, exit_status, rusage
+                    )
+                )
+
+        with open(self.accounting_path, "a") as f:
+            f.write("".join(lines))
+
+    def _get_accounting_line(
+        self,
+        job: Dict,
+        task_id: int,
+        start_time: float,
+        end_time: float,
+        exit_status: int,
+        rusage,
+    ) -> str:
+
+        record = {field: "0" for field in ACCOUNTING_FIELDS}
+        record.update(
+            {
+                "qname": QUEUE,
+                "hostname": self.hostname,
+                "group": _get_group(),
+                "owner": job["owner"],
+                "job_name": job["name"],
+                "job_number": str(job["job_id"]),
+                "account": "sge",
+                "submission_time": str(int(job["submit_time"])),
+                "start_time": str(int(start_time)),
+                "end_time": str(int(end_time)),
+                "exit_status": str(exit_status),
+                "ru_wallclock": f"{end_time - start_time:.3f}",
+                "ru_utime": f"{rusage.ru_utime:.3f}",
+                "ru_stime": f"{rusage.ru_stime:.3f}",
+                "ru_maxrss": str(rusage.ru_maxrss),
+                "ru_minflt": str(rusage.ru_minflt),
+                "ru_majflt": str(rusage.ru_majflt),
+                "ru_inblock": str(rusage.ru_inblock),
+                "ru_oublock": str(rusage.ru_oublock),
+                "ru_nvcsw": str(rusage.ru_nvcsw),
+                "ru_nivcsw": str(rusage.ru_nivcsw),
+                "project": "NONE",
+                "department": "defaultdepartment",
+                "granted_pe": "smp" if job["slots"] > 1 else "NONE",
+                "slots": str(job["slots"]),
+                "task_number": str(task_id) if job["is_array"] else "0",
+                "cpu": f"{rusage.ru_utime + rusage.ru_stime:.3f}",
+                "category": "",
+                "pe_taskid": "NONE",
+                "maxvmem": str(rusage.ru_maxrss * 1024),
+            }
+        )
+
+        return ":".join(record[field] for field in ACCOUNTING_FIELDS) + "\n"
+
+    # qdel
+
+    def qdel(self, argv: List[str]) -> Output:
+
+        user = getpass.getuser()
+        job_ids: List[int] = []
+
+        with self._transaction():
+            if "-u" in argv:
+                job_ids = [
+                    job_id
+                    for (job_id,) in self.db.execute(
+                        "SELECT DISTINCT job_id FROM tasks JOIN jobs USING (job_id) "
+                        "WHERE owner = ? AND state IN (?, ?, ?, ?)",
+                        (user, *ACTIVE_STATES),
+                    )
+                ]
+            else:
+                for arg in argv:
+                    job_ids += [int(job_id) for job_id in arg.split(",") if job_id.isdigit()]
+
+            stdout = []
+            stderr = []
+            for job_id in job_ids:
+                rows = self.db.execute(
+                    f"SELECT task_id, state, pid FROM tasks WHERE job_id = ? "
+                    f"AND state IN ({','.join('?' * len(ACTIVE_STATES))})",
+                    (job_id, *ACTIVE_STATES),
+                ).fetchall()
+
+                if not rows:
+                    stderr.append(f'denied: job "{job_id}" does not exist')
+                    continue
+
+                for task_id, state, pid in rows:
+                    if state == STATE_RUNNING and pid:
+                        try:
+                            os.killpg(pid, signal.SIGTERM)
+                        except ProcessLookupError:
+                            pass
+                        self.db.execute(
+                            "UPDATE tasks SET deleted = 1 WHERE job_id = ? AND task_id = ?",
+                            (job_id, task_id),
+                        )
+                    else:
+                        self.db.execute(
+                            "UPDATE tasks SET state = 'deleted', deleted = 1 "
+                            "WHERE job_id = ? AND task_id = ?",
+                            (job_id, task_id),
+                        )
+
+                stdout.append(f"{user} has deleted job {job_id}")
+
+        returncode = 1 if stderr and not stdout else 0
+        return _join_lines(stdout), _join_lines(stderr), returncode
+
+    # qstat
+
+    def _get_active_tasks(self, user: Optional[str]) -> List[Dict]:
+
+        query = (
+            "SELECT jobs.job_id, name, owner, slots, is_array, task_step, submit_time, "
+            "task_id, state, deleted, start_time FROM tasks JOIN jobs USING (job_id) "
+            f"WHERE state IN ({','.join('?' * len(ACTIVE_STATES))})"
+        )
+        params: List = list(ACTIVE_STATES)
+        if user is not None and user != "*":
+            query += " AND owner = ?"
+            params.append(user)
+        query += " ORDER BY jobs.job_id, task_id"
+
+        cursor = self.db.execute(query, params)
+        columns = [column[0] for column in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor]
+
+    def _get_qstat_rows(self, user: Optional[str]) -> List[Dict]:
+        """One row per running task, and one per job for tasks waiting in each state"""
+
+        running = []
+        waiting: Dict[Tuple[int, str], List[Dict]] = dict()
+
+        for task in self._get_active_tasks(user):
+            if task["state"] == STATE_RUNNING:
+                state = "dr" if task["deleted"] else STATE_RUNNING
+                running.append({**task, "state": state, "time": task["start_time"]})
+            else:
+                waiting.setdefault((task["job_id"], task["state"]), []).append(task)
+
+        pending = []
+        for (_, state), tasks in waiting.items():
+            task = tasks[0]
+            task_ids = [task_["task_id"] for task_ in tasks]
+            ranges = format_task_ranges(task_ids, task["task_step"]) if task["is_array"] else ""
+            pending.append(
+                {**task, "state": state, "time": task["submit_time"], "task_ranges": ranges}
+            )
+
+        for task in running:
+            task["task_ranges"] = str(task["task_id"]) if task["is_array"] else ""
+
+        return running + pending
+
+    def qstat(self, argv: List[str]) -> Output:
+
+        parser = argparse.ArgumentParser(prog="qstat", add_help=False)
+        parser.add_argument("-u")
+        parser.add_argument("-j")
+        parser.add_argument("-xml", action="store_true")
+        args, _ = parser.parse_known_args(argv)
+
+        if args.j is not None:
+            return self.qstatj(args.j.split(","))
+
+        rows = self._get_qstat_rows(args.u)
+
+        if args.xml:
+            return _format_qstat_xml(rows, self.hostname), "", 0
+
+        return _format_qstat_text(rows, self.hostname), "", 0
+
+    def qstatj(self, job_ids: List[str]) -> Output:
+
+        blocks = []
+        missing = []
+
+        for job_id_ in job_ids:
+            job = self._get_job(int(job_id_)) if job_id_.strip().isdigit() else dict()
+            tasks = self.db.execute(
+                f"SELECT task_id, state, error FROM tasks WHERE job_id = ? "
+                f"AND state IN ({','.join('?' * len(ACTIVE_STATES))}) ORDER BY task_id",
+                (job.get("job_id"), *ACTIVE_STATES),
+            ).fetchall()
+
+            if not job or not tasks:
+                missing.append(job_id_)
+                continue
+
+            blocks.append(self._format_qstatj(job, tasks))
+
+        stdout = "".join(blocks)
+
+        if missing:
+            stderr = "Following jobs do not exist: \n" + ", ".join(missing) + "\n"
+            return stdout, stderr, 1
+
+        return stdout, "", 0
+
+    def _format_qstatj(self, job: Dict, tasks: List[Tuple[int, str, Optional[str]]]) -> str:
+
+        lines = [
+            ("job_number", str(job["job_id"])),
+            ("jclass", "NONE"),
+            ("exec_file", f"job_scripts/{job['job_id']}"),
+            ("submission_time", format_time(job["submit_time"])),
+            ("owner", job["owner"]),
+            ("uid", str(os.getuid())),
+            ("group", _get_group()),
+            ("gid", str(os.getgid())),
+            ("sge_o_home", str(Path.home())),
+            ("sge_o_workdir", job["cwd"]),
+            ("sge_o_host", self.hostname),
+            ("account", "sge"),
+            ("cwd", job["cwd"]),
+            ("hard resource_list", "h_rt=3600"),
+            ("mail_list", f"{job['owner']}@{self.hostname}"),
+            ("notify", "FALSE"),
+            ("job_name", job["name"]),
+            ("jobshare", "0"),
+            ("hard_queue_list", QUEUE),
+            ("env_list", ""),
+            ("script_file", job["submit_cmd"].split()[-1]),
+            ("parallel environment", f"smp range: {job['slots']}"),
+        ]
+
+        if job["hold"]:
+            lines.append(("jid_predecessor_list (req)", job["hold"]))
+
+        if job["is_array"]:
+            tasks_range = _format_range(job["task_first"], job["task_last"], job["task_step"])
+            lines.append(("job-array tasks", tasks_range))
+
+        text = [SEPARATOR]
+        for key, value in lines:
+            text.append(f"{key + ':':<28}{value}")
+
+        for task_id, state, error in tasks:
+            if state == STATE_RUNNING:
+                text.append(f"{'job_state':<19}{task_id:>4}:".ljust(28) + STATE_RUNNING)
+            if error:
+                text.append(f"{'error reason':<12}{task_id:>5}:".ljust(28) + error)
+
+        return "\n".join(text) + "\n"
+
+    # qacct
+
+    def qacct(self, argv: List[str]) -> Output:
+        """qacct -j [job_id|job_name|pattern], optionally with -o owner and -b [[CC]YY]MMDDhhmm"""
+
+        if "-j" not in argv:
+            return "", "usage: qacct [-o owner] [-b begin_time] -j [job_id|job_name|pattern]\n", 1
+
+        index = argv.index("-j")
+        query = argv[index + 1] if index + 1 < len(argv) and argv[index + 1][0] != "-" else None
+
+        begin = 0.0
+        if "-b" in argv:
+            begin = _parse_begin_time(argv[argv.index("-b") + 1])
+
+        owner = argv[argv.index("-o") + 1] if "-o" in argv else None
+
+        records = []
+        if self.accounting_path.exists():
+            with open(self.accounting_path) as f:
+                for line in f:
+                    if line.startswith("#"):
+                        continue
+                    record = dict(zip(ACCOUNTING_FIELDS, line.rstrip("\n").split(":")))
+                    if float(record["start_time"]) < begin:
+                        continue
+                    if owner is not None and record["owner"] != owner:
+                        continue
+                    if query is None:
+                        is_match = True
+                    elif query.isdigit():
+                        is_match = record["job_number"] == query
+                    else:
+                        is_match = fnmatch.fnmatchcase(record["job_name"], query)
+                    if is_match:
+                        records.append(record)
+
+        if not records:
+            if query is None:
+                return "", "error: jobs not found\n", 1
+            kind = "id" if query.isdigit() else "name"
+            return "", f"error: job {kind} {query} not found\n", 1
+
+        return "".join(_format_qacct_record(record) for record in records), "", 0
+
+
+class _Transaction:
+    """Exclusive SQLite transaction, so concurrent commands see consistent state"""
+
+    def __init__(self, db: sqlite3.Connection) -> None:
+        self.db = db
+
+    def __enter__(self) -> None:
+        self.db.execute("BEGIN IMMEDIATE")
+
+    def __exit__(self, exc_type, *args) -> None:
+        if exc_type is None:
+            self.db.execute("COMMIT")
+        else:
+            self.db.execute("ROLLBACK")
+
+
+def _get_group() -> str:
+    try:
+        return grp.getgrgid(os.getgid()).gr_name
+    except KeyError:
+        return str(os.getgid())
+
+
+def _parse_begin_time(value: str) -> float:
+    """Unix time of a qacct -b time, [[CC]YY]MMDDhhmm[.SS]"""
+
+    value, _, seconds = value.partition(".")
+    formats = {12: "%Y%m%d%H%M", 10: "%y%m%d%H%M", 8: "%m%d%H%M"}
+    date = datetime.datetime.strptime(value, formats[len(value)])
+    if len(value) == 8:
+        date = date.replace(year=datetime.datetime.now().year)
+
+    return date.timestamp() + int(seconds or 0)
+
+
+def _join_lines(lines: List[str]) -> str:
+    return "".join(f"{line}\n" for line in lines)
+
+
+# Options of qsub that take a value, -pe takes two
+QSUB_VALUE_OPTIONS = {
+    "-N",
+    "-t",
+    "-tc",
+    "-o",
+    "-e",
+    "-hold_jid",
+    "-l",
+    "-M",
+    "-m",
+    "-sync",
+    "-wd",
+    "-q",
+    "-P",
+    "-j",
+    "-S",
+    "-A",
+}
+
+
+def _parse_qsub_args(argv: List[str]) -> Tuple[Dict[str, str], str]:
+    """Parse qsub options, and return them with the script path"""
+
+    options: Dict[str, str] = dict()
+    index = 0
+    while index < len(argv):
+        arg = argv[index]
+
+        if not arg.startswith("-") or arg == "-":
+            return options, arg
+
+        if arg == "-pe":
+            if index + 2 >= len(argv):
+                raise ValueError("option -pe needs an environment and slots")
+            options[arg] = " ".join(argv[index + 1 : index + 3])
+            index += 3
+            continue
+
+        if arg in QSUB_VALUE_OPTIONS:
+            if index + 1 >= len(argv):
+                raise ValueError(f"option {arg} needs a value")
+            value = argv[index + 1]
+            if arg == "-l" and arg in options:
+                value = f"{options[arg]},{value}"
+            options[arg] = value
+            index += 2
+            continue
+
+        options[arg] = ""
+        index += 1
+
+    raise ValueError("no script file given")
+
+
+def _format_qstat_text(rows: List[Dict], hostname: str) -> str:
+
+    if not rows:
+        return ""
+
+    lines = [QSTAT_HEADER, "-" * len(QSTAT_HEADER)]
+    for row in rows:
+        date = datetime.datetime.fromtimestamp(row["time"]).strftime("%m/%d/%Y %H:%M:%S")
+        queue = f"{QUEUE}@{hostname}" if row["state"] in (STATE_RUNNING, "dr") else ""
+        lines.append(
+            f"{row['job_id']:<10} 0.50000 {row['name'][:10]:<10} {row['owner'][:12]:<12} "
+            f"{row['state']:<5} {date} {queue[:30]:<30} {'':<30} {row['slots']:<5} "
+            f"{row['task_ranges']}"
+        )
+
+    return "\n".join(lines) + "\n"
+
+
+def _format_qstat_xml(rows: List[Dict], hostname: str) -> str:
+
+    from xml.sax.saxutils import escape
+
+    running: List[str] = []
+    pending: List[str] = []
+
+    for row in rows:
+        is_running = row["state"] in (STATE_RUNNING, "dr")
+        date = datetime.datetime.fromtimestamp(row["time"]).replace(microsecond=0).isoformat()
+        time_tag = "JAT_start_time" if is_running else "JB_submission_time"
+        queue = f"{QUEUE}@{hostname}" if is_running else ""
+        element = f"""    <job_list state="{'running' if is_running else 'pending'}">
+      <JB_job_number>{row['job_id']}</JB_job_number>
+      <JAT_prio>0.50000</JAT_prio>
+      <JB_name>{escape(row['name'])}</JB_name>
+      <JB_owner>{escape(row['owner'])}</JB_owner>
+      <state>{row['state']}</state>
+      <{time_tag}>{date}</{time_tag}>
+      <queue_name>{escape(queue)}</queue_name>
+      <jclass_name></jclass_name>
+      <slots>{row['slots']}</slots>
+"""
+        if row["task_ranges"]:
+            element += f"      <tasks>{row['task_ranges']}</tasks>\n"
+        element += "    </job_list>\n"
+
+        (running if is_running else pending).append(element)
+
+    return (
+        "<?xml version='1.0'?>\n"
+        '<job_info  xmlns:xsd="http://arc.liv.ac.uk/repos/darcs/sge/source/dist/util/'
+        'resources/schemas/qstat/qstat.xsd">\n'
+        "  <queue_info>\n" + "".join(running) + "  </queue_info>\n"
+        "  <job_info>\n" + "".join(pending) + "  </job_info>\n"
+        "</job_info>\n"
+    )
+
+
+def _format_qacct_record(record: Dict[str, str]) -> str:
+
+    def _time(value: str) -> str:
+        return format_time(float(value)) if float(value) > 0 else "-/-"
+
+    maxvmem = float(record["maxvmem"]) / 1024**2
+    values = [
+        ("qname", record["qname"]),
+        ("hostname", record["hostname"]),
+        ("group", record["group"]),
+        ("owner", record["owner"]),
+        ("project", record["project"]),
+        ("department", record["department"]),
+        ("jobname", record["job_name"]),
+        ("jobnumber", record["job_number"]),
+        ("taskid", record["task_number"] if record["task_number"] != "0" else "undefined"),
+        ("pe_taskid", record["pe_taskid"]),
+        ("account", record["account"]),
+        ("priority", record["priority"]),
+        ("qsub_time", _time(record["submission_time"])),
+        ("start_time", _time(record["start_time"])),
+        ("end_time", _time(record["end_time"])),
+        ("granted_pe", record["granted_pe"]),
+        ("slots", record["slots"]),
+        ("failed", record["failed"]),
+        ("deleted_by", "NONE"),
+        ("exit_status", record["exit_status"]),
+        ("ru_wallclock", record["ru_wallclock"]),
+        ("ru_utime", record["ru_utime"]),
+        ("ru_stime", record["ru_stime"]),
+        ("ru_maxrss", record["ru_maxrss"]),
+        ("ru_ixrss", record["ru_ixrss"]),
+        ("ru_ismrss", record["ru_ismrss"]),
+        ("ru_idrss", record["ru_idrss"]),
+        ("ru_isrss", record["ru_isrss"]),
+        ("ru_minflt", record["ru_minflt"]),
+        ("ru_majflt", record["ru_majflt"]),
+        ("ru_nswap", record["ru_nswap"]),
+        ("ru_inblock", record["ru_inblock"]),
+        ("ru_oublock", record["ru_oublock"]),
+        ("ru_msgsnd", record["ru_msgsnd"]),
+        ("ru_msgrcv", record["ru_msgrcv"]),
+        ("ru_nsignals", record["ru_nsignals"]),
+        ("ru_nvcsw", record["ru_nvcsw"]),
+        ("ru_nivcsw", record["ru_nivcsw"]),
+        ("wallclock", record["ru_wallclock"]),
+        ("cpu", record["cpu"]),
+        ("mem", "0.000"),
+        ("io", "0.000"),
+        ("iow", "0.000"),
+        ("ioops", "0"),
+        ("maxvmem", f"{maxvmem:.3f}M"),
+        ("maxrss", "0.000"),
+        ("maxpss", "0.000"),
+        ("arid", "undefined"),
+    ]
+
+    return SEPARATOR + "\n" + "".join(f"{key:<25}{value}\n" for key, value in values)
+
+
+def install(bin_dir: Union[str, Path], state_path: Optional[Union[str, Path]] = None) -> Path:
+    """Write executable qsub, qstat, qacct and qdel shims into bin_dir"""
+
+    bin_dir = Path(bin_dir)
+    bin_dir.mkdir(parents=True, exist_ok=True)
+
+    state = ""
+    if state_path is not None:
+        state_ = shlex.quote(str(Path(state_path).resolve()))
+        state = f'export {ENVIRON_STATE}="${{{ENVIRON_STATE}:-{state_}}}"\n'
+
+    for command in COMMANDS:
+        shim = bin_dir / command
+        shim.write_text(
+            "#!/bin/sh\n"
+            + state
+            + f"exec {shlex.quote(sys.executable)} {shlex.quote(os.path.abspath(__file__))} "
+            + f'{command} "$@"\n'
+        )
+        shim.chmod(0o755)
+
+    return bin_dir
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+
+    argv = list(sys.argv[1:] if argv is None else argv)
+
+    if not argv:
+        print(f"usage: fake.py {{{','.join(COMMANDS)},runner,install}} ...", file=sys.stderr)
+        return 2
+
+    command, args = argv[0], argv[1:]
+
+    if command == "install":
+        parser = argparse.ArgumentParser(prog="fake.py install")
+        parser.add_argument("bin_dir")
+        parser.add_argument("--state", default=None)
+        install_args = parser.parse_args(args)
+        install(install_args.bin_dir, install_args.state)
+        return 0
+
+    scheduler = FakeScheduler()
+
+    try:
+        if command == "runner":
+            scheduler.run()
+            return 0
+
+        if command not in COMMANDS:
+            print(f"unknown command {command}", file=sys.stderr)
+            return 2
+
+        stdout, stderr, returncode = getattr(scheduler, command)(args)
+
+    finally:
+        scheduler.close()
+
+    sys.stdout.write(stdout)
+    sys.stderr.write(stderr)
+
+    return returncode
+
+
+if __name__ == "__main__":
+    sys.exit(main())
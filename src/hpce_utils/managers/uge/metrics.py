@@ -0,0 +1,115 @@
+"""Export task-array progress as JSON lines or a node-exporter textfile.
+
+Writers take the metrics of TaskarrayProgress.get_metrics, one dict per
+array, and are called by status.ProgressRenderer on every qstat snapshot.
+"""
+
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+# Prefix of the Prometheus metric names
+METRIC_PREFIX = "hpce_uge_array"
+
+# Suffix of node-exporter textfile collector files
+PROMETHEUS_SUFFIX = ".prom"
+
+TASK_STATES = ["running", "pending", "error", "finished"]
+
+Metrics = Dict[str, Union[str, int, float, None]]
+
+
+class JsonLinesWriter:
+    """Append one JSON line per array and snapshot"""
+
+    def __init__(self, path: Union[str, Path]) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+    def write(self, metrics: Iterable[Metrics]) -> None:
+        lines = "".join(json.dumps(metrics_) + "\n" for metrics_ in metrics)
+
+        # One write per snapshot, so concurrent readers see whole lines
+        with open(self.path, "a") as f:
+            f.write(lines)
+
+
+class PrometheusTextfileWriter:
+    """Replace a node-exporter textfile with the gauges of the latest snapshot"""
+
+    def __init__(self, path: Union[str, Path]) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+    def write(self, metrics: Iterable[Metrics]) -> None:
+        text = format_prometheus(metrics)
+
+        # Write and rename, so the collector never reads a partial file
+        tmp_path = self.path.with_name(f".{self.path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, "w") as f:
+            f.write(text)
+        os.replace(tmp_path, self.path)
+
+
+def _escape_label(value: object) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_prometheus(metrics: Iterable[Metrics]) -> str:
+    """Format metrics in the Prometheus text exposition format"""
+
+    tasks: List[str] = []
+    rates: List[str] = []
+    etas: List[str] = []
+    updates: List[str] = []
+
+    for metrics_ in metrics:
+        labels = f'job="{_escape_label(metrics_["job"])}",name="{_escape_label(metrics_["name"])}"'
+
+        for state in TASK_STATES:
+            tasks.append(f'{METRIC_PREFIX}_tasks{{{labels},state="{state}"}} {metrics_[state]}')
+
+        if metrics_["tasks_per_second"] is not None:
+            rates.append(
+                f"{METRIC_PREFIX}_tasks_per_second{{{labels}}} {metrics_['tasks_per_second']}"
+            )
+
+        if metrics_["eta_seconds"] is not None:
+            etas.append(f"{METRIC_PREFIX}_eta_seconds{{{labels}}} {metrics_['eta_seconds']}")
+
+        updates.append(f"{METRIC_PREFIX}_last_update_seconds{{{labels}}} {metrics_['time']}")
+
+    blocks = [
+        ("tasks", "gauge", "Tasks of the array by state", tasks),
+        ("tasks_per_second", "gauge", "Task completion rate", rates),
+        ("eta_seconds", "gauge", "Expected seconds until the array is finished", etas),
+        ("last_update_seconds", "gauge", "Unix time of the snapshot", updates),
+    ]
+
+    lines = []
+    for name, kind, help_, samples in blocks:
+        lines.append(f"# HELP {METRIC_PREFIX}_{name} {help_}")
+        lines.append(f"# TYPE {METRIC_PREFIX}_{name} {kind}")
+        lines += samples
+
+    return "\n".join(lines) + "\n"
+
+
+def get_writer(
+    path: Optional[Union[str, Path]],
+) -> Optional[Union[JsonLinesWriter, PrometheusTextfileWriter]]:
+    """Writer for path, a textfile for the .prom suffix, otherwise JSON lines"""
+
+    if path is None:
+        return None
+
+    path = Path(path)
+
+    if path.suffix == PROMETHEUS_SUFFIX:
+        return PrometheusTextfileWriter(path)
+
+    return JsonLinesWriter(path)
@@ -0,0 +1,132 @@
+"""Fixed-size results of array tasks, stored in one .npy file on shared scratch.
+
+The submitter preallocates the file with a row per task, and each task
+writes its row at the offset of its SGE_TASK_ID, with task 1 in row 0.
+Collecting the results is a single memory map of the file, without reading
+and concatenating a file per task.
+
+usage:
+    store = ResultStore.create(scr / "energies.npy", n_tasks=1000, shape=(3,))
+    # in task script
+    write_result(scr / "energies.npy", values)
+    # after the array
+    results = store.read()
+    missing = store.get_missing_tasks()
+
+Rows are written with pwrite instead of through a writable memory map, as
+page write-back could overwrite rows of other nodes on network filesystems.
+A row is marked as written in a second file, after its data is flushed.
+"""
+
+import os
+from pathlib import Path
+from typing import Any, Optional, Tuple, Union
+
+import numpy as np
+
+from hpce_utils.managers.uge.taskset import TaskSet
+
+# Suffix of the file of written rows, next to the results
+WRITTEN_SUFFIX = ".written.npy"
+
+
+class ResultStore:
+    """A preallocated .npy file with a row per task, and the rows written so far"""
+
+    def __init__(self, path: Union[str, Path]) -> None:
+        self.path = Path(path)
+        self.written_path = self.path.with_name(self.path.name + WRITTEN_SUFFIX)
+
+        # Only the header is read
+        results = np.load(self.path, mmap_mode="r")
+        self.n_tasks: int = results.shape[0]
+        self.shape: Tuple[int, ...] = results.shape[1:]
+        self.dtype: np.dtype = results.dtype
+        self._offset: int = results.offset
+        self._row_nbytes = int(np.prod(self.shape, dtype=np.int64)) * self.dtype.itemsize
+
+        written = np.load(self.written_path, mmap_mode="r")
+        self._written_offset: int = written.offset
+        del results, written
+
+    @classmethod
+    def create(
+        cls,
+        path: Union[str, Path],
+        n_tasks: int,
+        shape: Tuple[int, ...] = (),
+        dtype: Any = np.float64,
+    ) -> "ResultStore":
+        """Preallocate the results of n_tasks tasks, each an array of shape and dtype"""
+
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        results = np.lib.format.open_memmap(
+            path, mode="w+", dtype=np.dtype(dtype), shape=(n_tasks, *shape)
+        )
+        del results
+
+        written_path = path.with_name(path.name + WRITTEN_SUFFIX)
+        written = np.lib.format.open_memmap(
+            written_path, mode="w+", dtype=np.uint8, shape=(n_tasks,)
+        )
+        del written
+
+        return cls(path)
+
+    def _get_index(self, task_id: int) -> int:
+        index = task_id - 1
+        if index < 0 or index >= self.n_tasks:
+            raise ValueError(f"Task {task_id} is not in 1-{self.n_tasks} of {self.path}")
+        return index
+
+    def write(self, task_id: int, value: Any) -> None:
+        """Write the result of task_id"""
+
+        index = self._get_index(task_id)
+
+        row = np.asarray(value, dtype=self.dtype, order="C")
+        if row.shape != self.shape:
+            raise ValueError(f"Result of shape {row.shape} does not fit rows of {self.shape}")
+
+        _pwrite(self.path, row.tobytes(), self._offset + index * self._row_nbytes)
+        _pwrite(self.written_path, b"\x01", self._written_offset + index)
+
+    def read(self) -> np.memmap:
+        """All results, as a read-only memory map. Rows not written are zeros"""
+        return np.load(self.path, mmap_mode="r")
+
+    def get_written(self) -> np.ndarray:
+        """Boolean mask of the rows that are written"""
+        return np.load(self.written_path, mmap_mode="r").astype(bool)
+
+    def get_missing_tasks(self) -> TaskSet:
+        """Task IDs without a written result"""
+        return TaskSet.from_ids(np.flatnonzero(~self.get_written()) + 1)
+
+
+def _pwrite(path: Path, data: bytes, offset: int) -> None:
+
+    fd = os.open(path, os.O_WRONLY)
+    try:
+        view = memoryview(data)
+        while view:
+            n_written = os.pwrite(fd, view, offset)
+            view = view[n_written:]
+            offset += n_written
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def write_result(path: Union[str, Path], value: Any, task_id: Optional[int] = None) -> None:
+    """Write the result of the current array task, from SGE_TASK_ID"""
+
+    if task_id is None:
+        task_id_ = os.environ.get("SGE_TASK_ID")
+        if task_id_ is None or not task_id_.isdigit():
+            raise ValueError("Not array task")
+        task_id = int(task_id_)
+
+    ResultStore(path).write(task_id, value)
@@ -0,0 +1,132 @@
+"""Suggest memory, runtime and cores for a job from its past accounting records"""
+
+import fnmatch
+import logging
+import math
+from pathlib import Path
+from typing import NamedTuple, Optional, Union
+
+import numpy as np
+import pandas as pd  # type: ignore
+
+from hpce_utils.managers.uge import accounting, status
+
+logger = logging.getLogger(__name__)
+
+GIGABYTE = 1024**3
+
+# Least number of finished tasks to base a suggestion on
+MIN_SAMPLES = 5
+
+
+class ResourceSuggestion(NamedTuple):
+    """Resource requests, as the arguments of generate_taskarray_script.
+
+    mem is per core, as m_mem_free is requested per slot.
+    """
+
+    mem: int
+    hours: int
+    mins: int
+    cores: int
+    n_samples: int
+
+
+def get_history(pattern: str, accounting_path: Optional[Union[str, Path]] = None) -> pd.DataFrame:
+    """Typed accounting records of jobs with names matching pattern.
+
+    Read from the accounting file if given, or set in HPCE_UTILS_ACCOUNTING,
+    otherwise from qacct -j, which accepts job name patterns.
+    """
+
+    if accounting_path is None:
+        index = accounting.get_default_index()
+        accounting_path = index.accounting_path if index is not None else None
+
+    if accounting_path is not None:
+        return accounting.read_jobs_by_name(pattern, accounting_path)
+
+    pdf, _ = status.get_qacctj(pattern)
+
+    if len(pdf) == 0:
+        return pdf
+
+    pdf = accounting.type_qacct(pdf)
+
+    # qacct matches job IDs too, only keep the names
+    is_match = pdf["jobname"].astype(str).map(lambda name: fnmatch.fnmatchcase(name, pattern))
+
+    return pdf[is_match].reset_index(drop=True)
+
+
+def suggest_resources(
+    history: pd.DataFrame,
+    percentile: float = 95,
+    margin: float = 1.2,
+    max_cores: Optional[int] = None,
+) -> Optional[ResourceSuggestion]:
+    """Suggest resource requests covering percentile of the successful tasks.
+
+    Memory is the peak virtual memory, runtime the wallclock, and cores the
+    CPU time over the wallclock, each at percentile and scaled by margin.
+    Memory is then split over the suggested cores, which need not be the
+    slots the tasks ran with. Returns None with less than MIN_SAMPLES
+    successful tasks.
+    """
+
+    if len(history) == 0:
+        return None
+
+    is_success = (history["exit_status"].fillna(1) == 0) & (history["failed"].fillna(1) == 0)
+    history = history[is_success]
+
+    if len(history) < MIN_SAMPLES:
+        logger.info(f"Only {len(history)} successful tasks, not suggesting resources")
+        return None
+
+    wallclock = history["ru_wallclock"].astype(float)
+
+    seconds = _get_percentile(wallclock, percentile) * margin
+    minutes = max(math.ceil(seconds / 60), 1)
+
+    cores_used = history["cpu"].astype(float) / wallclock.where(wallclock > 0)
+    cores = max(math.ceil(_get_percentile(cores_used, percentile) * margin), 1)
+
+    if max_cores is not None:
+        cores = min(cores, max_cores)
+
+    # maxvmem is of the whole task, m_mem_free is per slot
+    mem = _get_percentile(history["maxvmem"].astype(float), percentile) * margin / cores / GIGABYTE
+
+    return ResourceSuggestion(
+        mem=max(math.ceil(mem), 1),
+        hours=minutes // 60,
+        mins=minutes % 60,
+        cores=cores,
+        n_samples=len(history),
+    )
+
+
+def _get_percentile(values: pd.Series, percentile: float) -> float:
+
+    values_ = values.to_numpy(dtype=float)
+    values_ = values_[np.isfinite(values_)]
+
+    if len(values_) == 0:
+        return 0.0
+
+    return float(np.percentile(values_, percentile))
+
+
+def suggest_for_name(
+    name: str,
+    percentile: float = 95,
+    margin: float = 1.2,
+    max_cores: Optional[int] = None,
+    accounting_path: Optional[Union[str, Path]] = None,
+) -> Optional[ResourceSuggestion]:
+    """Suggest resources for a job named name, from past jobs with the same name"""
+
+    history = get_history(name, accounting_path=accounting_path)
+
+    return suggest_resources(history, percentile=percentile, margin=margin, max_cores=max_cores)
@@ -1,19 +1,45 @@
+import asyncio
 import datetime
+import fcntl
+import getpass
+import hashlib
+import json
 import logging
 import os
 import re
+import shlex
 import subprocess
+import threading
 import time
-from collections import defaultdict
+from collections import defaultdict, deque
 from pathlib import Path
-from typing import Dict, Iterator, List, Optional, Tuple, Union
-
+from typing import (
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Deque,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+from xml.etree import ElementTree
+
+import numpy as np
 import pandas as pd  # type: ignore
 from pandas import DataFrame  # type: ignore
 from tqdm import tqdm  # type: ignore
 
-from hpce_utils.managers.uge import submitting
-from hpce_utils.shell import execute, execute_with_retry  # type: ignore
+from hpce_utils import env
+from hpce_utils.files.watch import DirectoryWatcher, wait_for_file, wait_for_file_async
+from hpce_utils.managers.uge import accounting, metrics, submitting, throttle
+from hpce_utils.managers.uge.taskset import TaskSet
+from hpce_utils.shell import execute, execute_async  # type: ignore
 
 logger = logging.getLogger(__name__)
 
@@ -55,10 +81,230 @@ deleted_tags = "dr,dt,dRr,dRt,ds,dS,dT,dRs,dRS,dRT".split(",")
 
 
 COLUMN_JOB = "job"
+
+# Job number and task ID of each record in qacct -j output, on consecutive lines
+QACCT_JOB_TASK_PATTERN = re.compile(r"^jobnumber\s+(\d+)\s*\ntaskid\s+(\S+)", re.MULTILINE)
 COLUMN_JOB_ID = "job_number"
 COLUMN_SUBMISSION_TIME = "submission_time"
 COLUMN_TASKARRAY = "job-array tasks"
 
+# Number of progress samples used to estimate task completion rate
+PROGRESS_SAMPLES = 20
+
+# With more arrays than this, follow_progress draws a single summary bar
+MAX_PROGRESS_BARS = 20
+
+# Jobs per qstat -j call, to keep the command line short
+QSTATJ_MAX_JOBS = 500
+
+# Checks of qstat a vanished array is given to write its last markers
+MARKER_VANISHED_CHECKS = 2
+
+# Seconds a qstat snapshot can be reused, 0 to disable
+ENVIRON_SNAPSHOT_TTL = "HPCE_UTILS_QSTAT_TTL"
+
+
+class Snapshot(NamedTuple):
+    """Output of a scheduler query, with the return code of a failed query"""
+
+    time: float
+    stdout: str
+    stderr: str
+    returncode: int = 0
+
+
+class SnapshotCache:
+    """TTL cache of scheduler query outputs, keyed by the query.
+
+    Snapshots are stored as files in the shared memory path of the host, and
+    refreshed under a file lock, so only one process per TTL interval runs
+    the query, and the rest read the stored snapshot. Without a shared memory
+    path, snapshots are only kept in-process.
+
+    Failed queries, e.g. qstat -j of finished jobs, are cached as well and
+    raised again as CalledProcessError. Failures to reach qmaster are not.
+    """
+
+    def __init__(self, ttl: float = 0.0, path: Optional[Path] = None) -> None:
+        self.ttl = ttl
+        self._path = path
+        self._snapshots: Dict[str, Snapshot] = dict()
+        self._locks: Dict[str, threading.Lock] = dict()
+        self._lock = threading.Lock()
+
+    @property
+    def path(self) -> Optional[Path]:
+        """Directory of the shared snapshots, per user as outputs are user-specific"""
+
+        if self._path is not None:
+            return self._path
+
+        shm_path = env.get_shm_path()
+        if shm_path is None:
+            return None
+
+        return shm_path / f"hpce_utils_snapshots_{os.getuid()}"
+
+    def _get_lock(self, query: str) -> threading.Lock:
+        # A lock per query, so a slow query does not hold up the others
+        with self._lock:
+            return self._locks.setdefault(query, threading.Lock())
+
+    def _is_fresh(self, snapshot: Optional[Snapshot]) -> bool:
+        return snapshot is not None and time.time() - snapshot.time < self.ttl
+
+    def _read(self, filename: Path) -> Optional[Snapshot]:
+        try:
+            with open(filename) as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        return Snapshot(
+            snapshot["time"],
+            snapshot["stdout"],
+            snapshot["stderr"],
+            snapshot.get("returncode", 0),
+        )
+
+    def _write(self, filename: Path, snapshot: Snapshot) -> None:
+        # Write and rename, so readers never see a partial snapshot
+        tmp_filename = filename.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_filename, "w") as f:
+            json.dump(snapshot._asdict(), f)
+        os.replace(tmp_filename, filename)
+
+    @staticmethod
+    def _run(query: str, run: Callable[[], Tuple[str, str]]) -> Snapshot:
+
+        logger.debug(f"Refreshing snapshot of {query}")
+
+        try:
+            stdout, stderr = run()
+        except subprocess.CalledProcessError as exc:
+            if throttle.is_qmaster_error(exc):
+                raise exc
+            return Snapshot(time.time(), exc.stdout or "", exc.stderr or "", exc.returncode)
+
+        return Snapshot(time.time(), stdout, stderr)
+
+    def _refresh(self, query: str, run: Callable[[], Tuple[str, str]]) -> Snapshot:
+
+        path = self.path
+        if path is None:
+            return self._run(query, run)
+
+        path.mkdir(mode=0o700, parents=True, exist_ok=True)
+        key = hashlib.sha1(query.encode()).hexdigest()
+        filename = path / f"{key}.json"
+
+        snapshot = self._read(filename)
+        if self._is_fresh(snapshot):
+            assert snapshot is not None
+            return snapshot
+
+        with open(path / f"{key}.lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                # Another process might have refreshed while we waited
+                snapshot = self._read(filename)
+                if not self._is_fresh(snapshot):
+                    snapshot = self._run(query, run)
+                    self._write(filename, snapshot)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+        assert snapshot is not None
+        return snapshot
+
+    def fetch(self, query: str, run: Callable[[], Tuple[str, str]]) -> Tuple[str, str]:
+        """Return stdout and stderr of query, from a fresh snapshot or by calling run"""
+
+        if self.ttl <= 0:
+            return run()
+
+        with self._get_lock(query):
+            snapshot = self._snapshots.get(query)
+            if not self._is_fresh(snapshot):
+                snapshot = self._refresh(query, run)
+                self._snapshots[query] = snapshot
+
+        assert snapshot is not None
+        if snapshot.returncode != 0:
+            raise subprocess.CalledProcessError(
+                snapshot.returncode, query, output=snapshot.stdout, stderr=snapshot.stderr
+            )
+
+        return snapshot.stdout, snapshot.stderr
+
+    async def fetch_async(
+        self, query: str, run: Callable[[], Awaitable[Tuple[str, str]]]
+    ) -> Tuple[str, str]:
+        """Asyncio version of fetch
+
+        The locks are taken in a worker thread, while the query itself is run
+        on the event loop.
+        """
+
+        if self.ttl <= 0:
+            return await run()
+
+        loop = asyncio.get_running_loop()
+
+        async def _run() -> Tuple[str, str]:
+            return await run()
+
+        def run_on_loop() -> Tuple[str, str]:
+            return asyncio.run_coroutine_threadsafe(_run(), loop).result()
+
+        return await loop.run_in_executor(None, self.fetch, query, run_on_loop)
+
+
+SNAPSHOT_CACHE = SnapshotCache(ttl=float(os.environ.get(ENVIRON_SNAPSHOT_TTL, 0)))
+
+
+class PollScheduler:
+    """Choose the time until the next poll from the expected remaining runtime.
+
+    With an estimate, the interval is a fraction of the remaining time, so
+    polls are sparse for long jobs and tighten again near completion.
+    Without an estimate, the interval grows geometrically, but at most to a
+    fraction of the elapsed wait, so a job is noticed late by at most that
+    fraction of its runtime. The interval is always kept within
+    [min_interval, max_interval].
+    """
+
+    def __init__(
+        self,
+        min_interval: float = 5,
+        max_interval: float = 600,
+        fraction: float = 0.1,
+        growth: float = 1.5,
+    ) -> None:
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.fraction = fraction
+        self.growth = growth
+        self.interval: Optional[float] = None
+
+    def next_interval(
+        self, remaining: Optional[float] = None, elapsed: Optional[float] = None
+    ) -> float:
+
+        if remaining is not None:
+            interval = self.fraction * remaining
+        elif self.interval is None:
+            interval = self.min_interval
+        else:
+            interval = self.interval * self.growth
+            if elapsed is not None:
+                interval = min(interval, self.fraction * elapsed)
+
+        interval = min(max(interval, self.min_interval), self.max_interval)
+        self.interval = interval
+
+        return interval
+
 
 class TaskarrayProgress:
     def __init__(
@@ -67,14 +313,17 @@ class TaskarrayProgress:
         job_id: str,
         job_info: Optional[Dict[str, str]] = None,
         position: int = 0,
+        display: bool = True,
     ) -> None:
         self.position = position
+        self.display = display
         self.job_id = str(job_id)
 
         # Get info
 
         if job_info is None:
-            job_info, _ = get_qstatj(job_id)
+            job_infos, _ = get_qstatj_bulk([self.job_id])
+            job_info = job_infos[self.job_id]
 
         if COLUMN_TASKARRAY not in job_info:
             raise ValueError("Not array task")
@@ -86,7 +335,7 @@ class TaskarrayProgress:
 
     def init_bar(self, job_info: dict, job_status: dict) -> None:
         job_id = job_info[COLUMN_JOB_ID]
-        # job_name = job_info["job_name"]
+        self.name = job_info.get("job_name", "")
         start_time = job_info[COLUMN_SUBMISSION_TIME]
         array_info = job_info[COLUMN_TASKARRAY]
 
@@ -97,8 +346,7 @@ class TaskarrayProgress:
         start_time__ = time.mktime(start_time_.timetuple())
 
         # Count total tasks
-        n_total_ = array_info.split(":")[0].split("-")[-1]
-        self.n_total = int(n_total_)
+        self.n_total = len(TaskSet.from_string(array_info))
 
         # Set title
         self.title = job_id
@@ -107,44 +355,102 @@ class TaskarrayProgress:
             total=self.n_total,
             desc=f"{self.title}",
             position=self.position,
+            disable=not self.display,
             **TQDM_OPTIONS,
         )
 
         # Reset time
+        self.submitted = start_time__
         self.pbar.last_print_t = self.pbar.start_t = start_time__
 
+        # Observed (time, finished tasks), seeded with the submission
+        self.n_finished = 0
+        self.n_running = 0
+        self.n_pending = 0
+        self.n_error = 0
+        self.samples: Deque[Tuple[float, int]] = deque(maxlen=PROGRESS_SAMPLES)
+        self.samples.append((start_time__, 0))
+
         # Set finished and running
         self.update(job_status)
 
-    def update(self, status: dict) -> None:
+    def update(self, status: dict, refresh: bool = True) -> None:
+        """Set the task counts, and redraw the bar unless refresh is False"""
 
         n_running = status.get("running", 0)
         n_pending = status.get("pending", 0)
         n_error = status.get("error", 0)
         n_finished = self.n_total - n_pending - n_running
 
+        self.n_finished = n_finished
+        self.n_running = n_running
+        self.n_pending = n_pending
+        self.n_error = n_error
+        self.samples.append((time.time(), n_finished))
+
         postfix = dict()
 
         if n_error > 0:
             postfix["err"] = n_error
 
-        self.pbar.set_postfix(postfix)
+        self.pbar.set_postfix(postfix, refresh=False)
 
         self.pbar.set_description(f"{self.title} ({n_running})", refresh=False)
         self.pbar.n = n_finished
-        self.pbar.refresh()
+
+        if refresh:
+            self.pbar.refresh()
+
+    def tasks_per_second(self) -> Optional[float]:
+        """Task completion rate over the observed samples"""
+        return _get_tasks_per_second(self.samples)
+
+    def estimate_remaining(self) -> Optional[float]:
+        """Expected seconds until all tasks are finished, from the completion rate"""
+
+        rate = self.tasks_per_second()
+
+        if rate is None:
+            return None
+
+        return (self.n_total - self.n_finished) / rate
+
+    def get_metrics(self) -> metrics.Metrics:
+        """Task counts, completion rate and ETA of the latest update"""
+
+        rate = self.tasks_per_second()
+        remaining = self.estimate_remaining()
+
+        return {
+            "time": round(time.time(), 3),
+            "job": self.job_id,
+            "name": self.name,
+            "total": self.n_total,
+            "running": self.n_running,
+            "pending": self.n_pending,
+            "error": self.n_error,
+            "finished": self.n_finished,
+            "tasks_per_second": round(rate, 6) if rate is not None else None,
+            "eta_seconds": round(remaining, 1) if remaining is not None else None,
+        }
 
     def finish(self) -> None:
         n_total = self.n_total
+        self.n_finished = n_total
+        self.n_running = 0
+        self.n_pending = 0
         self.pbar.set_postfix({})
         self.pbar.set_description(f"{self.title} (0)", refresh=False)
         self.pbar.n = n_total
         self.pbar.refresh()
 
-    def log_errors(self) -> None:
+    def log_errors(self, job_info: Optional[Dict[str, str]] = None) -> None:
+
+        if job_info is None:
+            job_infos, _ = get_qstatj_bulk([self.job_id])
+            job_info = job_infos[self.job_id]
 
-        qstatj, _ = get_qstatj(self.job_id)
-        errors = _get_errors_from_qstatj(qstatj)
+        errors = _get_errors_from_qstatj(job_info)
 
         for error in errors:
             logger.error(f"uge {self.job_id}: {error.strip()}")
@@ -156,6 +462,388 @@ class TaskarrayProgress:
         self.pbar.close()
 
 
+class ProgressRenderer:
+    """Draw the progress of many task-arrays from one qstat snapshot per cycle.
+
+    The arrays are updated without redrawing, and the terminal is redrawn at
+    most every min_refresh_interval seconds. In summary mode, a single bar
+    over the tasks of all arrays is drawn instead of a bar per array, so the
+    terminal output stays one line with hundreds of jobs.
+
+    Without display nothing is drawn, for headless runs. With a metrics
+    writer, the metrics of all arrays are written on every update.
+    """
+
+    def __init__(
+        self,
+        progresses: List[TaskarrayProgress],
+        summary: bool = False,
+        min_refresh_interval: float = 1.0,
+        display: bool = True,
+        metrics_writer: Optional[
+            Union[metrics.JsonLinesWriter, metrics.PrometheusTextfileWriter]
+        ] = None,
+    ) -> None:
+        self.progresses = progresses
+        self.summary = summary
+        self.min_refresh_interval = min_refresh_interval
+        self.display = display
+        self.metrics_writer = metrics_writer
+        self._last_refresh: Optional[float] = None
+        self.pbar: Optional[tqdm] = None
+
+        if summary and display:
+            self.pbar = tqdm(
+                total=sum(bar.n_total for bar in progresses),
+                desc=f"{len(progresses)} arrays",
+                **TQDM_OPTIONS,
+            )
+            self.pbar.last_print_t = self.pbar.start_t = min(
+                bar.samples[0][0] for bar in progresses
+            )
+
+        self.refresh(force=True)
+
+    def update(self, qstat: DataFrame) -> List[TaskarrayProgress]:
+        """Update the unfinished arrays from qstat, and return those missing in it"""
+
+        statuses = qstat.set_index("job").to_dict("index") if len(qstat) else dict()
+        vanished = []
+
+        for bar in self.progresses:
+
+            if bar.is_finished():
+                continue
+
+            job_status = statuses.get(bar.job_id)
+            if job_status is None:
+                vanished.append(bar)
+                continue
+
+            bar.update(job_status, refresh=False)
+
+        self.refresh()
+        self.write_metrics()
+
+        return vanished
+
+    def write_metrics(self) -> None:
+
+        if self.metrics_writer is None:
+            return
+
+        try:
+            self.metrics_writer.write([bar.get_metrics() for bar in self.progresses])
+        except OSError as exc:
+            logger.warning(f"Unable to write progress metrics: {exc}")
+
+    def refresh(self, force: bool = False) -> None:
+
+        if not self.display:
+            return
+
+        now = time.monotonic()
+        if (
+            not force
+            and self._last_refresh is not None
+            and now - self._last_refresh < self.min_refresh_interval
+        ):
+            return
+
+        self._last_refresh = now
+
+        if self.pbar is None:
+            for bar in self.progresses:
+                bar.pbar.refresh()
+            return
+
+        n_done = sum(bar.is_finished() for bar in self.progresses)
+        postfix = {
+            "done": f"{n_done}/{len(self.progresses)}",
+            "run": sum(bar.n_running for bar in self.progresses),
+            "wait": sum(bar.n_pending for bar in self.progresses),
+        }
+        n_error = sum(bar.n_error for bar in self.progresses)
+        if n_error > 0:
+            postfix["err"] = n_error
+
+        self.pbar.set_postfix(postfix, refresh=False)
+        self.pbar.n = sum(bar.n_finished for bar in self.progresses)
+        self.pbar.refresh()
+
+    def is_finished(self) -> bool:
+        return all(bar.is_finished() for bar in self.progresses)
+
+    def close(self) -> None:
+        self.refresh(force=True)
+        self.write_metrics()
+
+        for bar in self.progresses:
+            bar.close()
+
+        if self.pbar is not None:
+            self.pbar.close()
+
+
+class TaskMarkerTracker:
+    """Track finished tasks of an array from the {job}.{task}.{exit code}.done markers.
+
+    Written by tasks submitted with generate_taskarray_script(marker_dir=...).
+    Finished tasks are kept as a bitset, updated from one os.scandir per poll,
+    so following an array needs no scheduler calls. The exit code is read from
+    the filename, so no marker is opened.
+    """
+
+    def __init__(
+        self,
+        job_id: Union[str, int],
+        marker_dir: Path,
+        task_stop: int,
+        task_start: int = 1,
+        task_step: int = 1,
+        submitted: Optional[float] = None,
+    ) -> None:
+        self.job_id = str(job_id)
+        self.marker_dir = Path(marker_dir)
+        self.task_start = task_start
+        self.task_step = task_step
+        self.n_total = len(range(task_start, task_stop + 1, task_step))
+
+        # Unix time of the submission, or of creating the tracker
+        self.submitted = time.time() if submitted is None else submitted
+
+        # Observed (time, finished tasks), seeded with the submission
+        self.samples: Deque[Tuple[float, int]] = deque(maxlen=PROGRESS_SAMPLES)
+        self.samples.append((self.submitted, 0))
+
+        self.n_finished = 0
+        self.failed: Dict[int, int] = dict()
+        self.vanished: List[int] = []  # Tasks that ended without a marker
+        self._finished = 0  # Bitset of task indices
+        self._prefix = f"{self.job_id}."
+        self._suffix = submitting.TASK_MARKER_SUFFIX
+
+    def _get_index(self, task_id: int) -> Optional[int]:
+
+        offset = task_id - self.task_start
+        if offset < 0 or offset % self.task_step:
+            return None
+
+        index = offset // self.task_step
+        if index >= self.n_total:
+            return None
+
+        return index
+
+    def is_task_finished(self, task_id: int) -> bool:
+        index = self._get_index(task_id)
+        return index is not None and bool(self._finished >> index & 1)
+
+    def update(self) -> int:
+        """Scan the marker directory once, and return number of newly finished tasks"""
+        return len(self.update_task_ids())
+
+    def update_task_ids(self) -> List[int]:
+        """Scan the marker directory once, and return the newly finished task IDs"""
+
+        new_task_ids: List[int] = []
+
+        try:
+            entries = os.scandir(self.marker_dir)
+        except FileNotFoundError:
+            return new_task_ids
+
+        with entries:
+            for entry in entries:
+
+                name = entry.name
+                if not name.startswith(self._prefix) or not name.endswith(self._suffix):
+                    continue
+
+                fields = name[len(self._prefix) : -len(self._suffix)]
+                task_id_, _, exit_code_ = fields.partition(".")
+                if not task_id_.isdigit() or not exit_code_.isdigit():
+                    continue
+
+                task_id = int(task_id_)
+                index = self._get_index(task_id)
+                if index is None or self._finished >> index & 1:
+                    continue
+
+                self._finished |= 1 << index
+                new_task_ids.append(task_id)
+
+                exit_code = int(exit_code_)
+                if exit_code != 0:
+                    self.failed[task_id] = exit_code
+
+        self.n_finished += len(new_task_ids)
+        self.samples.append((time.time(), self.n_finished))
+        return new_task_ids
+
+    def fail_unfinished(self) -> List[int]:
+        """Count the unfinished tasks as failed, e.g. when killed before writing their marker"""
+
+        task_ids = self.get_unfinished_task_ids()
+
+        self.vanished.extend(task_ids)
+        self.n_finished += len(task_ids)
+        self._finished = (1 << self.n_total) - 1
+
+        return task_ids
+
+    def get_n_failed(self) -> int:
+        return len(self.failed) + len(self.vanished)
+
+    def get_unfinished_task_ids(self) -> List[int]:
+        return [
+            self.task_start + index * self.task_step
+            for index in range(self.n_total)
+            if not self._finished >> index & 1
+        ]
+
+    def get_unfinished_tasks(self) -> TaskSet:
+        """Unfinished task IDs as ranges, without a Python loop over the tasks"""
+
+        n_bytes = (self.n_total + 7) // 8
+        buffer = np.frombuffer(self._finished.to_bytes(n_bytes, "little"), dtype=np.uint8)
+        bits = np.unpackbits(buffer, bitorder="little")[: self.n_total]
+        indices = np.flatnonzero(bits == 0)
+
+        return TaskSet.from_ids(self.task_start + indices * self.task_step)
+
+    def tasks_per_second(self) -> Optional[float]:
+        """Task completion rate over the observed samples"""
+        return _get_tasks_per_second(self.samples)
+
+    def estimate_remaining(self) -> Optional[float]:
+        """Expected seconds until all tasks are finished, from the completion rate"""
+
+        rate = self.tasks_per_second()
+
+        if rate is None:
+            return None
+
+        return (self.n_total - self.n_finished) / rate
+
+    def is_finished(self) -> bool:
+        return self.n_finished >= self.n_total
+
+
+def _get_tasks_per_second(samples: Deque[Tuple[float, int]]) -> Optional[float]:
+
+    (time_first, n_first), (time_last, n_last) = samples[0], samples[-1]
+
+    if n_last <= n_first or time_last <= time_first:
+        return None
+
+    return (n_last - n_first) / (time_last - time_first)
+
+
+def follow_task_markers(
+    trackers: List[TaskMarkerTracker],
+    update_interval: float = 5,
+    exit_after: Optional[int] = None,
+    poll_scheduler: Optional[PollScheduler] = None,
+    check_interval: float = 60,
+    username: Optional[str] = None,
+) -> None:
+    """Follow task-arrays from their marker files.
+
+    Tasks killed by the scheduler never write their marker, so qstat is
+    checked every check_interval seconds. The unfinished tasks of arrays
+    that left qstat are counted as failed.
+    """
+
+    if username is None:
+        username = getpass.getuser()
+
+    pbars = [
+        tqdm(total=tracker.n_total, desc=tracker.job_id, position=position, **TQDM_OPTIONS)
+        for position, tracker in enumerate(trackers)
+    ]
+
+    iterations = 0
+    vanished_counter: Dict[str, int] = defaultdict(int)
+    last_check = time.monotonic()
+
+    try:
+        while True:
+
+            for tracker in trackers:
+                tracker.update()
+
+            if time.monotonic() - last_check >= check_interval:
+                last_check = time.monotonic()
+                unfinished = [tracker for tracker in trackers if not tracker.is_finished()]
+                _check_vanished_markers(unfinished, vanished_counter, username)
+
+            for tracker, pbar in zip(trackers, pbars):
+                n_failed = tracker.get_n_failed()
+                if n_failed:
+                    pbar.set_postfix({"err": n_failed}, refresh=False)
+                pbar.n = tracker.n_finished
+                pbar.refresh()
+
+            if all(tracker.is_finished() for tracker in trackers):
+                break
+
+            iterations += 1
+            if exit_after is not None and iterations >= exit_after:
+                break
+
+            if poll_scheduler is not None:
+                time.sleep(_get_poll_interval(trackers, poll_scheduler))
+            else:
+                time.sleep(update_interval)
+
+    finally:
+        for pbar in pbars:
+            pbar.close()
+
+    for tracker in trackers:
+        for task_id, exit_code in sorted(tracker.failed.items()):
+            logger.error(f"uge {tracker.job_id}.{task_id}: exited with {exit_code}")
+        if len(tracker.vanished):
+            task_ids = TaskSet.from_ids(tracker.vanished)
+            logger.error(f"uge {tracker.job_id}.{task_ids}: left qstat without a marker")
+
+
+def _check_vanished_markers(
+    trackers: List[TaskMarkerTracker], vanished_counter: Dict[str, int], username: str
+) -> None:
+    """Fail the unfinished tasks of arrays that left qstat, from one qstat"""
+
+    if len(trackers) == 0:
+        return
+
+    try:
+        qstat, _ = get_qstat(username, max_retries=0)
+    except (
+        subprocess.CalledProcessError,
+        subprocess.TimeoutExpired,
+        throttle.SchedulerBusyError,
+    ) as exc:
+        logger.warning(f"Unable to check arrays in qstat: {exc}")
+        return
+
+    job_ids = set(qstat[COLUMN_JOB]) if len(qstat) else set()
+
+    for tracker in trackers:
+
+        if tracker.job_id in job_ids:
+            vanished_counter[tracker.job_id] = 0
+            continue
+
+        # Give the markers of the last tasks time to show up on the shared filesystem
+        vanished_counter[tracker.job_id] += 1
+        if vanished_counter[tracker.job_id] < MARKER_VANISHED_CHECKS:
+            continue
+
+        tracker.update()
+        tracker.fail_unfinished()
+
+
 def _get_qstatj_key(line: str) -> Tuple[Optional[str], str]:
     """Split column key and column value from qstat -j output"""
 
@@ -211,6 +899,31 @@ def parse_qstatj(stdout: str) -> dict:
     return out
 
 
+def parse_qstatj_bulk(stdout: str) -> Dict[str, Dict[str, str]]:
+    """Parse the stdout of qstat -j for several jobs into a dict per job number.
+
+    Each job is preceded by a line of "=" in the output.
+    """
+
+    out = dict()
+    blocks = re.split(r"^=+$", stdout, flags=re.MULTILINE)
+
+    for block in blocks:
+
+        if not block.strip():
+            continue
+
+        info = parse_qstatj(block.rstrip())
+        job_id = info.get(COLUMN_JOB_ID)
+
+        if job_id is None:
+            continue
+
+        out[job_id.strip()] = info
+
+    return out
+
+
 def parse_qstat(stdout: str) -> pd.DataFrame:
     stdout = stdout.strip()
     lines = stdout.split("\n")
@@ -250,126 +963,309 @@ def parse_qstat(stdout: str) -> pd.DataFrame:
     return pdf
 
 
-def parse_taskarray(pdf: DataFrame) -> pd.DataFrame:
-    col_id = "job-ID"
-    col_state = "state"
-    col_array = "ja-task-ID"
+class QstatJob(NamedTuple):
+    """Typed job record from qstat -xml.
 
-    # for unique job-ids
-    job_ids = pdf[col_id].unique()
+    The job ID is kept as a string, as it is used throughout this module.
+    """
 
-    def _parse(line):
-        count = 0
+    job_id: str
+    prior: float
+    name: str
+    user: str
+    state: str
+    submit_start: Optional[datetime.datetime]
+    queue: str
+    jclass: str
+    slots: int
+    tasks: str
+
+
+# qstat -xml tag -> QstatJob field
+QSTAT_XML_TAGS = {
+    "JB_job_number": "job_id",
+    "JAT_prio": "prior",
+    "JB_name": "name",
+    "JB_owner": "user",
+    "state": "state",
+    "JAT_start_time": "submit_start",
+    "JB_submission_time": "submit_start",
+    "queue_name": "queue",
+    "jclass_name": "jclass",
+    "slots": "slots",
+    "tasks": "tasks",
+}
 
-        lines = line.split(",")
-        for task in lines:
-            if "-" not in task:
-                count += 1
-                continue
+# QstatJob field -> parse_qstat column
+QSTAT_COLUMNS = {
+    "job_id": "job-ID",
+    "prior": "prior",
+    "name": "name",
+    "user": "user",
+    "state": "state",
+    "submit_start": "submit/start",
+    "queue": "queue",
+    "jclass": "jclass",
+    "slots": "slots",
+    "tasks": "ja-task-ID",
+}
 
-            start, stop, _ = re.split(",|:|-|!", task)
-            count += int(stop) - int(start)
 
-        return count
+def _parse_qstat_job_list(element: ElementTree.Element) -> QstatJob:
+    """Convert a <job_list> element into a typed record"""
+
+    values = {}
+    for child in element:
+        field = QSTAT_XML_TAGS.get(child.tag)
+        if field is not None:
+            values[field] = (child.text or "").strip()
+
+    submit_start = values.get("submit_start")
+
+    return QstatJob(
+        job_id=values.get("job_id", ""),
+        prior=float(values.get("prior") or 0.0),
+        name=values.get("name", ""),
+        user=values.get("user", ""),
+        state=values.get("state", ""),
+        submit_start=datetime.datetime.fromisoformat(submit_start) if submit_start else None,
+        queue=values.get("queue", ""),
+        jclass=values.get("jclass", ""),
+        slots=int(values.get("slots") or 0),
+        tasks=values.get("tasks", ""),
+    )
 
-    rows = []
 
-    for job_id in job_ids:
-        jobs = pdf[pdf[col_id] == job_id]
+def iter_qstat_xml(
+    source: Union[str, Iterable[str]], chunk_size: int = 2**16
+) -> Iterator[QstatJob]:
+    """Stream typed job records from the output of qstat -xml.
 
-        pending_jobs = jobs[jobs[col_state].isin(pending_tags)]
-        running_jobs = jobs[jobs[col_state].isin(running_tags)]
-        error_jobs = jobs[jobs[col_state].isin(error_tags)]
-        # deleted_jobs = jobs[jobs[col_state].isin(deleted_tags)]
+    Parsing is incremental, and every <job_list> element is dropped from the
+    tree once it is converted, so memory use does not grow with the number of
+    jobs. Unlike parse_qstat, this does not depend on column widths.
 
-        pending_count = pending_jobs[col_array].apply(_parse)
-        error_count = error_jobs[col_array].apply(_parse)
+    :param source: Full stdout as a string, or an iterable of chunks (e.g. lines)
+    :param chunk_size: Size of the chunks a string source is fed in
+    :returns: Generator of QstatJob
+    """
 
-        n_running = len(running_jobs)
-        n_pending = pending_count.values.sum()
-        n_error = error_count.values.sum()
+    if isinstance(source, str):
+        stdout = source
+        source = (stdout[i : i + chunk_size] for i in range(0, len(stdout), chunk_size))
 
-        row = {
-            "job": job_id,
-            "running": n_running,
-            "pending": n_pending,
-            "error": n_error,
-        }
+    parser = ElementTree.XMLPullParser(events=("start", "end"))  # type: ignore
+    parents: List[ElementTree.Element] = []
 
-        rows.append(row)
+    for chunk in source:
+        parser.feed(chunk)
 
-    return pd.DataFrame(rows)
+        events: Iterator[Tuple[str, ElementTree.Element]] = parser.read_events()  # type: ignore
+        for event, element in events:
 
+            if event == "start":
+                parents.append(element)
+                continue
 
-def parse_qacctj(stdout: str) -> List[Dict[str, str]]:
-    output: List[Dict[str, str]] = [dict()]
+            parents.pop()
 
-    _stdout = stdout.split("\n")
+            if element.tag != "job_list":
+                continue
 
-    for line in _stdout:
-        if "===========" in line:
-            if len(output[-1]) > 1:
-                output += [dict()]
-            continue
+            yield _parse_qstat_job_list(element)
 
-        # Format: pe_taskid     NONE
-        key = line[0:13].strip()
-        value = line[13:].strip()
+            if parents:
+                parents[-1].remove(element)
 
-        if len(key) == 0:
-            continue
+    parser.close()
 
-        output[-1][key] = value
 
-    return output
+def parse_qstat_xml(stdout: str) -> pd.DataFrame:
+    """Parse the stdout of qstat -xml into a DataFrame with the same columns as parse_qstat"""
 
+    pdf = pd.DataFrame.from_records(iter_qstat_xml(stdout), columns=QstatJob._fields)
+    pdf = pdf.rename(columns=QSTAT_COLUMNS)
+    pdf["submit/start"] = pd.to_datetime(pdf["submit/start"])
+    pdf["slots"] = pdf["slots"].astype(int)
 
-def _get_errors_from_qstatj(qstatj: Dict[str, str]) -> List[str]:
-    key1 = "error reason   "
-    error_keys = [key for key in qstatj.keys() if key1 in key]
-    errors = [qstatj[key] for key in error_keys]
-    return errors
+    return pdf
 
 
-def follow_progress(
-    username: Optional[str] = None,
-    job_ids: Optional[List[Union[int, str]]] = None,
-    update_interval: int = 5,
-    exit_after: Optional[int] = None,
-    max_retries: int = 3,
-) -> None:
-    """Follow UGE jobs for $USER. All jobs or subset of job IDs.
+def _count_tasks(tasks: pd.Series) -> pd.Series:
+    """Count the tasks of ja-task-ID strings, e.g. "3", "2-10:1" or "7,9-20:2".
 
-    Current implementation only supports task-arrays.
+    A range first-last:step counts as in TaskSet, with last inclusive. A job
+    that is not an array has no ja-task-ID, and counts as one task.
     """
 
-    if username is None:
-        username = os.environ.get("USER", None)
+    is_job = tasks.isna() | tasks.astype(str).str.strip().eq("")
 
-    if username is None:
-        raise ValueError("Unable to get USER env var")
+    parts = tasks.astype(str).str.split(",").explode()
+    ranges = parts.str.extract(r"^\s*(\d+)(?:-(\d+)(?::(\d+))?)?\s*$", expand=True)
 
-    qstat, qstatu_log_str = get_qstat(
-        username, max_retries=max_retries, update_interval=update_interval
+    start = pd.to_numeric(ranges[0])
+    stop = pd.to_numeric(ranges[1]).fillna(start)
+    step = pd.to_numeric(ranges[2]).fillna(1)
+    counts = ((stop - start) // step + 1).clip(lower=0).fillna(0).astype(int)
+
+    return counts.groupby(level=0).sum().mask(is_job, 1)
+
+
+def parse_taskarray(pdf: DataFrame) -> pd.DataFrame:
+    """Count running, pending and error tasks per job-ID.
+
+    States are classified and task ranges are counted once for the whole
+    frame, followed by a single groupby.
+    """
+
+    col_id = "job-ID"
+    col_state = "state"
+    col_array = "ja-task-ID"
+    columns = ["running", "pending", "error"]
+
+    # for unique job-ids, in order of appearance
+    job_ids = pdf[col_id].unique()
+
+    states = pdf[col_state]
+    is_pending = states.isin(pending_tags).values
+    is_running = states.isin(running_tags).values
+    is_error = states.isin(error_tags).values
+
+    category = np.select([is_running, is_pending, is_error], columns, default="")
+
+    # Running tasks are listed one per row, pending and error tasks as ranges
+    counts = pd.Series(is_running.astype(int), index=pdf.index)
+    is_range = is_pending | is_error
+    if is_range.any():
+        counts[is_range] = _count_tasks(pdf.loc[is_range, col_array])
+
+    table = (
+        pd.DataFrame({"job": pdf[col_id].values, "category": category, "count": counts.values})
+        .groupby(["job", "category"], sort=False)["count"]
+        .sum()
+        .unstack(fill_value=0)
+        .reindex(index=job_ids, columns=columns, fill_value=0)
+        .astype(int)
     )
+    table.index.name = "job"
+    table.columns.name = None
 
-    # TODO Add check that job_id is even valid
-    if job_ids is None:
-        job_ids = qstat["job"].unique()
+    return table.reset_index()
 
-    progresses = []
 
-    for i, job_id in enumerate(job_ids):
+def parse_taskarray_ids(pdf: DataFrame) -> pd.DataFrame:
+    """Running, pending and error task IDs per job-ID, as TaskSet.
+
+    Same rows as parse_taskarray, but with the exact tasks instead of counts,
+    e.g. to resubmit the errored tasks of an array. Jobs that are not arrays
+    have empty sets.
+    """
+
+    col_id = "job-ID"
+    col_state = "state"
+    col_array = "ja-task-ID"
+    columns = ["running", "pending", "error"]
+
+    job_ids = pdf[col_id].unique()
+    tasks: Dict[Tuple[str, str], List[str]] = defaultdict(list)
+
+    for job_id, state, task_ids in zip(pdf[col_id], pdf[col_state], pdf[col_array]):
+        if state in running_tags:
+            category = "running"
+        elif state in pending_tags:
+            category = "pending"
+        elif state in error_tags:
+            category = "error"
+        else:
+            continue
+        if isinstance(task_ids, str) and task_ids:
+            tasks[job_id, category].append(task_ids)
+
+    rows = [
+        [job_id] + [TaskSet.from_string(",".join(tasks[job_id, column])) for column in columns]
+        for job_id in job_ids
+    ]
+
+    return pd.DataFrame(rows, columns=["job"] + columns)
+
+
+def parse_qacctj(stdout: str) -> List[Dict[str, str]]:
+    output: List[Dict[str, str]] = [dict()]
+
+    _stdout = stdout.split("\n")
+
+    for line in _stdout:
+        if "===========" in line:
+            if len(output[-1]) > 1:
+                output += [dict()]
+            continue
+
+        # Format: pe_taskid     NONE
+        key = line[0:13].strip()
+        value = line[13:].strip()
+
+        if len(key) == 0:
+            continue
+
+        output[-1][key] = value
+
+    return output
+
+
+def parse_qacctj_typed(stdout: str) -> pd.DataFrame:
+    """Parse qacct -j output into a typed frame, one row per task.
+
+    See accounting.type_qacct for the column types.
+    """
+
+    pdf = accounting.split_qacct_text(stdout)
 
-        # Make sure that job_id is in qstat
+    return accounting.type_qacct(pdf)
+
+
+def _get_errors_from_qstatj(qstatj: Dict[str, str]) -> List[str]:
+    key1 = "error reason   "
+    error_keys = [key for key in qstatj.keys() if key1 in key]
+    errors = [qstatj[key] for key in error_keys]
+    return errors
+
+
+def _get_followable_job_ids(
+    qstat: DataFrame,
+    qstatu_log_str: str,
+    job_ids: Optional[List[Union[int, str]]] = None,
+) -> List[Union[int, str]]:
+    """All jobs in qstat, or the subset of job_ids that are in qstat"""
+
+    # TODO Add check that job_id is even valid
+    if job_ids is None:
+        return list(qstat["job"].unique())
+
+    # Make sure that job_id is in qstat
+    for job_id in job_ids:
         if str(job_id) not in qstat["job"].values:
             logger.warning(f"Job ID {job_id} not found in qstat. Skipping...")
             logger.warning(qstatu_log_str)
-            continue
+
+    return [job_id for job_id in job_ids if str(job_id) in qstat["job"].values]
+
+
+def _init_progresses(
+    qstat: DataFrame,
+    job_ids: List[Union[int, str]],
+    qstatjs: Dict[str, Dict[str, str]],
+    qstatj_log_str: str,
+    display: bool = True,
+) -> List[TaskarrayProgress]:
+    """Create a progress bar for every task-array job, and log jobs that crashed"""
+
+    progresses = []
+
+    for i, job_id in enumerate(job_ids):
 
         job = qstat.loc[qstat["job"] == str(job_id)]  # will return one result
         job = job.iloc[0]
-        qstatj, qstatj_log_str = get_qstatj(job_id)
+        qstatj = qstatjs[str(job_id)]
 
         if job.running + job.pending == 0 and job.error > 0:
             # crashed job
@@ -385,13 +1281,74 @@ def follow_progress(
             logger.info(qstatj_log_str)
             continue
 
-        progress = TaskarrayProgress(qstat, str(job_id), job_info=qstatj, position=i)
+        progress = TaskarrayProgress(
+            qstat, str(job_id), job_info=qstatj, position=i, display=display
+        )
         progresses.append(progress)
 
+    return progresses
+
+
+def follow_progress(
+    username: Optional[str] = None,
+    job_ids: Optional[List[Union[int, str]]] = None,
+    update_interval: int = 5,
+    exit_after: Optional[int] = None,
+    max_retries: int = 3,
+    poll_scheduler: Optional[PollScheduler] = None,
+    summary: Optional[bool] = None,
+    min_refresh_interval: float = 1.0,
+    headless: bool = False,
+    metrics_path: Optional[Union[str, Path]] = None,
+) -> None:
+    """Follow UGE jobs for $USER. All jobs or subset of job IDs.
+
+    Current implementation only supports task-arrays.
+
+    All arrays are updated from one qstat per cycle, followed by one sleep of
+    update_interval. With a poll_scheduler, the interval is adapted to the
+    shortest expected remaining runtime of the arrays.
+
+    With summary, a single bar is drawn for all arrays instead of one bar per
+    array, by default when following more than MAX_PROGRESS_BARS arrays.
+
+    With headless, no bars are drawn. The per-array metrics are written to
+    metrics_path on every snapshot, as a node-exporter textfile for the .prom
+    suffix, otherwise as JSON lines.
+    """
+
+    if username is None:
+        username = os.environ.get("USER", None)
+
+    if username is None:
+        raise ValueError("Unable to get USER env var")
+
+    qstat, qstatu_log_str = get_qstat(
+        username, max_retries=max_retries, update_interval=update_interval
+    )
+
+    job_ids = _get_followable_job_ids(qstat, qstatu_log_str, job_ids)
+    qstatjs, qstatj_log_str = get_qstatj_bulk(job_ids)
+
+    if summary is None:
+        summary = len(job_ids) > MAX_PROGRESS_BARS
+
+    progresses = _init_progresses(
+        qstat, job_ids, qstatjs, qstatj_log_str, display=not (summary or headless)
+    )
+
     if len(progresses) == 0:
         logger.warning("No task-array jobs for to monitor.")
         return
 
+    renderer = ProgressRenderer(
+        progresses,
+        summary=summary,
+        min_refresh_interval=min_refresh_interval,
+        display=not headless,
+        metrics_writer=metrics.get_writer(metrics_path),
+    )
+
     # TODO Get status if jobs are finished or deleted
     # Then remove progressbars and return
 
@@ -399,8 +1356,9 @@ def follow_progress(
 
     iterations = 0
     consecutive_qacct_counter: dict = defaultdict(int)
+    cross_check = QacctCrossCheck(owner=username)
 
-    while not all([bar.is_finished() for bar in progresses]):
+    while not renderer.is_finished():
 
         iterations += 1
         if exit_after is not None and iterations > exit_after:
@@ -413,58 +1371,346 @@ def follow_progress(
             logger.warning(f"Output was {exc.stdout}")
             logger.warning(f"STDERR was {exc.stderr}")
             logger.warning("Retrying...")
+            time.sleep(update_interval)
             continue
         except subprocess.TimeoutExpired as exc:
             logger.warning(f"Timeout getting qstat: {exc}")
+            time.sleep(update_interval)
+            continue
+        except throttle.SchedulerBusyError as exc:
+            logger.warning(f"Skipping qstat: {exc}")
+            time.sleep(update_interval)
             continue
 
-        # While jobs are not done
+        vanished_bars = renderer.update(qstat)
+
         for array_bar in progresses:
+            if array_bar not in vanished_bars:
+                consecutive_qacct_counter[array_bar.job_id] = 0
+
+        if len(vanished_bars) > 0:
+            logger.debug(f"Jobs {[bar.job_id for bar in vanished_bars]} not found in qstat")
+            _cross_check_vanished(
+                vanished_bars, consecutive_qacct_counter, qstatu_log_str, cross_check
+            )
+
+        if poll_scheduler is not None:
+            time.sleep(_get_poll_interval(progresses, poll_scheduler))
+        else:
+            time.sleep(update_interval)
+
+    try:
+        qstatjs, _ = get_qstatj_bulk([bar.job_id for bar in progresses])
+    except throttle.SchedulerBusyError as exc:
+        logger.warning(f"Skipping the errors of the jobs: {exc}")
+        qstatjs = dict()
+
+    for bar in progresses:
+        if bar.job_id in qstatjs:
+            bar.log_errors(qstatjs[bar.job_id])
+
+    renderer.close()
+
+    return
+
+
+def _get_poll_interval(
+    progresses: Sequence[Union[TaskarrayProgress, TaskMarkerTracker]],
+    poll_scheduler: PollScheduler,
+) -> float:
+    """Poll interval from the shortest expected remaining runtime of the arrays.
+
+    Without an estimate, the interval is capped by the time since the earliest
+    submission, so short arrays are not polled at the longest interval.
+    """
+
+    unfinished = [bar for bar in progresses if not bar.is_finished()]
+
+    estimates = [bar.estimate_remaining() for bar in unfinished]
+    remaining = min([x for x in estimates if x is not None], default=None)
+
+    submitted = min([bar.submitted for bar in unfinished], default=None)
+    elapsed = None if submitted is None else max(time.time() - submitted, 0.0)
+
+    return poll_scheduler.next_interval(remaining, elapsed=elapsed)
+
+
+async def follow_progress_async(
+    username: Optional[str] = None,
+    job_ids: Optional[List[Union[int, str]]] = None,
+    update_interval: float = 5,
+    exit_after: Optional[int] = None,
+    max_retries: int = 3,
+    poll_scheduler: Optional[PollScheduler] = None,
+    summary: Optional[bool] = None,
+    min_refresh_interval: float = 1.0,
+    headless: bool = False,
+    metrics_path: Optional[Union[str, Path]] = None,
+) -> None:
+    """Asyncio version of follow_progress.
+
+    All arrays are updated from one qstat per cycle, followed by one sleep of
+    update_interval, or of the poll_scheduler interval.
+    """
+
+    if username is None:
+        username = os.environ.get("USER", None)
+
+    if username is None:
+        raise ValueError("Unable to get USER env var")
+
+    qstat, qstatu_log_str = await get_qstat_async(
+        username, max_retries=max_retries, update_interval=update_interval
+    )
+
+    job_ids = _get_followable_job_ids(qstat, qstatu_log_str, job_ids)
+    qstatjs, qstatj_log_str = await get_qstatj_bulk_async(job_ids)
 
-            if array_bar.is_finished():
+    if summary is None:
+        summary = len(job_ids) > MAX_PROGRESS_BARS
+
+    progresses = _init_progresses(
+        qstat, job_ids, qstatjs, qstatj_log_str, display=not (summary or headless)
+    )
+
+    if len(progresses) == 0:
+        logger.warning("No task-array jobs for to monitor.")
+        return
+
+    renderer = ProgressRenderer(
+        progresses,
+        summary=summary,
+        min_refresh_interval=min_refresh_interval,
+        display=not headless,
+        metrics_writer=metrics.get_writer(metrics_path),
+    )
+
+    iterations = 0
+    consecutive_qacct_counter: dict = defaultdict(int)
+    cross_check = QacctCrossCheck(owner=username)
+
+    try:
+        while not renderer.is_finished():
+
+            iterations += 1
+            if exit_after is not None and iterations > exit_after:
+                break
+
+            interval = update_interval
+            if poll_scheduler is not None:
+                interval = _get_poll_interval(progresses, poll_scheduler)
+
+            await asyncio.sleep(interval)
+
+            try:
+                qstat, qstatu_log_str = await get_qstat_async(username, max_retries=0)
+            except (
+                subprocess.CalledProcessError,
+                subprocess.TimeoutExpired,
+                throttle.SchedulerBusyError,
+            ) as exc:
+                logger.warning(f"Error getting qstat: {exc}")
                 continue
 
-            # Get and update tatus
-            job_info: DataFrame = qstat[qstat["job"] == array_bar.job_id]
-
-            if len(job_info) == 0:
-                logger.debug(f"Job {array_bar.job_id} not found in qstat")
-                logger.debug(qstat)
-                # double check if job is done, using qstat -j
-                if _uge_is_job_done(
-                    array_bar.job_id, cross_check=True, n_total_jobs=array_bar.n_total
-                ):
-                    array_bar.finish()
-                else:
-                    logger.warning(
-                        f"Job {array_bar.job_id} not found in qstat, but cross-check showed it is not finished"
-                    )
-                    logger.warning(qstatu_log_str)
-                    consecutive_qacct_counter[array_bar.job_id] += 1
-                    if consecutive_qacct_counter[array_bar.job_id] >= 5:
-                        logger.warning(
-                            f"Cross check failed for job {array_bar.job_id} 5 times in a row. Assuming it is finished."
-                        )
-                        array_bar.finish()
+            vanished_bars = renderer.update(qstat)
+
+            for array_bar in progresses:
+                if array_bar not in vanished_bars:
+                    consecutive_qacct_counter[array_bar.job_id] = 0
+
+            if len(vanished_bars) > 0:
+                await _cross_check_vanished_async(
+                    vanished_bars, consecutive_qacct_counter, qstatu_log_str, cross_check
+                )
+
+        try:
+            qstatjs, _ = await get_qstatj_bulk_async([bar.job_id for bar in progresses])
+        except throttle.SchedulerBusyError as exc:
+            logger.warning(f"Skipping the errors of the jobs: {exc}")
+            qstatjs = dict()
+
+        for bar in progresses:
+            if bar.job_id in qstatjs:
+                bar.log_errors(qstatjs[bar.job_id])
+
+    finally:
+        renderer.close()
+
+
+class QacctCrossCheck:
+    """Confirm from the accounting that vanished jobs finished all their tasks.
+
+    All jobs checked in a cycle are counted with a single accounting query,
+    and jobs confirmed finished are cached, so they are never queried again.
+    The query is limited to the jobs of owner, the current user by default.
+    """
+
+    def __init__(self, owner: Optional[str] = None) -> None:
+        self.owner = owner
+        self.finished: Dict[str, int] = dict()
+
+    def _get_unconfirmed(self, n_totals: Dict[str, int]) -> List[str]:
+        return [job_id for job_id in n_totals if job_id not in self.finished]
+
+    def _resolve(
+        self, n_totals: Dict[str, int], counts: Dict[str, int], log_str: str
+    ) -> Dict[str, bool]:
+
+        for job_id in self._get_unconfirmed(n_totals):
+            n_finished = counts.get(job_id, 0)
+            if n_finished >= n_totals[job_id]:
+                self.finished[job_id] = n_finished
                 continue
 
-            job_status = dict(job_info.iloc[0])
-            array_bar.update(job_status)
-            consecutive_qacct_counter[array_bar.job_id] = 0
+            logger.warning(f"qacct indicates that job {job_id} is not finished")
+            logger.warning(
+                f"UGE job {job_id} has {n_finished} tasks in qacct. Expected {n_totals[job_id]}"
+            )
+            logger.debug(log_str)
+
+        return {job_id: job_id in self.finished for job_id in n_totals}
 
-            time.sleep(update_interval)
+    def check(self, n_totals: Dict[str, int], since: Optional[float] = None) -> Dict[str, bool]:
+        """Whether each job has n_totals tasks in the accounting.
 
-    for bar in progresses:
-        bar.log_errors()
-        bar.close()
+        since is the earliest submission time of the jobs, to limit the query.
+        """
 
-    return
+        job_ids = self._get_unconfirmed(n_totals)
+        if len(job_ids) == 0:
+            return {job_id: True for job_id in n_totals}
+
+        counts, log_str = get_qacct_task_counts(job_ids, since=since, owner=self.owner)
+
+        return self._resolve(n_totals, counts, log_str)
+
+    async def check_async(
+        self, n_totals: Dict[str, int], since: Optional[float] = None
+    ) -> Dict[str, bool]:
+        """Asyncio version of check"""
+
+        job_ids = self._get_unconfirmed(n_totals)
+        if len(job_ids) == 0:
+            return {job_id: True for job_id in n_totals}
+
+        counts, log_str = await get_qacct_task_counts_async(job_ids, since=since, owner=self.owner)
+
+        return self._resolve(n_totals, counts, log_str)
+
+
+def _split_vanished(
+    vanished_bars: List[TaskarrayProgress],
+    vanished_qstatjs: Dict[str, Dict[str, str]],
+) -> Tuple[List[TaskarrayProgress], Dict[str, int], Optional[float]]:
+    """Split arrays still in qstat -j from the rest, with their total tasks and first submission"""
+
+    in_qstatj = []
+    n_totals = dict()
+    since = None
+
+    for array_bar in vanished_bars:
+        if len(vanished_qstatjs[array_bar.job_id]) > 0:
+            in_qstatj.append(array_bar)
+            continue
+
+        logger.debug(f"uge {array_bar.job_id} not in qstat -j")
+        n_totals[array_bar.job_id] = array_bar.n_total
+        since = array_bar.submitted if since is None else min(since, array_bar.submitted)
+
+    return in_qstatj, n_totals, since
+
+
+def _cross_check_vanished(
+    vanished_bars: List[TaskarrayProgress],
+    consecutive_qacct_counter: Dict[str, int],
+    qstatu_log_str: str,
+    cross_check: Optional[QacctCrossCheck] = None,
+) -> None:
+    """Finish the arrays no longer in qstat, if qstat -j and qacct agree they are done.
+
+    One qstat -j and one accounting query are used for all the arrays.
+    """
+
+    if cross_check is None:
+        cross_check = QacctCrossCheck()
+
+    # double check if jobs are done, using one qstat -j for all of them
+    try:
+        vanished_qstatjs, qstatj_log_str = get_qstatj_bulk(
+            [array_bar.job_id for array_bar in vanished_bars]
+        )
+        in_qstatj, n_totals, since = _split_vanished(vanished_bars, vanished_qstatjs)
+        is_done = cross_check.check(n_totals, since=since) if n_totals else dict()
+    except throttle.SchedulerBusyError as exc:
+        logger.warning(f"Skipping the cross-check until the next poll: {exc}")
+        return
+
+    for array_bar in vanished_bars:
+        if array_bar in in_qstatj:
+            is_done_ = _is_state_done(array_bar.job_id, vanished_qstatjs[array_bar.job_id])
+        else:
+            is_done_ = is_done[array_bar.job_id]
+        _resolve_cross_check(array_bar, is_done_, consecutive_qacct_counter, qstatu_log_str)
+
+
+async def _cross_check_vanished_async(
+    vanished_bars: List[TaskarrayProgress],
+    consecutive_qacct_counter: Dict[str, int],
+    qstatu_log_str: str,
+    cross_check: Optional[QacctCrossCheck] = None,
+) -> None:
+    """Asyncio version of _cross_check_vanished"""
+
+    if cross_check is None:
+        cross_check = QacctCrossCheck()
+
+    try:
+        vanished_qstatjs, qstatj_log_str = await get_qstatj_bulk_async(
+            [array_bar.job_id for array_bar in vanished_bars]
+        )
+        in_qstatj, n_totals, since = _split_vanished(vanished_bars, vanished_qstatjs)
+        is_done = await cross_check.check_async(n_totals, since=since) if n_totals else dict()
+    except throttle.SchedulerBusyError as exc:
+        logger.warning(f"Skipping the cross-check until the next poll: {exc}")
+        return
+
+    for array_bar in vanished_bars:
+        if array_bar in in_qstatj:
+            is_done_ = _is_state_done(array_bar.job_id, vanished_qstatjs[array_bar.job_id])
+        else:
+            is_done_ = is_done[array_bar.job_id]
+        _resolve_cross_check(array_bar, is_done_, consecutive_qacct_counter, qstatu_log_str)
+
+
+def _resolve_cross_check(
+    array_bar: TaskarrayProgress,
+    is_done: bool,
+    consecutive_qacct_counter: Dict[str, int],
+    qstatu_log_str: str,
+) -> None:
+    """Finish the array if done, or after failing the cross-check 5 times in a row"""
+
+    if is_done:
+        array_bar.finish()
+        return
+
+    logger.warning(
+        f"Job {array_bar.job_id} not found in qstat, but cross-check showed it is not finished"
+    )
+    logger.warning(qstatu_log_str)
+    consecutive_qacct_counter[array_bar.job_id] += 1
+    if consecutive_qacct_counter[array_bar.job_id] >= 5:
+        logger.warning(
+            f"Cross check failed for job {array_bar.job_id} 5 times in a row. Assuming it is finished."
+        )
+        array_bar.finish()
 
 
 def get_qstatj(job_id: Union[str, int]) -> tuple[Dict[str, str], str]:
     """Get job information"""
     try:
-        stdout, stderr = execute(f"qstat -j {job_id} | head -n 100")
+        cmd = f"qstat -j {job_id} | head -n 100"
+        stdout, stderr = throttle.THROTTLE.call(cmd, lambda: execute(cmd))
     except subprocess.CalledProcessError as exc:
         if exc.returncode == 1 and "do not exist" in exc.stderr and job_id in exc.stderr:
             # conclude that job is finished
@@ -481,44 +1727,254 @@ def get_qstatj(job_id: Union[str, int]) -> tuple[Dict[str, str], str]:
     return parse_qstatj(stdout), log_str
 
 
+def get_qstatj_bulk(
+    job_ids: Iterable[Union[str, int]],
+) -> Tuple[Dict[str, Dict[str, str]], str]:
+    """Get job information for many jobs with one qstat -j call per QSTATJ_MAX_JOBS jobs
+
+    Jobs that are not known to qstat (e.g. finished) get an empty dict. The
+    output is not truncated, so it grows with the number of running tasks.
+
+    return:
+        dict of job_id to parsed qstat -j
+        log string
+    """
+
+    job_infos: Dict[str, Dict[str, str]] = dict()
+    log_strs = []
+
+    for chunk in _get_qstatj_chunks(job_ids):
+        cmd = f"qstat -j {','.join(chunk)}"
+
+        try:
+            stdout, stderr = SNAPSHOT_CACHE.fetch(
+                cmd, lambda: throttle.THROTTLE.call(cmd, lambda: execute(cmd))
+            )
+        except subprocess.CalledProcessError as exc:
+            if not _is_qstatj_missing_error(exc):
+                raise exc
+
+            # conclude that (some of) the jobs are finished
+            logger.info(f"Some of jobs {chunk} not found in qstat -j")
+            stdout, stderr = exc.stdout or "", exc.stderr
+
+        chunk_infos, log_str = _collect_qstatj_bulk(cmd, chunk, stdout, stderr)
+        job_infos.update(chunk_infos)
+        log_strs.append(log_str)
+
+    return job_infos, "\n".join(log_strs)
+
+
+async def get_qstatj_bulk_async(
+    job_ids: Iterable[Union[str, int]],
+) -> Tuple[Dict[str, Dict[str, str]], str]:
+    """Asyncio version of get_qstatj_bulk"""
+
+    job_infos: Dict[str, Dict[str, str]] = dict()
+    log_strs = []
+
+    for chunk in _get_qstatj_chunks(job_ids):
+        cmd = f"qstat -j {','.join(chunk)}"
+
+        try:
+            stdout, stderr = await SNAPSHOT_CACHE.fetch_async(
+                cmd, lambda: throttle.THROTTLE.call_async(cmd, lambda: execute_async(cmd))
+            )
+        except subprocess.CalledProcessError as exc:
+            if not _is_qstatj_missing_error(exc):
+                raise exc
+
+            logger.info(f"Some of jobs {chunk} not found in qstat -j")
+            stdout, stderr = exc.stdout or "", exc.stderr
+
+        chunk_infos, log_str = _collect_qstatj_bulk(cmd, chunk, stdout, stderr)
+        job_infos.update(chunk_infos)
+        log_strs.append(log_str)
+
+    return job_infos, "\n".join(log_strs)
+
+
+def _get_qstatj_chunks(job_ids: Iterable[Union[str, int]]) -> List[List[str]]:
+    """Split job IDs into lists of at most QSTATJ_MAX_JOBS, for one qstat -j each"""
+
+    _job_ids = [str(job_id) for job_id in job_ids]
+    return [
+        _job_ids[start : start + QSTATJ_MAX_JOBS]
+        for start in range(0, len(_job_ids), QSTATJ_MAX_JOBS)
+    ]
+
+
+def _is_qstatj_missing_error(exc: subprocess.CalledProcessError) -> bool:
+    """qstat -j fails if any of the jobs do not exist"""
+    return exc.returncode == 1 and "do not exist" in (exc.stderr or "")
+
+
+def _collect_qstatj_bulk(
+    cmd: str, job_ids: List[str], stdout: str, stderr: str
+) -> Tuple[Dict[str, Dict[str, str]], str]:
+
+    logger.debug(cmd)
+    logger.debug(f"qstat stdout: {stdout}")
+    logger.debug(f"qstat stderr: {stderr}")
+    log_str = f"{cmd} gave {stdout}"
+
+    infos = parse_qstatj_bulk(stdout)
+    job_infos = {job_id: infos.get(job_id, dict()) for job_id in job_ids}
+
+    return job_infos, log_str
+
+
 def get_qstat(
-    username: str, max_retries: int = 3, update_interval: int = 5
+    username: str, max_retries: int = 3, update_interval: int = 5, xml: bool = True
+) -> tuple[pd.DataFrame, str]:
+    """Get job information for user
+
+    With xml, qstat -xml is parsed instead of the fixed-width text output.
+    """
+
+    cmd, stdout, stderr = _fetch_qstat(username, max_retries, update_interval, xml)
+
+    return _collect_qstat(cmd, stdout, stderr, xml)
+
+
+def get_qstat_task_ids(
+    username: str, max_retries: int = 3, update_interval: int = 5, xml: bool = True
 ) -> tuple[pd.DataFrame, str]:
-    """Get job information for user"""
+    """Get the running, pending and error task IDs of the jobs of user, as TaskSet
+
+    Shares the snapshot of get_qstat, so both can be called in the same poll.
+    """
+
+    cmd, stdout, stderr = _fetch_qstat(username, max_retries, update_interval, xml)
+    log_str = f"{cmd} gave {stdout}"
 
-    stdout, stderr = execute_with_retry(
-        f"qstat -u {username}",
-        max_retries=max_retries,
-        update_interval=update_interval,
+    if stdout is None or len(stdout) == 0:
+        return pd.DataFrame(columns=["job", "running", "pending", "error"]), log_str
+
+    pdf = parse_qstat_xml(stdout) if xml else parse_qstat(stdout)
+
+    return parse_taskarray_ids(pdf), log_str
+
+
+def _fetch_qstat(
+    username: str, max_retries: int, update_interval: int, xml: bool
+) -> Tuple[str, str, str]:
+
+    cmd = f"qstat -xml -u {username}" if xml else f"qstat -u {username}"
+
+    stdout, stderr = SNAPSHOT_CACHE.fetch(
+        cmd,
+        lambda: throttle.THROTTLE.call_with_retry(
+            cmd,
+            lambda: execute(cmd),
+            max_retries=max_retries,
+            update_interval=update_interval,
+        ),
     )
-    logger.debug(f"qstat -u {username}")
+
+    return cmd, stdout, stderr
+
+
+async def get_qstat_async(
+    username: str, max_retries: int = 3, update_interval: float = 5, xml: bool = True
+) -> tuple[pd.DataFrame, str]:
+    """Get job information for user, from asyncio"""
+
+    cmd = f"qstat -xml -u {username}" if xml else f"qstat -u {username}"
+
+    stdout, stderr = await SNAPSHOT_CACHE.fetch_async(
+        cmd,
+        lambda: throttle.THROTTLE.call_with_retry_async(
+            cmd,
+            lambda: execute_async(cmd),
+            max_retries=max_retries,
+            update_interval=update_interval,
+        ),
+    )
+
+    return _collect_qstat(cmd, stdout, stderr, xml)
+
+
+def _collect_qstat(cmd: str, stdout: str, stderr: str, xml: bool) -> tuple[pd.DataFrame, str]:
+
+    logger.debug(cmd)
     logger.debug(f"qstat stdout: {stdout}")
     logger.debug(f"qstat stderr: {stderr}")
-    log_str = f"qstat -u {username} gave {stdout}"
+    log_str = f"{cmd} gave {stdout}"
 
     if stdout is None or len(stdout) == 0:
         empty_df = pd.DataFrame(columns=["job", "running", "pending", "error"])
         return empty_df, log_str
 
-    pdf = parse_qstat(stdout)
+    pdf = parse_qstat_xml(stdout) if xml else parse_qstat(stdout)
     pdf_ = parse_taskarray(pdf)
 
     return pdf_, log_str
 
 
 def get_qacctj(job_id: Union[str, int]) -> pd.DataFrame:
-    """Get detailed job information"""
+    """Get detailed job information.
+
+    Reads the indexed accounting file instead of calling qacct, if its path
+    is set in the HPCE_UTILS_ACCOUNTING environment variable.
+    """
+
+    index = accounting.get_default_index()
+    if index is not None:
+        return _get_qacctj_from_accounting(job_id, index)
 
     try:
-        stdout, _ = execute(f"qacct -j {job_id}")
+        # Job names can be patterns, as "calc*", which the shell would expand
+        cmd = f"qacct -j {shlex.quote(str(job_id))}"
+        stdout, _ = throttle.THROTTLE.call(cmd, lambda: execute(cmd))
     except subprocess.CalledProcessError as exc:
-        if exc.returncode == 1 and "not found" in exc.stderr and job_id in exc.stderr:
+        if exc.returncode == 1 and "not found" in exc.stderr and str(job_id) in exc.stderr:
             # conclude that job is not finished
             logger.info(f"Job {job_id} not found in qacct")
             return pd.DataFrame({}), exc.stderr
 
         raise exc
 
+    return _collect_qacctj(job_id, stdout)
+
+
+async def get_qacctj_async(job_id: Union[str, int]) -> Tuple[pd.DataFrame, str]:
+    """Get detailed job information, from asyncio"""
+
+    index = accounting.get_default_index()
+    if index is not None:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, _get_qacctj_from_accounting, job_id, index)
+
+    try:
+        # Job names can be patterns, as "calc*", which the shell would expand
+        cmd = f"qacct -j {shlex.quote(str(job_id))}"
+        stdout, _ = await throttle.THROTTLE.call_async(cmd, lambda: execute_async(cmd))
+    except subprocess.CalledProcessError as exc:
+        if exc.returncode == 1 and "not found" in exc.stderr and str(job_id) in exc.stderr:
+            logger.info(f"Job {job_id} not found in qacct")
+            return pd.DataFrame({}), exc.stderr
+
+        raise exc
+
+    return _collect_qacctj(job_id, stdout)
+
+
+def _get_qacctj_from_accounting(
+    job_id: Union[str, int], index: accounting.AccountingIndex
+) -> Tuple[pd.DataFrame, str]:
+
+    pdf = accounting.get_job(job_id, index=index)
+    log_str = f"{index.accounting_path} has {len(pdf)} entries for {job_id}"
+
+    if len(pdf) == 0:
+        logger.info(f"Job {job_id} not found in {index.accounting_path}")
+
+    return pdf, log_str
+
+
+def _collect_qacctj(job_id: Union[str, int], stdout: str) -> Tuple[pd.DataFrame, str]:
+
     log_str = f"qacct -j {job_id} gave {stdout}"
     if stdout is None or len(stdout) == 0:
         return pd.DataFrame({}), log_str
@@ -530,42 +1986,193 @@ def get_qacctj(job_id: Union[str, int]) -> pd.DataFrame:
     return pdf, log_str
 
 
-def get_cluster_usage() -> DataFrame:
+def _get_qacct_counts_cmds(
+    job_ids: List[str], since: Optional[float], owner: Optional[str]
+) -> List[str]:
+    """One qacct -j for all jobs of owner started since the earliest submission.
+
+    Without a submission time, the whole accounting would be read, so each
+    job gets its own qacct -j instead.
+    """
+
+    if len(job_ids) == 1 or since is None:
+        return [f"qacct -j {job_id}" for job_id in job_ids]
+
+    if owner is None:
+        owner = getpass.getuser()
+
+    begin = time.strftime("%Y%m%d%H%M", time.localtime(since))
+    return [f"qacct -o {owner} -b {begin} -j"]
+
+
+def _is_qacct_not_found(exc: subprocess.CalledProcessError) -> bool:
+    return exc.returncode == 1 and "not found" in exc.stderr
+
+
+def _parse_qacct_task_counts(stdout: str, job_ids: List[str]) -> Dict[str, int]:
+    """Count the distinct tasks per job in qacct -j output"""
+
+    tasks = defaultdict(set)
+    for job_id, task_id in QACCT_JOB_TASK_PATTERN.findall(stdout):
+        tasks[job_id].add(task_id)
+
+    return {job_id: len(tasks[job_id]) for job_id in job_ids}
+
+
+def _get_accounting_task_counts(
+    job_ids: List[str], index: accounting.AccountingIndex
+) -> Tuple[Dict[str, int], str]:
+
+    index.update()
+    column = accounting.ACCOUNTING_FIELDS.index("task_number")
+
+    counts = dict()
+    for job_id in job_ids:
+        lines = index.read_lines(job_id, update=False)
+        counts[job_id] = len({line.split(b":")[column] for line in lines})
+
+    log_str = f"{index.accounting_path} has tasks {counts}"
+
+    return counts, log_str
+
+
+def get_qacct_task_counts(
+    job_ids: List[str], since: Optional[float] = None, owner: Optional[str] = None
+) -> Tuple[Dict[str, int], str]:
+    """Number of finished tasks of each job in the accounting, from one query.
+
+    Reads the indexed accounting file if set in HPCE_UTILS_ACCOUNTING.
+    Otherwise, several jobs are counted from one qacct -j over the jobs of
+    owner started since the unix time since, instead of one qacct -j per job.
+    """
+
+    index = accounting.get_default_index()
+    if index is not None:
+        return _get_accounting_task_counts(job_ids, index)
+
+    stdouts = []
+    for cmd in _get_qacct_counts_cmds(job_ids, since, owner):
+        try:
+            stdout, _ = throttle.THROTTLE.call(cmd, lambda: execute(cmd))
+        except subprocess.CalledProcessError as exc:
+            if not _is_qacct_not_found(exc):
+                raise exc
+            logger.info(f"{cmd} found no jobs")
+            continue
+        stdouts.append(stdout)
+
+    stdout = "".join(stdouts)
+    return _parse_qacct_task_counts(stdout, job_ids), f"qacct -j gave {len(stdout)} bytes"
+
+
+async def get_qacct_task_counts_async(
+    job_ids: List[str], since: Optional[float] = None, owner: Optional[str] = None
+) -> Tuple[Dict[str, int], str]:
+    """Asyncio version of get_qacct_task_counts"""
+
+    index = accounting.get_default_index()
+    if index is not None:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, _get_accounting_task_counts, job_ids, index)
+
+    stdouts = []
+    for cmd in _get_qacct_counts_cmds(job_ids, since, owner):
+        try:
+            stdout, _ = await throttle.THROTTLE.call_async(cmd, lambda: execute_async(cmd))
+        except subprocess.CalledProcessError as exc:
+            if not _is_qacct_not_found(exc):
+                raise exc
+            logger.info(f"{cmd} found no jobs")
+            continue
+        stdouts.append(stdout)
+
+    stdout = "".join(stdouts)
+    return _parse_qacct_task_counts(stdout, job_ids), f"qacct -j gave {len(stdout)} bytes"
+
+
+def get_cluster_usage(xml: bool = True) -> DataFrame:
     """Get cluster usage information, grouped by users
 
     To get totla cores in use `pdf["slots"].sum()`
+
+    With xml, the running slots are summed while streaming the qstat -xml
+    records, without building a row per job.
     """
 
-    stdout, _ = execute("qstat -u \\*")  # noqa: W605
-    pdf = parse_qstat(stdout)
+    if not xml:
+        cmd = "qstat -u \\*"  # noqa: W605
+        stdout, _ = SNAPSHOT_CACHE.fetch(
+            cmd, lambda: throttle.THROTTLE.call(cmd, lambda: execute(cmd))
+        )
+        pdf = parse_qstat(stdout)
+
+        # filter to running
+        pdf = pdf[pdf.state.isin(running_tags)]
+
+        counts = pdf.groupby(["user"])["slots"].agg("sum")
+        counts = counts.sort_values()  # type: ignore
+
+        return counts
+
+    cmd = "qstat -xml -u \\*"  # noqa: W605
+    stdout, _ = SNAPSHOT_CACHE.fetch(
+        cmd, lambda: throttle.THROTTLE.call(cmd, lambda: execute(cmd))
+    )
 
-    # filter to running
-    pdf = pdf[pdf.state.isin(running_tags)]
+    slots: Dict[str, int] = defaultdict(int)
+    for job in iter_qstat_xml(stdout):
+        if job.state in running_tags:
+            slots[job.user] += job.slots
 
-    counts = pdf.groupby(["user"])["slots"].agg("sum")
+    counts = pd.Series(slots, name="slots", dtype=int)
+    counts.index.name = "user"
     counts = counts.sort_values()  # type: ignore
 
     return counts
 
 
 def wait_for_jobs(
-    jobs: List[str], respiratory: int = 60, include_status: bool = True
+    jobs: List[str],
+    respiratory: int = 60,
+    include_status: bool = True,
+    poll_scheduler: Optional[PollScheduler] = None,
+    expected_runtime: Optional[float] = None,
 ) -> Iterator[str]:
-    """ """
+    """Wait for jobs to finish, and yield job IDs as they are done.
+
+    With a poll_scheduler, the wait between polls backs off geometrically
+    instead of being a fixed respiratory, up to a fraction of the time waited
+    so far. With an expected_runtime in seconds, polls tighten towards it.
+    """
 
     logger.info(f"Waiting for {len(jobs)} job(s) on UGE...")
 
     start_time = time.time()
 
     while len(jobs):
+        interval: float = respiratory
+        if poll_scheduler is not None:
+            elapsed = time.time() - start_time
+            interval = poll_scheduler.next_interval(
+                _get_remaining(expected_runtime, elapsed), elapsed=elapsed
+            )
+
         logger.info(
-            f"... and breathe for {respiratory} sec, still waiting for {len(jobs)} job(s) to finish..."
+            f"... and breathe for {interval:.0f} sec, still waiting for {len(jobs)} job(s) to finish..."
         )
 
-        time.sleep(respiratory)
+        time.sleep(interval)
 
-        for job_id in jobs:
-            if _uge_is_job_done(job_id):
+        try:
+            qstatjs, qstatj_log_str = get_qstatj_bulk(jobs)
+        except throttle.SchedulerBusyError as exc:
+            logger.warning(f"Skipping qstat -j: {exc}")
+            continue
+
+        for job_id in list(jobs):
+            if _uge_is_job_done(
+                job_id, status_j=qstatjs[str(job_id)], qstatj_log_str=qstatj_log_str
+            ):
                 yield job_id
                 jobs.remove(job_id)
 
@@ -574,6 +2181,135 @@ def wait_for_jobs(
     logger.info(f"All jobs finished and took {diff_time/60/60:.2f}h")
 
 
+def _get_remaining(expected_runtime: Optional[float], elapsed: float) -> Optional[float]:
+    """Expected remaining runtime, None without an estimate or when it is overrun"""
+
+    if expected_runtime is None or elapsed >= expected_runtime:
+        return None
+
+    return expected_runtime - elapsed
+
+
+class JobWatcher:
+    """Wait for many UGE jobs from one asyncio event loop.
+
+    All waiters share a single poll task, so each poll is one qstat -j for
+    every job waited on, no matter how many coroutines are waiting. The poll
+    task stops when there is nothing left to wait for.
+    """
+
+    def __init__(
+        self,
+        respiratory: float = 60,
+        poll_scheduler: Optional[PollScheduler] = None,
+        expected_runtime: Optional[float] = None,
+    ) -> None:
+        self.respiratory = respiratory
+        self.poll_scheduler = poll_scheduler
+        self.expected_runtime = expected_runtime
+        self._waiters: Dict[str, List[asyncio.Future]] = defaultdict(list)
+        self._poller: Optional[asyncio.Task] = None
+
+    async def wait(self, job_id: Union[str, int]) -> str:
+        """Wait until job is done, and return the job ID"""
+
+        job_id = str(job_id)
+        future = asyncio.get_running_loop().create_future()
+        self._waiters[job_id].append(future)
+
+        if self._poller is None or self._poller.done():
+            self._poller = asyncio.ensure_future(self._poll())
+
+        try:
+            return await future
+        finally:
+            futures = self._waiters.get(job_id, [])
+            if future in futures:
+                futures.remove(future)
+            if job_id in self._waiters and len(futures) == 0:
+                del self._waiters[job_id]
+
+    async def _poll(self) -> None:
+        start_time = time.time()
+        try:
+            while len(self._waiters):
+                interval = self.respiratory
+                if self.poll_scheduler is not None:
+                    elapsed = time.time() - start_time
+                    interval = self.poll_scheduler.next_interval(
+                        _get_remaining(self.expected_runtime, elapsed), elapsed=elapsed
+                    )
+
+                await asyncio.sleep(interval)
+
+                job_ids = list(self._waiters)
+                if len(job_ids) == 0:
+                    break
+
+                try:
+                    qstatjs, qstatj_log_str = await get_qstatj_bulk_async(job_ids)
+                except (
+                    subprocess.CalledProcessError,
+                    subprocess.TimeoutExpired,
+                    throttle.SchedulerBusyError,
+                ) as exc:
+                    logger.warning(f"Error getting qstat -j: {exc}")
+                    continue
+
+                for job_id in job_ids:
+                    if not _uge_is_job_done(
+                        job_id, status_j=qstatjs[job_id], qstatj_log_str=qstatj_log_str
+                    ):
+                        continue
+
+                    for future in self._waiters.pop(job_id, []):
+                        if not future.done():
+                            future.set_result(job_id)
+
+        except Exception as exc:
+            # Do not leave waiters hanging
+            for futures in self._waiters.values():
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(exc)
+            raise
+
+
+async def await_jobs(
+    jobs: List[Union[str, int]],
+    respiratory: float = 60,
+    poll_scheduler: Optional[PollScheduler] = None,
+    watcher: Optional[JobWatcher] = None,
+    expected_runtime: Optional[float] = None,
+) -> AsyncIterator[str]:
+    """Asyncio version of wait_for_jobs, yields job IDs as they are done.
+
+    usage:
+        async for job_id in status.await_jobs(job_ids):
+            ...
+
+    Pass a shared watcher to combine the polling of many await_jobs calls.
+    """
+
+    if watcher is None:
+        watcher = JobWatcher(
+            respiratory=respiratory,
+            poll_scheduler=poll_scheduler,
+            expected_runtime=expected_runtime,
+        )
+
+    logger.info(f"Waiting for {len(jobs)} job(s) on UGE...")
+
+    waiting = [asyncio.ensure_future(watcher.wait(job_id)) for job_id in jobs]
+
+    try:
+        for next_done in asyncio.as_completed(waiting):
+            yield await next_done
+    finally:
+        for task in waiting:
+            task.cancel()
+
+
 def wait_for_jobs_using_hold_job(
     jobs: list[str],
     scr: Path,
@@ -582,12 +2318,89 @@ def wait_for_jobs_using_hold_job(
     log_dir: Path | None = submitting.DEFAULT_LOG_DIR,
     generate_dirs: bool = True,
     update_interval: int = 5,
+    max_interval: float = 60,
+    watcher: DirectoryWatcher | None = None,
 ) -> Path:
     """
     Wait for by submitting a job using -hold-jid, which will only start when the other jobs
     are finished. This submitted job creates a file which is used to check if the job is finished.
     This avoids checking qstat, which puts some load on the server.
+
+    The finished file is watched with inotify on local filesystems, otherwise
+    it is checked with an interval growing from update_interval to max_interval.
+    Pass a shared watcher on scr to let many concurrent waits share one
+    directory scan per interval.
     """
+
+    script, script_filename, finished_file = _generate_hold_job(
+        jobs, scr, user_email, name, log_dir, generate_dirs
+    )
+
+    job_id_hold_job, _ = submitting.submit_script(
+        script,
+        scr=scr,
+        filename=script_filename,
+    )
+
+    logger.info(f"Submitted job {job_id_hold_job} to wait for jobs {jobs}")
+    logger.info(f"To manually skip waiting, create the file {finished_file}")
+
+    if watcher is not None:
+        watcher.wait(finished_file.name)
+    else:
+        wait_for_file(finished_file, min_interval=update_interval, max_interval=max_interval)
+
+    logger.info(f"Jobs {jobs} have finished, continuing...")
+    return finished_file
+
+
+async def wait_for_jobs_using_hold_job_async(
+    jobs: list[str],
+    scr: Path,
+    user_email: str | None = None,
+    name: str = "UGEHoldJob",
+    log_dir: Path | None = submitting.DEFAULT_LOG_DIR,
+    generate_dirs: bool = True,
+    update_interval: float = 5,
+    max_interval: float = 60,
+    watcher: DirectoryWatcher | None = None,
+) -> Path:
+    """Asyncio version of wait_for_jobs_using_hold_job"""
+
+    script, script_filename, finished_file = _generate_hold_job(
+        jobs, scr, user_email, name, log_dir, generate_dirs
+    )
+
+    job_id_hold_job, _ = await submitting.submit_script_async(
+        script,
+        scr=scr,
+        filename=script_filename,
+    )
+
+    logger.info(f"Submitted job {job_id_hold_job} to wait for jobs {jobs}")
+    logger.info(f"To manually skip waiting, create the file {finished_file}")
+
+    if watcher is not None:
+        await watcher.wait_async(finished_file.name)
+    else:
+        await wait_for_file_async(
+            finished_file, min_interval=update_interval, max_interval=max_interval
+        )
+
+    logger.info(f"Jobs {jobs} have finished, continuing...")
+    return finished_file
+
+
+def _generate_hold_job(
+    jobs: list[str],
+    scr: Path,
+    user_email: str | None,
+    name: str,
+    log_dir: Path | None,
+    generate_dirs: bool,
+) -> Tuple[str, str, Path]:
+    """Generate the hold job script, its filename and the file it creates when done"""
+
     job_ids_joined = "__".join(jobs)
     filename = f"hold_job_{job_ids_joined}.finished"
     script_filename = f"hold_job_{job_ids_joined}.sh"
@@ -604,30 +2417,20 @@ def wait_for_jobs_using_hold_job(
         generate_dirs=generate_dirs,
     )
 
-    job_id_hold_job, _ = submitting.submit_script(
-        script,
-        scr=scr,
-        filename=script_filename,
-    )
-
-    logger.info(f"Submitted job {job_id_hold_job} to wait for jobs {jobs}")
-    logger.info(f"To manually skip waiting, create the file {finished_file}")
-
-    while not finished_file.exists():
-        time.sleep(update_interval)
-
-    logger.info(f"Jobs {jobs} have finished, continuing...")
-    return finished_file
+    return script, script_filename, finished_file
 
 
 def _uge_is_job_done(
     job_id: str,
     cross_check: bool = False,
     n_total_jobs: int = 1,
+    status_j: Optional[Dict[str, str]] = None,
+    qstatj_log_str: str = "",
 ) -> bool:
-    still_waiting_states = pending_tags + running_tags
+    """Check if job is done. Uses status_j if already fetched with get_qstatj_bulk"""
 
-    status_j, qstatj_log_str = get_qstatj(job_id)
+    if status_j is None:
+        status_j, qstatj_log_str = get_qstatj(job_id)
 
     if len(status_j) == 0:
         logger.debug(f"uge {job_id} not in qstat -j")
@@ -636,16 +2439,60 @@ def _uge_is_job_done(
 
         # If job is not in qstat, it should be in qacct
         qacctj, qacctj_log_str = get_qacctj(job_id)
-        if len(qacctj) != n_total_jobs:
-            logger.warning(f"qacct indicates that job {job_id} is not finished")
-            logger.warning(
-                f"UGE job {job_id} has {len(qacctj)} entries in qacct. Expected {n_total_jobs}"
-            )
-            logger.warning(f"qstat -j output: {qstatj_log_str}")
-            logger.warning(f"qacct -j output: {qacctj_log_str}")
-            return False
+        return _is_qacct_complete(job_id, qacctj, n_total_jobs, qstatj_log_str, qacctj_log_str)
 
-        return True
+    return _is_state_done(job_id, status_j)
+
+
+async def _uge_is_job_done_async(
+    job_id: str,
+    cross_check: bool = False,
+    n_total_jobs: int = 1,
+    status_j: Optional[Dict[str, str]] = None,
+    qstatj_log_str: str = "",
+) -> bool:
+    """Asyncio version of _uge_is_job_done"""
+
+    if status_j is None:
+        job_infos, qstatj_log_str = await get_qstatj_bulk_async([job_id])
+        status_j = job_infos[str(job_id)]
+
+    if len(status_j) == 0:
+        logger.debug(f"uge {job_id} not in qstat -j")
+        if not cross_check:
+            return True
+
+        qacctj, qacctj_log_str = await get_qacctj_async(job_id)
+        return _is_qacct_complete(job_id, qacctj, n_total_jobs, qstatj_log_str, qacctj_log_str)
+
+    return _is_state_done(job_id, status_j)
+
+
+def _is_qacct_complete(
+    job_id: str,
+    qacctj: DataFrame,
+    n_total_jobs: int,
+    qstatj_log_str: str,
+    qacctj_log_str: str,
+) -> bool:
+    """Check that qacct has an entry for every task of the job"""
+
+    if len(qacctj) != n_total_jobs:
+        logger.warning(f"qacct indicates that job {job_id} is not finished")
+        logger.warning(
+            f"UGE job {job_id} has {len(qacctj)} entries in qacct. Expected {n_total_jobs}"
+        )
+        logger.warning(f"qstat -j output: {qstatj_log_str}")
+        logger.warning(f"qacct -j output: {qacctj_log_str}")
+        return False
+
+    return True
+
+
+def _is_state_done(job_id: str, status_j: Dict[str, str]) -> bool:
+    """Check the job state in qstat -j"""
+
+    still_waiting_states = pending_tags + running_tags
 
     state = status_j.get("job_state", "qw")
     logger.debug(f"uge {job_id} is {state}")
@@ -1,17 +1,45 @@
+import inspect
 import logging
+import math
+import shlex
+import statistics
+import subprocess
+import time
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple, Union
-
-from jinja2 import Template
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+
+from jinja2 import Environment, FileSystemLoader, Template
 
 from hpce_utils.files import generate_name
-from hpce_utils.managers.uge import constants
-from hpce_utils.shell import execute
+from hpce_utils.managers.uge import constants, throttle
+from hpce_utils.shell import execute, execute_async
 
 DEFAULT_LOG_DIR = Path("./ugelogs/")
-TEMPLATE_TASKARRAY = Path(__file__).parent / "templates" / "submit-task-array.jinja"
-TEMPLATE_HOLDING = Path(__file__).parent / "templates" / "submit-holding.jinja"
+TEMPLATE_DIR = Path(__file__).parent / "templates"
+TEMPLATE_TASKARRAY = TEMPLATE_DIR / "submit-task-array.jinja"
+TEMPLATE_HOLDING = TEMPLATE_DIR / "submit-holding.jinja"
+TASK_MARKER_SUFFIX = ".done"
+
+# Command lists are stored with a fixed-width index of byte offsets, one per line
+COMMAND_LIST_SUFFIX = ".commands"
+COMMAND_INDEX_SUFFIX = ".index"
+COMMAND_INDEX_WIDTH = 16
+
+# Runtime of array tasks that packed command lists aim for, in seconds
+PACKING_TARGET_SECONDS = 600.0
 logger = logging.getLogger(__name__)
 
 LMOD_LINES = [
@@ -19,6 +47,15 @@ LMOD_LINES = [
     "=>",
 ]
 
+# Templates are compiled once per process, and not checked for changes on disk
+TEMPLATE_ENVIRONMENT = Environment(loader=FileSystemLoader(TEMPLATE_DIR), auto_reload=False)
+TEMPLATE_ENVIRONMENT.filters["quote"] = shlex.quote
+
+
+def get_template(path: Path) -> Template:
+    """Compiled template from the templates directory"""
+    return TEMPLATE_ENVIRONMENT.get_template(path.name)
+
 
 def generate_command(sync: bool = False, export: bool = False) -> str:
     """Generate UGE/SGE submit command with approriate flags
@@ -66,28 +103,104 @@ def generate_taskarray_script(
     hold_job_id: Optional[str] = None,
     user_email: Optional[str] = None,
     generate_dirs: bool = True,
+    marker_dir: Optional[Path] = None,
+    autosize: bool = False,
 ) -> str:
     """
     Remember:
       - To set core restrictive env variables
+
+    With marker_dir, each task creates an empty {JOB_ID}.{SGE_TASK_ID}.{exit code}.done
+    when it ends, which can be followed with status.TaskMarkerTracker.
+
+    With autosize, cores, mem, hours and mins are replaced by the suggestion
+    from past jobs with the same name, see sizing.suggest_for_name.
+    """
+
+    return _render_taskarray(locals(), dict())
+
+
+def generate_taskarray_scripts(parameters: Iterable[Dict[str, Any]], **defaults: Any) -> List[str]:
+    """Render a task-array script per parameter set, with the arguments of
+    generate_taskarray_script. Arguments missing from a set are taken from
+    defaults.
+
+    The template is compiled once, and each distinct log_dir and marker_dir
+    is created and resolved once for all scripts.
     """
 
+    signature = inspect.signature(generate_taskarray_script)
+    cache: Dict[Tuple[str, Any], Any] = dict()
+
+    scripts = []
+    for parameters_ in parameters:
+        arguments = signature.bind(**{**defaults, **parameters_})
+        arguments.apply_defaults()
+        scripts.append(_render_taskarray(arguments.arguments, cache))
+
+    return scripts
+
+
+def _cached(cache: Dict[Tuple[str, Any], Any], kind: str, key: Any, func: Callable) -> Any:
+    if (kind, key) not in cache:
+        cache[(kind, key)] = func(key)
+    return cache[(kind, key)]
+
+
+def _render_taskarray(kwargs: Dict[str, Any], cache: Dict[Tuple[str, Any], Any]) -> str:
+    """Render the task-array template, with directories and suggestions from cache"""
+
+    kwargs = dict(kwargs)
+    name = kwargs["name"]
+
+    if kwargs["autosize"]:
+        # Imported here, as sizing reads accounting through status, which imports this module
+        from hpce_utils.managers.uge import sizing
+
+        suggestion = _cached(cache, "suggestion", name, sizing.suggest_for_name)
+
+        if suggestion is None:
+            logger.info(f"No accounting history for {name}, keeping requested resources")
+        else:
+            logger.info(
+                f"Autosized {name} from {suggestion.n_samples} tasks: "
+                f"cores={suggestion.cores}, mem={suggestion.mem}G, "
+                f"h_rt={suggestion.hours}:{suggestion.mins:02d}:00"
+            )
+            kwargs["cores"] = suggestion.cores
+            kwargs["mem"] = suggestion.mem
+            kwargs["hours"] = suggestion.hours
+            kwargs["mins"] = suggestion.mins
+
+    cores = kwargs["cores"]
     if not isinstance(cores, int) and cores >= 1:
         raise ValueError(
             "Cannot submit with invalid cores set. Needs to be a integer greater than 0."
         )
 
-    kwargs = locals()
-
+    generate_dirs = kwargs["generate_dirs"]
     if generate_dirs:
-        kwargs["log_dir"] = generate_log_dir(log_dir)
+        kwargs["log_dir"] = _cached(cache, "log_dir", kwargs["log_dir"], generate_log_dir)
+
+    marker_dir = kwargs["marker_dir"]
+    if marker_dir is not None:
+        kwargs["marker_dir"] = _cached(
+            cache,
+            "marker_dir",
+            marker_dir,
+            lambda path: _generate_marker_dir(path, generate_dirs),
+        )
+        kwargs["marker_suffix"] = TASK_MARKER_SUFFIX
 
-    with open(TEMPLATE_TASKARRAY) as file_:
-        template = Template(file_.read())
+    template = get_template(TEMPLATE_TASKARRAY)
 
-    script = template.render(**kwargs)
+    return template.render(**kwargs)
 
-    return script
+
+def _generate_marker_dir(marker_dir: Path, generate_dirs: bool) -> str:
+    if generate_dirs:
+        marker_dir.mkdir(parents=True, exist_ok=True)
+    return str(marker_dir.resolve())
 
 
 def generate_hold_script(
@@ -104,8 +217,7 @@ def generate_hold_script(
     else:
         log_dir_str = str(log_dir.resolve()) if log_dir is not None else None
 
-    with open(TEMPLATE_HOLDING) as file_:
-        template = Template(file_.read())
+    template = get_template(TEMPLATE_HOLDING)
 
     script = template.render(
         hold_job_id=hold_job_id,
@@ -149,6 +261,359 @@ def submit_script(
         script path
     """
 
+    scr, filename, cmd = _write_submit_script(submit_script, scr, filename, cmd, cmd_options)
+
+    if dry:
+        logger.info("Dry submission of qsub command")
+        logger.info(f"cmd={cmd}")
+        logger.info(f"scr={scr}")
+        return None, scr / filename
+
+    stdout, stderr = throttle.THROTTLE.call(cmd, lambda: execute(cmd, cwd=scr))
+
+    return _parse_submit_output(stdout, stderr), scr / filename
+
+
+class SubmitResult(NamedTuple):
+    """Outcome of one script of submit_scripts"""
+
+    job_id: Optional[str]
+    script_path: Optional[Path]
+    attempts: int
+    error: Optional[str] = None
+
+
+# pylint: disable=too-many-arguments,dangerous-default-value
+def submit_scripts(
+    submit_scripts: Sequence[str],
+    scr: Optional[Union[str, Path]] = None,
+    filenames: Optional[Sequence[str]] = None,
+    cmd: str = constants.command_submit,
+    cmd_options: Dict[str, str] = {},
+    max_workers: int = 8,
+    max_retries: int = 2,
+    update_interval: float = 1.0,
+) -> List[SubmitResult]:
+    """Submit many scripts with at most max_workers concurrent qsub calls
+
+    qsub calls that could not reach qmaster are retried for that script only,
+    with backoff. A qsub that timed out is not retried, as the job may have
+    been queued. The scheduler throttle still applies, so throughput is set
+    by its qsub limits.
+
+    return:
+        SubmitResult per script, in the order of submit_scripts
+    """
+
+    if filenames is not None and len(filenames) != len(submit_scripts):
+        raise ValueError("Need one filename per submit script")
+
+    def _submit(index: int) -> SubmitResult:
+        filename = filenames[index] if filenames is not None else None
+        return _submit_with_retry(
+            submit_scripts[index],
+            scr,
+            filename,
+            cmd,
+            cmd_options,
+            max_retries,
+            update_interval,
+        )
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(_submit, range(len(submit_scripts))))
+
+    n_failed = sum(result.job_id is None for result in results)
+    if n_failed:
+        logger.error(f"Failed to submit {n_failed} of {len(results)} scripts")
+
+    return results
+
+
+def _submit_with_retry(
+    submit_script: str,
+    scr: Optional[Union[str, Path]],
+    filename: Optional[str],
+    cmd: str,
+    cmd_options: Dict[str, str],
+    max_retries: int,
+    update_interval: float,
+) -> SubmitResult:
+
+    scr_, filename_, cmd_ = _write_submit_script(submit_script, scr, filename, cmd, cmd_options)
+    script_path = scr_ / filename_
+
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            stdout, stderr = throttle.THROTTLE.call(cmd_, lambda: execute(cmd_, cwd=scr_))
+        except subprocess.TimeoutExpired as exc:
+            # qmaster may have queued the job before qsub timed out, so never resubmit
+            logger.error(f"Submitting {script_path} timed out, the job may still be queued")
+            return SubmitResult(None, script_path, attempt, str(exc))
+        except (subprocess.CalledProcessError, throttle.SchedulerBusyError) as exc:
+            # qsub was not run, or could not reach qmaster, so the job was not submitted
+            is_busy = isinstance(exc, throttle.SchedulerBusyError)
+            if attempt > max_retries or not (is_busy or throttle.is_qmaster_error(exc)):
+                return SubmitResult(None, script_path, attempt, str(exc))
+
+            interval = throttle.get_retry_interval(update_interval, attempt - 1)
+            logger.warning(f"Submitting {script_path} failed, retrying in {interval:.1f}s")
+            time.sleep(interval)
+            continue
+
+        # qsub succeeded, so never resubmit, even if the output is unexpected
+        try:
+            job_id = _parse_submit_output(stdout, stderr)
+        except (RuntimeError, ValueError) as exc:
+            return SubmitResult(None, script_path, attempt, str(exc))
+
+        if job_id is None:
+            return SubmitResult(None, script_path, attempt, stderr or stdout)
+
+        return SubmitResult(job_id, script_path, attempt)
+
+
+def write_command_list(commands: Iterable[str], path: Path) -> Tuple[Path, Path, int]:
+    """Write commands, one per line, with an index of the byte offset of each line
+
+    The index has a zero-padded offset of COMMAND_INDEX_WIDTH digits per line,
+    so command i is found by seeking twice, without reading the list.
+
+    return:
+        path of commands
+        path of index
+        number of commands
+    """
+
+    commands_path = path.with_name(path.name + COMMAND_LIST_SUFFIX)
+    index_path = path.with_name(path.name + COMMAND_INDEX_SUFFIX)
+
+    n_commands = 0
+    offset = 0
+    with open(commands_path, "wb") as commands_file, open(index_path, "wb") as index_file:
+        for command in commands:
+            if "\n" in command:
+                raise ValueError(f"Commands must be single lines, got {command!r}")
+
+            line = command.encode("utf-8") + b"\n"
+            commands_file.write(line)
+            index_file.write(f"{offset:0{COMMAND_INDEX_WIDTH}d}\n".encode())
+
+            offset += len(line)
+            n_commands += 1
+
+    return commands_path, index_path, n_commands
+
+
+def read_command(commands_path: Path, index_path: Path, task_id: int) -> str:
+    """Read command of task_id, counting from 1, from a list of write_command_list"""
+
+    with open(index_path, "rb") as index_file:
+        index_file.seek((task_id - 1) * (COMMAND_INDEX_WIDTH + 1))
+        offset = int(index_file.read(COMMAND_INDEX_WIDTH))
+
+    with open(commands_path, "rb") as commands_file:
+        commands_file.seek(offset)
+        return commands_file.readline().decode("utf-8").rstrip("\n")
+
+
+class Packing(NamedTuple):
+    """Items of a command list per array task, and the task-array it gives"""
+
+    items_per_task: int
+    n_tasks: int
+    task_concurrent: int
+
+
+def get_packing(
+    n_items: int,
+    item_seconds: Optional[Union[float, Sequence[float]]] = None,
+    target_seconds: float = PACKING_TARGET_SECONDS,
+    cores: int = 1,
+    task_concurrent: int = 100,
+) -> Packing:
+    """Choose the items per task, so each task runs for about target_seconds
+
+    item_seconds is an estimate of the runtime of one item, or measured
+    runtimes of which the median is used. With cores, items run in parallel
+    within a task. Items are never packed so tightly that fewer than
+    task_concurrent tasks are left to fill the concurrent slots.
+    """
+
+    if n_items < 1:
+        raise ValueError("Cannot pack an empty command list")
+
+    if item_seconds is not None and not isinstance(item_seconds, (int, float)):
+        item_seconds = statistics.median(item_seconds)
+
+    items_per_task = 1
+    if item_seconds is not None and item_seconds > 0:
+        items_per_task = max(int(target_seconds * cores / item_seconds), 1)
+
+    # Keep enough tasks to use all concurrent slots
+    items_per_task = min(items_per_task, max(math.ceil(n_items / task_concurrent), 1))
+
+    n_tasks = math.ceil(n_items / items_per_task)
+
+    return Packing(items_per_task, n_tasks, min(task_concurrent, n_tasks))
+
+
+def generate_command_dispatch(
+    commands_path: Path,
+    index_path: Path,
+    items_per_task: int = 1,
+    parallel_cores: Optional[int] = None,
+) -> str:
+    """Shell lines that run the commands of $SGE_TASK_ID from a command list
+
+    Task N runs items_per_task commands from item (N - 1) * items_per_task + 1,
+    one after the other, or with parallel_cores at a time. The task exits
+    with an error if any of its commands failed.
+    """
+
+    width = COMMAND_INDEX_WIDTH
+    commands_path_ = shlex.quote(str(commands_path))
+    index_path_ = shlex.quote(str(index_path))
+
+    if items_per_task == 1 and parallel_cores is None:
+        return "\n".join(
+            [
+                f"offset=$(tail -c +$(( (SGE_TASK_ID - 1) * {width + 1} + 1 )) {index_path_} | head -c {width})",
+                f"command=$(tail -c +$(( 10#$offset + 1 )) {commands_path_} | head -n 1)",
+                'eval "$command"',
+            ]
+        )
+
+    lines = [
+        f"first=$(( (SGE_TASK_ID - 1) * {items_per_task} + 1 ))",
+        f"offset=$(tail -c +$(( (first - 1) * {width + 1} + 1 )) {index_path_} | head -c {width})",
+    ]
+    commands = f"tail -c +$(( 10#$offset + 1 )) {commands_path_} | head -n {items_per_task}"
+
+    if parallel_cores is not None:
+        # Commands run in their own shell, so only exported variables are seen
+        lines.append(
+            f"{commands} | xargs -d '\\n' -n 1 -P {parallel_cores} bash -c 'eval \"$1\"' _"
+        )
+        return "\n".join(lines)
+
+    # Commands are read from fd 3, so they can still read stdin
+    lines += [
+        "status=0",
+        "while IFS= read -r command <&3; do",
+        '    eval "$command" || status=$?',
+        f"done 3< <({commands})",
+        "(exit $status)",
+    ]
+
+    return "\n".join(lines)
+
+
+# pylint: disable=too-many-arguments
+def submit_command_list(
+    commands: Iterable[str],
+    scr: Optional[Union[str, Path]] = None,
+    name: str = "UGECommandList",
+    dry: bool = False,
+    item_seconds: Optional[Union[float, Sequence[float]]] = None,
+    target_seconds: float = PACKING_TARGET_SECONDS,
+    parallel: bool = False,
+    task_concurrent: int = 100,
+    **kwargs: Any,
+) -> Tuple[Optional[str], Optional[Path]]:
+    """Submit independent command lines as a single task-array
+
+    The commands are written to scr, which needs to be readable from the
+    nodes. Other arguments are passed to generate_taskarray_script.
+
+    Without item_seconds, each task runs one command. With item_seconds,
+    short commands are packed to run about target_seconds per task, see
+    get_packing, and with parallel, across the cores of the task.
+
+    return:
+        job_id
+        script path
+    """
+
+    if scr is None:
+        scr = "./"
+
+    scr = Path(scr).resolve()
+    scr.mkdir(parents=True, exist_ok=True)
+
+    filename = f"tmp_uge.{generate_name()}"
+    commands_path, index_path, n_commands = write_command_list(commands, scr / filename)
+
+    if n_commands == 0:
+        raise ValueError("Cannot submit an empty command list")
+
+    cores = kwargs.get("cores", 1)
+    packing = get_packing(
+        n_commands,
+        item_seconds=item_seconds,
+        target_seconds=target_seconds,
+        cores=cores if parallel else 1,
+        task_concurrent=task_concurrent,
+    )
+
+    logger.info(
+        f"Submitting {n_commands} commands from {commands_path}, "
+        f"{packing.items_per_task} per task in {packing.n_tasks} tasks"
+    )
+
+    dispatch = generate_command_dispatch(
+        commands_path,
+        index_path,
+        items_per_task=packing.items_per_task,
+        parallel_cores=cores if parallel else None,
+    )
+
+    script = generate_taskarray_script(
+        dispatch,
+        name=name,
+        task_start=1,
+        task_step=1,
+        task_stop=packing.n_tasks,
+        task_concurrent=packing.task_concurrent,
+        **kwargs,
+    )
+
+    return submit_script(script, scr=scr, filename=f"{filename}.sh", dry=dry)
+
+
+# pylint: disable=dangerous-default-value
+async def submit_script_async(
+    submit_script: str,
+    scr: Optional[Union[str, Path]] = None,
+    filename: Optional[str] = None,
+    cmd: str = constants.command_submit,
+    cmd_options: Dict[str, str] = {},
+) -> Tuple[Optional[str], Optional[Path]]:
+    """Submit script from asyncio and return UGE Job ID
+
+    return:
+        job_id
+        script path
+    """
+
+    scr, filename, cmd = _write_submit_script(submit_script, scr, filename, cmd, cmd_options)
+
+    stdout, stderr = await throttle.THROTTLE.call_async(cmd, lambda: execute_async(cmd, cwd=scr))
+
+    return _parse_submit_output(stdout, stderr), scr / filename
+
+
+def _write_submit_script(
+    submit_script: str,
+    scr: Optional[Union[str, Path]],
+    filename: Optional[str],
+    cmd: str,
+    cmd_options: Dict[str, str],
+) -> Tuple[Path, str, str]:
+    """Write the submit script to scr and return scr, filename and submit command"""
+
     if filename is None:
         filename = f"tmp_uge.{generate_name()}.sh"
 
@@ -171,22 +636,20 @@ def submit_script(
     logger.debug(cmd)
     logger.debug(scr)
 
-    if dry:
-        logger.info("Dry submission of qsub command")
-        logger.info(f"cmd={cmd}")
-        logger.info(f"scr={scr}")
-        return None, scr / filename
+    return scr, filename, cmd
+
 
-    stdout, stderr = execute(cmd, cwd=scr)
+def _parse_submit_output(stdout: str, stderr: str) -> Optional[str]:
+    """Find the UGE Job ID in the output of qsub"""
 
     if stderr:
         for line in stderr.split("\n"):
             logger.error(line)
-        return None, scr / filename
+        return None
 
     if not stdout:
         logger.error("Unable to fetch qsub job id from stdout")
-        return None, scr / filename
+        return None
 
     # Successful submission
     # find id
@@ -208,7 +671,7 @@ def submit_script(
 
     logger.info(f"got job_id: {uge_id}")
 
-    return uge_id, scr / filename
+    return uge_id
 
 
 def delete_job(job_id: Optional[str]) -> None:
@@ -216,7 +679,7 @@ def delete_job(job_id: Optional[str]) -> None:
     cmd = f"qdel {job_id}"
     logger.debug(cmd)
 
-    stdout, stderr = execute(cmd)
+    stdout, stderr = throttle.THROTTLE.call(cmd, lambda: execute(cmd))
     stdout = stdout.strip()
     stderr = stderr.strip()
 
@@ -0,0 +1,276 @@
+"""Sets of array task IDs, stored as ranges first-last:step as UGE prints them"""
+
+import bisect
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+# Separators of task ranges in qstat, e.g. "1,3,5-10:1"
+RANGE_SEPARATOR = ","
+STEP_SEPARATOR = ":"
+
+
+class TaskSet:
+    """Immutable set of task IDs, in O(ranges) memory.
+
+    Ranges of the same step and offset are combined as intervals, e.g. the
+    pending and running tasks of one task-array. Sets with mixed steps are
+    combined through their task IDs.
+    """
+
+    __slots__ = ("_ranges", "_starts")
+
+    def __init__(self, ranges: Iterable[range] = ()) -> None:
+        self._ranges: Tuple[range, ...] = _normalize(ranges)
+        self._starts: List[int] = [range_.start for range_ in self._ranges]
+
+    @classmethod
+    def from_string(cls, tasks: Optional[str]) -> "TaskSet":
+        """Parse ja-task-ID strings, e.g. "3", "2-10:1" or "7,9-20:2" """
+
+        if tasks is None:
+            return cls()
+
+        ranges = []
+        for part in str(tasks).split(RANGE_SEPARATOR):
+            part = part.strip()
+            if not part or part.lower() in ("nan", "none", "undefined"):
+                continue
+            ranges.append(parse_range(part))
+
+        return cls(ranges)
+
+    @classmethod
+    def from_ids(cls, task_ids: Union[Iterable[int], np.ndarray]) -> "TaskSet":
+        """Compress task IDs into ranges"""
+
+        if isinstance(task_ids, np.ndarray):
+            ids = task_ids.astype(np.int64)
+        else:
+            ids = np.fromiter(task_ids, dtype=np.int64)
+
+        return cls(_compress(np.unique(ids)))
+
+    @property
+    def ranges(self) -> Tuple[range, ...]:
+        return self._ranges
+
+    def __len__(self) -> int:
+        return sum(len(range_) for range_ in self._ranges)
+
+    def __bool__(self) -> bool:
+        return len(self._ranges) > 0
+
+    def __iter__(self) -> Iterator[int]:
+        for range_ in self._ranges:
+            yield from range_
+
+    def __contains__(self, task_id: object) -> bool:
+        if not isinstance(task_id, (int, np.integer)):
+            return False
+        index = bisect.bisect_right(self._starts, int(task_id)) - 1
+        return index >= 0 and int(task_id) in self._ranges[index]
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, TaskSet):
+            return NotImplemented
+        return len(self) == len(other) and np.array_equal(self.to_numpy(), other.to_numpy())
+
+    def __hash__(self) -> int:
+        return hash(tuple(self.to_numpy().tolist()))
+
+    def __repr__(self) -> str:
+        return f"TaskSet('{self}')"
+
+    def __str__(self) -> str:
+        return RANGE_SEPARATOR.join(format_range(range_) for range_ in self._ranges)
+
+    def to_numpy(self) -> np.ndarray:
+        """Sorted task IDs as an int64 array"""
+
+        if not self._ranges:
+            return np.empty(0, dtype=np.int64)
+
+        return np.concatenate(
+            [np.arange(r.start, r.stop, r.step, dtype=np.int64) for r in self._ranges]
+        )
+
+    def min(self) -> int:
+        return self._ranges[0].start
+
+    def max(self) -> int:
+        return self._ranges[-1][-1]
+
+    def union(self, other: "TaskSet") -> "TaskSet":
+        return _combine(self, other, np.logical_or)
+
+    def difference(self, other: "TaskSet") -> "TaskSet":
+        return _combine(self, other, lambda a, b: a & ~b)
+
+    def intersection(self, other: "TaskSet") -> "TaskSet":
+        return _combine(self, other, np.logical_and)
+
+    __or__ = union
+    __sub__ = difference
+    __and__ = intersection
+
+
+def parse_range(part: str) -> range:
+    """Parse a single range, first[-last[:step]], with last inclusive"""
+
+    range_, _, step = part.partition(STEP_SEPARATOR)
+    first, _, last = range_.partition("-")
+    return range(int(first), int(last or first) + 1, int(step or 1))
+
+
+def format_range(range_: range) -> str:
+    if len(range_) == 1:
+        return str(range_.start)
+    return f"{range_.start}-{range_[-1]}{STEP_SEPARATOR}{range_.step}"
+
+
+def _normalize(ranges: Iterable[range]) -> Tuple[range, ...]:
+    """Sorted, disjoint, non-empty ranges, with the last task as stop - 1"""
+
+    normalized = []
+    for range_ in ranges:
+        if len(range_) == 0:
+            continue
+        if range_.step < 0:
+            range_ = range_[::-1]
+        if len(range_) == 1:
+            range_ = range(range_.start, range_.start + 1)
+        normalized.append(range(range_.start, range_[-1] + 1, range_.step))
+
+    normalized.sort(key=lambda range_: range_.start)
+
+    # Overlapping and adjacent ranges on one grid are merged as intervals
+    grid = _get_grid(normalized)
+    if grid is not None:
+        starts, stops = _to_intervals(normalized, *grid)
+        return tuple(_from_intervals(*_merge_intervals(starts, stops), *grid))
+
+    is_disjoint = all(
+        previous[-1] < range_.start for previous, range_ in zip(normalized, normalized[1:])
+    )
+    if is_disjoint:
+        return tuple(normalized)
+
+    ids = np.concatenate([np.arange(r.start, r.stop, r.step, dtype=np.int64) for r in normalized])
+    return tuple(_compress(np.unique(ids)))
+
+
+def _get_grid(ranges: Sequence[range]) -> Optional[Tuple[int, int]]:
+    """Common step and offset of ranges, if they all lie on one grid"""
+
+    steps = {range_.step for range_ in ranges if len(range_) > 1}
+    if len(steps) > 1:
+        return None
+
+    step = steps.pop() if steps else 1
+    offsets = {range_.start % step for range_ in ranges}
+    if len(offsets) > 1:
+        return None
+
+    return step, offsets.pop() if offsets else 0
+
+
+def _to_intervals(
+    ranges: Sequence[range], step: int, offset: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Half-open intervals of grid indices, task = offset + index * step"""
+
+    starts = np.fromiter(((r.start - offset) // step for r in ranges), dtype=np.int64)
+    lengths = np.fromiter((len(r) for r in ranges), dtype=np.int64)
+    return starts, starts + lengths
+
+
+def _from_intervals(starts: np.ndarray, stops: np.ndarray, step: int, offset: int) -> List[range]:
+    return [
+        range(offset + start * step, offset + (stop - 1) * step + 1, step)
+        for start, stop in zip(starts.tolist(), stops.tolist())
+    ]
+
+
+def _merge_intervals(starts: np.ndarray, stops: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Merge overlapping and adjacent intervals"""
+
+    if len(starts) == 0:
+        return starts, stops
+
+    order = np.argsort(starts, kind="stable")
+    starts = starts[order]
+    stops = stops[order]
+
+    reach = np.maximum.accumulate(stops)
+    is_new = np.ones(len(starts), dtype=bool)
+    is_new[1:] = starts[1:] > reach[:-1]
+
+    first = np.flatnonzero(is_new)
+    return starts[first], np.maximum.reduceat(stops, first)
+
+
+def _combine(a: TaskSet, b: TaskSet, operation) -> TaskSet:
+    """Combine two sets with a boolean operation on membership"""
+
+    grid = _get_grid(a.ranges + b.ranges)
+
+    if grid is None:
+        ids_a = a.to_numpy()
+        ids_b = b.to_numpy()
+        ids = np.union1d(ids_a, ids_b)
+        keep = operation(np.isin(ids, ids_a), np.isin(ids, ids_b))
+        return TaskSet(_compress(ids[keep]))
+
+    starts_a, stops_a = _to_intervals(a.ranges, *grid)
+    starts_b, stops_b = _to_intervals(b.ranges, *grid)
+
+    # Membership is constant between consecutive boundaries
+    bounds = np.unique(np.concatenate([starts_a, stops_a, starts_b, stops_b]))
+    if len(bounds) < 2:
+        return TaskSet()
+
+    segment_starts = bounds[:-1]
+    segment_stops = bounds[1:]
+
+    def _is_covered(starts: np.ndarray, stops: np.ndarray) -> np.ndarray:
+        index = np.searchsorted(starts, segment_starts, side="right") - 1
+        valid = index >= 0
+        covered = np.zeros(len(segment_starts), dtype=bool)
+        covered[valid] = stops[index[valid]] > segment_starts[valid]
+        return covered
+
+    keep = operation(_is_covered(starts_a, stops_a), _is_covered(starts_b, stops_b))
+    starts, stops = _merge_intervals(segment_starts[keep], segment_stops[keep])
+
+    return TaskSet(_from_intervals(starts, stops, *grid))
+
+
+def _compress(ids: np.ndarray) -> List[range]:
+    """Ranges of sorted unique task IDs, on the grid of their greatest common step"""
+
+    if len(ids) == 0:
+        return []
+
+    if len(ids) == 1:
+        return [range(int(ids[0]), int(ids[0]) + 1)]
+
+    diffs = np.diff(ids)
+    step = int(np.gcd.reduce(diffs))
+    step = max(step, 1)
+
+    # A new range starts wherever the gap is larger than the step
+    is_new = np.ones(len(ids), dtype=bool)
+    is_new[1:] = diffs != step
+    first = np.flatnonzero(is_new)
+    last = np.r_[first[1:] - 1, len(ids) - 1]
+
+    starts = ids[first].tolist()
+    stops = ids[last].tolist()
+
+    return [range(start, stop + 1, step) for start, stop in zip(starts, stops)]
+
+
+def count_tasks(tasks: Optional[str]) -> int:
+    """Number of tasks in a ja-task-ID string"""
+    return len(TaskSet.from_string(tasks))
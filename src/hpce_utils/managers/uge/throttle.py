@@ -0,0 +1,378 @@
+"""Rate limiting and circuit breaking of scheduler commands.
+
+Each scheduler command, e.g. qstat, qacct or qsub, has a token bucket and a
+circuit breaker. Their state is stored in the shared memory path of the host
+and updated under a file lock, so all threads and processes of the user on
+the host share the same budget. Without a shared memory path, the state is
+only kept in-process.
+
+Limits are set per command with configure, or as JSON in the
+HPCE_UTILS_UGE_LIMITS environment variable, e.g.
+
+    {"qstat": {"rate": 1, "burst": 5, "failure_threshold": 3, "reset_timeout": 60}}
+
+Commands without limits are run directly.
+"""
+
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import random
+import subprocess
+import threading
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, NamedTuple, Optional, TypeVar
+
+from hpce_utils import env
+
+logger = logging.getLogger(__name__)
+
+ENVIRON_LIMITS = "HPCE_UTILS_UGE_LIMITS"
+
+# Errors of UGE clients that mean qmaster did not answer
+QMASTER_ERRORS = [
+    "commlib error",
+    "unable to contact qmaster",
+    "failed receiving gdi request",
+    "unable to send message to qmaster",
+]
+
+# Growth and cap of the interval between retries
+RETRY_BACKOFF = 2.0
+RETRY_MAX_INTERVAL = 300.0
+
+T = TypeVar("T")
+
+
+class SchedulerBusyError(RuntimeError):
+    """The scheduler command was shed instead of run"""
+
+
+class CircuitOpenError(SchedulerBusyError):
+    """The circuit breaker of the command is open"""
+
+
+class CommandLimits(NamedTuple):
+    """Limits of one scheduler command, None to disable
+
+    rate: Sustained calls per second
+    burst: Calls that can be made at once
+    max_wait: Longest wait for a token, before the call is shed
+    failure_threshold: Consecutive failures that open the circuit
+    reset_timeout: Seconds the circuit stays open, before a single probe call
+    slow_call: Seconds after which a successful call counts as a failure
+    """
+
+    rate: Optional[float] = None
+    burst: float = 1.0
+    max_wait: Optional[float] = None
+    failure_threshold: Optional[int] = None
+    reset_timeout: float = 60.0
+    slow_call: Optional[float] = None
+
+
+def _get_command_limits(limits: Dict[str, Any]) -> CommandLimits:
+    """CommandLimits from a dict, with a ValueError naming any unknown keys"""
+
+    if not isinstance(limits, dict):
+        raise ValueError(f"Limits must be a dict of CommandLimits fields, not {limits!r}")
+
+    unknown = sorted(set(limits) - set(CommandLimits._fields))
+    if unknown:
+        raise ValueError(
+            f"Unknown limits {', '.join(unknown)}, expected {', '.join(CommandLimits._fields)}"
+        )
+
+    return CommandLimits(**limits)
+
+
+def get_command(cmd: str) -> str:
+    """Name of the scheduler command, e.g. qstat for "qstat -j 1 | head" """
+    parts = cmd.split()
+    if not parts:
+        return ""
+    return os.path.basename(parts[0])
+
+
+def is_qmaster_error(exc: BaseException) -> bool:
+    """Did the command fail because qmaster was unreachable or too slow"""
+
+    if isinstance(exc, subprocess.TimeoutExpired):
+        return True
+
+    if isinstance(exc, subprocess.CalledProcessError):
+        stderr = exc.stderr or ""
+        if isinstance(stderr, bytes):
+            stderr = stderr.decode("utf-8", errors="replace")
+        return any(error in stderr for error in QMASTER_ERRORS)
+
+    return False
+
+
+def get_retry_interval(update_interval: float, attempt: int) -> float:
+    """Exponential backoff with full jitter, so retrying clients spread out"""
+    interval = min(update_interval * RETRY_BACKOFF**attempt, RETRY_MAX_INTERVAL)
+    return random.uniform(0.0, interval)
+
+
+class SchedulerThrottle:
+    """Token bucket and circuit breaker per scheduler command, shared on the host"""
+
+    def __init__(
+        self, limits: Optional[Dict[str, CommandLimits]] = None, path: Optional[Path] = None
+    ) -> None:
+        self.limits: Dict[str, CommandLimits] = dict(limits or {})
+        self._path = path
+        self._states: Dict[str, Dict[str, float]] = dict()
+        self._lock = threading.Lock()
+
+    @property
+    def path(self) -> Optional[Path]:
+        """Directory of the shared state, per user"""
+
+        if self._path is not None:
+            return self._path
+
+        shm_path = env.get_shm_path()
+        if shm_path is None:
+            return None
+
+        return shm_path / f"hpce_utils_throttle_{os.getuid()}"
+
+    def configure(self, command: str, **limits) -> None:
+        """Set the limits of command, see CommandLimits"""
+        self.limits[command] = _get_command_limits(limits)
+
+    def _update(self, command: str, update: Callable[[Dict[str, float]], T]) -> T:
+        """Apply update to the state of command, under the thread and file lock"""
+
+        with self._lock:
+
+            path = self.path
+            if path is None:
+                state = self._states.setdefault(command, dict())
+                return update(state)
+
+            path.mkdir(mode=0o700, parents=True, exist_ok=True)
+
+            with open(path / f"{command}.json", "a+") as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    f.seek(0)
+                    try:
+                        state = json.loads(f.read() or "{}")
+                    except ValueError:
+                        state = dict()
+
+                    result = update(state)
+
+                    f.seek(0)
+                    f.truncate()
+                    f.write(json.dumps(state))
+                    f.flush()
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+            return result
+
+    def acquire(self, command: str) -> float:
+        """Reserve a call of command, and return the seconds to wait before calling
+
+        :raises: CircuitOpenError if the circuit is open
+        :raises: SchedulerBusyError if the wait is longer than max_wait
+        """
+
+        limits = self.limits.get(command)
+        if limits is None:
+            return 0.0
+
+        def _acquire(state: Dict[str, float]) -> float:
+            now = time.time()
+
+            if limits.failure_threshold is not None:
+                opened_until = state.get("opened_until", 0.0)
+                if opened_until > now:
+                    raise CircuitOpenError(
+                        f"Circuit of {command} is open for {opened_until - now:.1f}s"
+                    )
+
+                # After the reset timeout, let a single probe through
+                if opened_until > 0.0:
+                    if state.get("probe_until", 0.0) > now:
+                        raise CircuitOpenError(f"Circuit of {command} is probing")
+                    state["probe_until"] = now + limits.reset_timeout
+
+            if limits.rate is None:
+                return 0.0
+
+            # Refill, and reserve a token, which may leave the bucket in debt
+            elapsed = max(now - state.get("time", now), 0.0)
+            tokens = min(limits.burst, state.get("tokens", limits.burst) + elapsed * limits.rate)
+            tokens -= 1.0
+            wait = max(-tokens / limits.rate, 0.0)
+
+            if limits.max_wait is not None and wait > limits.max_wait:
+                raise SchedulerBusyError(f"Rate limit of {command} needs a wait of {wait:.1f}s")
+
+            state["tokens"] = tokens
+            state["time"] = now
+
+            return wait
+
+        return self._update(command, _acquire)
+
+    def record(self, command: str, success: bool) -> None:
+        """Record the outcome of a call of command in its circuit breaker"""
+
+        limits = self.limits.get(command)
+        if limits is None or limits.failure_threshold is None:
+            return
+
+        threshold = limits.failure_threshold
+
+        def _record(state: Dict[str, float]) -> None:
+            if success:
+                if state.get("opened_until", 0.0) > 0.0:
+                    logger.info(f"Circuit of {command} is closed")
+                state["failures"] = 0
+                state["opened_until"] = 0.0
+                state["probe_until"] = 0.0
+                return
+
+            failures = state.get("failures", 0) + 1
+            state["failures"] = failures
+
+            is_probe = state.get("opened_until", 0.0) > 0.0
+            if is_probe or failures >= threshold:
+                logger.warning(f"Opening circuit of {command} for {limits.reset_timeout}s")
+                state["opened_until"] = time.time() + limits.reset_timeout
+                state["probe_until"] = 0.0
+
+        self._update(command, _record)
+
+    def _is_failure(self, command: str, exc: Optional[BaseException], duration: float) -> bool:
+        if exc is not None:
+            return is_qmaster_error(exc)
+
+        limits = self.limits.get(command)
+        slow_call = limits.slow_call if limits is not None else None
+
+        return slow_call is not None and duration > slow_call
+
+    def call(self, cmd: str, run: Callable[[], T]) -> T:
+        """Run the scheduler command cmd through run, within the limits of the command"""
+
+        command = get_command(cmd)
+
+        wait = self.acquire(command)
+        if wait > 0:
+            logger.debug(f"Waiting {wait:.2f}s for rate limit of {command}")
+            time.sleep(wait)
+
+        start = time.monotonic()
+        try:
+            result = run()
+        except BaseException as exc:
+            self.record(command, not self._is_failure(command, exc, 0.0))
+            raise
+
+        self.record(command, not self._is_failure(command, None, time.monotonic() - start))
+
+        return result
+
+    async def call_async(self, cmd: str, run: Callable[[], Awaitable[T]]) -> T:
+        """Asyncio version of call"""
+
+        command = get_command(cmd)
+
+        wait = self.acquire(command)
+        if wait > 0:
+            logger.debug(f"Waiting {wait:.2f}s for rate limit of {command}")
+            await asyncio.sleep(wait)
+
+        start = time.monotonic()
+        try:
+            result = await run()
+        except BaseException as exc:
+            self.record(command, not self._is_failure(command, exc, 0.0))
+            raise
+
+        self.record(command, not self._is_failure(command, None, time.monotonic() - start))
+
+        return result
+
+    def call_with_retry(
+        self,
+        cmd: str,
+        run: Callable[[], T],
+        max_retries: int = 3,
+        update_interval: float = 5.0,
+    ) -> T:
+        """Call with retries on failure, backing off exponentially with jitter
+
+        Calls shed by the throttle are not retried.
+        """
+
+        attempt = 0
+        while True:
+            try:
+                return self.call(cmd, run)
+            except (subprocess.TimeoutExpired, subprocess.CalledProcessError) as exc:
+                if attempt >= max_retries:
+                    logger.error(f"Max retries reached for command {cmd}")
+                    raise exc
+
+                interval = get_retry_interval(update_interval, attempt)
+                logger.warning(f"Error while executing {cmd}. Try again in {interval:.1f}s.")
+                time.sleep(interval)
+                attempt += 1
+
+    async def call_with_retry_async(
+        self,
+        cmd: str,
+        run: Callable[[], Awaitable[T]],
+        max_retries: int = 3,
+        update_interval: float = 5.0,
+    ) -> T:
+        """Asyncio version of call_with_retry"""
+
+        attempt = 0
+        while True:
+            try:
+                return await self.call_async(cmd, run)
+            except (subprocess.TimeoutExpired, subprocess.CalledProcessError) as exc:
+                if attempt >= max_retries:
+                    logger.error(f"Max retries reached for command {cmd}")
+                    raise exc
+
+                interval = get_retry_interval(update_interval, attempt)
+                logger.warning(f"Error while executing {cmd}. Try again in {interval:.1f}s.")
+                await asyncio.sleep(interval)
+                attempt += 1
+
+
+def _parse_limits(text: Optional[str]) -> Dict[str, CommandLimits]:
+    if not text:
+        return dict()
+
+    try:
+        config = json.loads(text)
+        if not isinstance(config, dict):
+            raise ValueError(f"Expected an object of commands, not {config!r}")
+        return {command: _get_command_limits(limits) for command, limits in config.items()}
+    except ValueError as exc:
+        logger.error(
+            f"Unable to parse {ENVIRON_LIMITS}, scheduler commands are not limited: {exc}"
+        )
+        return dict()
+
+
+def get_limits_from_environ() -> Dict[str, CommandLimits]:
+    """Limits per command from the HPCE_UTILS_UGE_LIMITS environment variable"""
+    return _parse_limits(os.environ.get(ENVIRON_LIMITS))
+
+
+THROTTLE = SchedulerThrottle(get_limits_from_environ())
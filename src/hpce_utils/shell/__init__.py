@@ -1,10 +1,14 @@
+import asyncio
 import logging
 import os
+import shlex
 import shutil
 import subprocess
 import time
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple, Union
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+from hpce_utils.shell import timing
 
 logger = logging.getLogger(__name__)
 
@@ -54,6 +58,8 @@ def stream(cmd: str, cwd: Optional[Path] = None, shell: bool = True):
     if not switch_workdir(cwd):
         cwd = None
 
+    measurement = timing.measure(cmd)
+
     popen = subprocess.Popen(
         cmd,
         stdout=subprocess.PIPE,
@@ -63,12 +69,20 @@ def stream(cmd: str, cwd: Optional[Path] = None, shell: bool = True):
         cwd=cwd,
     )
 
+    output_size = 0
     for stdout_line in iter(popen.stdout.readline, ""):  # type: ignore
+        output_size += len(stdout_line)
         yield stdout_line
 
     # Yield errors
     stderr = popen.stderr.read()  # type: ignore
     popen.stdout.close()  # type: ignore
+
+    if timing.TIMINGS.enabled:
+        measurement.set_output(popen.wait(), stderr)
+        measurement.output_bytes += output_size
+        measurement.close()
+
     yield stderr
 
     return
@@ -96,39 +110,44 @@ def execute(
     if not switch_workdir(cwd):
         cwd = None
 
-    try:
-        process = subprocess.run(
-            cmd,
-            cwd=cwd,
-            encoding="utf-8",
-            shell=shell,
-            check=check,
-            capture_output=True,
-            timeout=timeout,
-        )
-    except subprocess.CalledProcessError as exc:
-        logger.error("Command %s failed", cmd)
-        logger.error("stdout: %s", exc.stdout)
-        logger.error("stderr: %s", exc.stderr)
-        logger.error("returncode: %s", exc.returncode)
-        raise exc
-
-    except FileNotFoundError as exc:
-        logger.error("Command %s not found:", cmd)
-        if check:
+    with timing.measure(cmd) as measurement:
+        try:
+            process = subprocess.run(
+                cmd,
+                cwd=cwd,
+                encoding="utf-8",
+                shell=shell,
+                check=check,
+                capture_output=True,
+                timeout=timeout,
+            )
+        except subprocess.CalledProcessError as exc:
+            logger.error("Command %s failed", cmd)
+            logger.error("stdout: %s", exc.stdout)
+            logger.error("stderr: %s", exc.stderr)
+            logger.error("returncode: %s", exc.returncode)
             raise exc
-        else:
-            return "", ""
 
-    except subprocess.TimeoutExpired as exc:
-        logger.error("Command %s timed out:", cmd)
-        if check:
-            raise exc
-        else:
-            stderr = "" if exc.stderr is None else exc.stderr.decode("utf-8")
-            stdout = "" if exc.stdout is None else exc.stdout.decode("utf-8")
+        except FileNotFoundError as exc:
+            logger.error("Command %s not found:", cmd)
+            if check:
+                raise exc
+            else:
+                measurement.set_output(timing.RETURNCODE_NOT_FOUND)
+                return "", ""
 
-            return stdout, stderr
+        except subprocess.TimeoutExpired as exc:
+            logger.error("Command %s timed out:", cmd)
+            if check:
+                raise exc
+            else:
+                stderr = "" if exc.stderr is None else exc.stderr.decode("utf-8")
+                stdout = "" if exc.stdout is None else exc.stdout.decode("utf-8")
+
+                measurement.set_output(timing.RETURNCODE_TIMEOUT, stdout, stderr)
+                return stdout, stderr
+
+        measurement.set_output(process.returncode, process.stdout, process.stderr)
 
     return process.stdout, process.stderr
 
@@ -167,6 +186,80 @@ def execute_with_retry(
                 logger.error("Max retries reached for command %s", cmd)
                 raise exc
             num_retries += 1
+            timing.TIMINGS.record_retry(cmd)
+
+
+async def execute_async(
+    cmd: Union[str, Sequence[str]],
+    cwd: Optional[Path] = None,
+    timeout: Optional[float] = None,
+    check: bool = True,
+) -> Tuple[str, str]:
+    """Execute command without a shell from asyncio, and return stdout and stderr
+
+    If the awaiting task is cancelled, or the timeout is reached, the process
+    is killed.
+
+    :param cmd: The command, split with shlex if it is a string
+    :param cwd: Change directory to work directory
+    :param timeout: Stop the process at timeout (seconds)
+    :param check: Raise if the command fails
+    :returns: stdout and stderr as string
+    :raises: subprocess.CalledProcessError if check is True and command fails
+    :raises: subprocess.TimeoutExpired if timeout is reached
+    :raises: FileNotFoundError if check is True and command is not found
+    """
+
+    if not switch_workdir(cwd):
+        cwd = None
+
+    args = shlex.split(cmd) if isinstance(cmd, str) else list(cmd)
+
+    with timing.measure(args) as measurement:
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *args,
+                cwd=cwd,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+            )
+        except FileNotFoundError as exc:
+            logger.error("Command %s not found:", cmd)
+            if check:
+                raise exc
+            measurement.set_output(timing.RETURNCODE_NOT_FOUND)
+            return "", ""
+
+        try:
+            bstdout, bstderr = await asyncio.wait_for(process.communicate(), timeout=timeout)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            logger.error("Command %s timed out:", cmd)
+            if check:
+                raise subprocess.TimeoutExpired(args, timeout or 0)
+            measurement.set_output(timing.RETURNCODE_TIMEOUT)
+            return "", ""
+        except asyncio.CancelledError:
+            process.kill()
+            await process.wait()
+            raise
+
+        stdout = bstdout.decode("utf-8")
+        stderr = bstderr.decode("utf-8")
+
+        returncode = process.returncode or 0
+
+        if check and returncode != 0:
+            logger.error("Command %s failed", cmd)
+            logger.error("stdout: %s", stdout)
+            logger.error("stderr: %s", stderr)
+            logger.error("returncode: %s", returncode)
+            raise subprocess.CalledProcessError(returncode, args, stdout, stderr)
+
+        measurement.set_output(returncode, stdout, stderr)
+
+    return stdout, stderr
 
 
 def source(bashfile):
@@ -0,0 +1,277 @@
+"""Opt-in timing of subprocess calls, as latency histograms per command category.
+
+Enable with enable(), or with the HPCE_UTILS_SHELL_TIMING environment
+variable. Set it to 1 to collect in memory, or to a path to also write the
+timings as JSON when the interpreter exits.
+
+usage:
+    from hpce_utils.shell import timing
+
+    timing.enable()
+    ...
+    print(timing.TIMINGS.format_summary())
+    timing.TIMINGS.write_json("timings.json")
+"""
+
+import atexit
+import bisect
+import json
+import os
+import subprocess
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+ENVIRON_TIMING = "HPCE_UTILS_SHELL_TIMING"
+
+# Upper bounds of the latency buckets, in seconds
+LATENCY_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    300.0,
+)
+
+# Commands that belong to the same category
+CATEGORY_ALIASES = {
+    "module": "lmod",
+    "ml": "lmod",
+}
+
+# Return codes recorded for timed out and missing commands
+RETURNCODE_TIMEOUT = "timeout"
+RETURNCODE_NOT_FOUND = 127
+
+PROMETHEUS_PREFIX = "hpce_shell_command"
+
+
+def get_category(cmd: Union[str, Sequence[Any]]) -> str:
+    """Category of a command, the name of its executable, e.g. qstat for "qstat -j 1" """
+
+    if isinstance(cmd, str):
+        parts = cmd.split()
+    else:
+        parts = [str(part) for part in cmd]
+
+    if not parts:
+        return ""
+
+    name = os.path.basename(parts[0])
+
+    return CATEGORY_ALIASES.get(name, name)
+
+
+class CommandHistogram:
+    """Latency histogram, return codes and output size of one command category
+
+    Output size is the length of stdout and stderr, in characters for text.
+    """
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.retries = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.output_bytes = 0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.returncodes: Counter = Counter()
+
+    def add(self, seconds: float, returncode: Union[int, str, None], output_bytes: int) -> None:
+        self.count += 1
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        self.output_bytes += output_bytes
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.returncodes[str(returncode)] += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket of the q-quantile, max_seconds for the last bucket"""
+
+        if self.count == 0:
+            return None
+
+        rank = q * self.count
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS, self.buckets):
+            cumulative += count
+            if cumulative >= rank:
+                return min(bound, self.max_seconds)
+
+        return self.max_seconds
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "retries": self.retries,
+            "total_seconds": self.total_seconds,
+            "mean_seconds": self.total_seconds / self.count if self.count else None,
+            "p50_seconds": self.quantile(0.5),
+            "p95_seconds": self.quantile(0.95),
+            "max_seconds": self.max_seconds,
+            "output_bytes": self.output_bytes,
+            "returncodes": dict(self.returncodes),
+            "buckets": dict(
+                zip([str(bound) for bound in LATENCY_BUCKETS] + ["+Inf"], self.buckets)
+            ),
+        }
+
+
+class CommandTimings:
+    """Thread-safe collection of histograms, keyed by command category"""
+
+    def __init__(self, enabled: bool = False) -> None:
+        self.enabled = enabled
+        self._histograms: Dict[str, CommandHistogram] = dict()
+        self._lock = threading.Lock()
+
+    def record(
+        self,
+        cmd: Union[str, Sequence[Any]],
+        seconds: float,
+        returncode: Union[int, str, None],
+        output_bytes: int = 0,
+    ) -> None:
+        if not self.enabled:
+            return
+
+        category = get_category(cmd)
+        with self._lock:
+            histogram = self._histograms.setdefault(category, CommandHistogram())
+            histogram.add(seconds, returncode, output_bytes)
+
+    def record_retry(self, cmd: Union[str, Sequence[Any]]) -> None:
+        if not self.enabled:
+            return
+
+        category = get_category(cmd)
+        with self._lock:
+            self._histograms.setdefault(category, CommandHistogram()).retries += 1
+
+    def reset(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+
+    def to_dict(self) -> Dict[str, Dict[str, Any]]:
+        """Histograms per category, sorted by total time"""
+
+        with self._lock:
+            histograms = sorted(
+                self._histograms.items(), key=lambda item: item[1].total_seconds, reverse=True
+            )
+            return {category: histogram.to_dict() for category, histogram in histograms}
+
+    def write_json(self, path: Union[str, Path]) -> None:
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def format_summary(self) -> str:
+        """Table of the categories, sorted by total time"""
+
+        header = f"{'command':<16}{'calls':>8}{'retries':>9}{'total s':>10}{'mean s':>9}{'p95 s':>9}{'max s':>9}{'MB out':>9}"
+        lines = [header]
+
+        for category, stats in self.to_dict().items():
+            lines.append(
+                f"{category[:15]:<16}{stats['count']:>8}{stats['retries']:>9}"
+                f"{stats['total_seconds']:>10.2f}{stats['mean_seconds'] or 0.0:>9.3f}"
+                f"{stats['p95_seconds'] or 0.0:>9.3f}{stats['max_seconds']:>9.3f}"
+                f"{stats['output_bytes'] / 1e6:>9.2f}"
+            )
+
+        return "\n".join(lines)
+
+    def format_prometheus(self) -> str:
+        """Histograms in the Prometheus text exposition format"""
+
+        name = f"{PROMETHEUS_PREFIX}_duration_seconds"
+        lines: List[str] = [
+            f"# HELP {name} Wall time of subprocess calls",
+            f"# TYPE {name} histogram",
+        ]
+
+        histograms = self.to_dict()
+        for category, stats in histograms.items():
+            cumulative = 0
+            for bound, count in stats["buckets"].items():
+                cumulative += count
+                lines.append(f'{name}_bucket{{command="{category}",le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_sum{{command="{category}"}} {stats["total_seconds"]}')
+            lines.append(f'{name}_count{{command="{category}"}} {stats["count"]}')
+
+        name = f"{PROMETHEUS_PREFIX}_output_bytes_total"
+        lines += [f"# HELP {name} Bytes written by subprocess calls", f"# TYPE {name} counter"]
+        for category, stats in histograms.items():
+            lines.append(f'{name}{{command="{category}"}} {stats["output_bytes"]}')
+
+        return "\n".join(lines) + "\n"
+
+
+class Measurement:
+    """Time a single subprocess call, and record it when closed"""
+
+    def __init__(self, cmd: Union[str, Sequence[Any]]) -> None:
+        self.cmd = cmd
+        self.returncode: Union[int, str, None] = None
+        self.output_bytes = 0
+        self._start = time.perf_counter()
+
+    def set_output(self, returncode: Union[int, str, None], *outputs: Optional[Any]) -> None:
+        self.returncode = returncode
+        self.output_bytes = sum(len(output) for output in outputs if output)
+
+    def close(self) -> None:
+        TIMINGS.record(
+            self.cmd, time.perf_counter() - self._start, self.returncode, self.output_bytes
+        )
+
+    def __enter__(self) -> "Measurement":
+        return self
+
+    def __exit__(self, exc_type, exc, traceback) -> None:
+        if isinstance(exc, subprocess.CalledProcessError):
+            self.set_output(exc.returncode, exc.stdout, exc.stderr)
+        elif isinstance(exc, subprocess.TimeoutExpired):
+            self.set_output(RETURNCODE_TIMEOUT, exc.stdout, exc.stderr)
+        elif isinstance(exc, FileNotFoundError):
+            self.set_output(RETURNCODE_NOT_FOUND)
+        self.close()
+
+
+def _get_environ_setting() -> Optional[str]:
+    value = os.environ.get(ENVIRON_TIMING, "").strip()
+    if value.lower() in ("", "0", "false", "no"):
+        return None
+    return value
+
+
+def enable() -> None:
+    TIMINGS.enabled = True
+
+
+def disable() -> None:
+    TIMINGS.enabled = False
+
+
+def measure(cmd: Union[str, Sequence[Any]]) -> Measurement:
+    return Measurement(cmd)
+
+
+_environ_setting = _get_environ_setting()
+
+TIMINGS = CommandTimings(enabled=_environ_setting is not None)
+
+# Any other value than a flag is the path of the timings written at exit
+if _environ_setting is not None and _environ_setting.lower() not in ("1", "true", "yes"):
+    atexit.register(TIMINGS.write_json, _environ_setting)
@@ -1,4 +1,7 @@
+import getpass
+import os
 import shutil
+import subprocess
 import tempfile
 from pathlib import Path
 from typing import Generator
@@ -25,3 +28,21 @@ def home_tmp_path() -> Generator[Path, None, None]:
     # Force clean
     shutil.rmtree(tmp_path)
     assert not tmp_path.is_dir()
+
+
+@pytest.fixture
+def fake_uge(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Generator[Path, None, None]:
+    """Put the local fake UGE commands on PATH, with a fresh state store"""
+
+    from hpce_utils.managers.uge import fake
+
+    state_path = tmp_path / "fake_uge"
+    bin_dir = fake.install(tmp_path / "bin", state_path)
+
+    monkeypatch.setenv("PATH", f"{bin_dir}:{os.environ['PATH']}")
+    monkeypatch.setenv(fake.ENVIRON_STATE, str(state_path))
+    monkeypatch.setenv(fake.ENVIRON_SLOTS, "4")
+
+    yield state_path
+
+    subprocess.run(["qdel", "-u", getpass.getuser()], capture_output=True)
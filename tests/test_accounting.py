@@ -0,0 +1,147 @@
+from pathlib import Path
+from unittest.mock import patch
+
+import pandas as pd  # type: ignore
+import pytest
+
+from hpce_utils.managers.uge import accounting, status
+
+# Comment lines of the header end in a blank, as written by the scheduler
+HEADER = "\n".join(["# Version: 8.1.9", "# ", "# DO NOT MODIFY THIS FILE MANUALLY!", "# ", ""])
+
+
+def _accounting_line(job_number: int, task_number: int, exit_status: int = 0) -> str:
+    values = [
+        "all.q",
+        f"node{task_number:03d}",
+        "users",
+        "username",
+        "job",
+        str(job_number),
+        "sge",
+        "0",
+        "1747646295",
+        "1747646300",
+        "1747646360",
+        "0",
+        str(exit_status),
+        "60.0",
+    ]
+    values += ["0"] * (len(accounting.ACCOUNTING_FIELDS) - len(values))
+    values[accounting.ACCOUNTING_FIELDS.index("task_number")] = str(task_number)
+    return ":".join(values) + "\n"
+
+
+@pytest.fixture
+def accounting_file(tmp_path: Path) -> Path:
+    path = tmp_path / "accounting"
+    lines = [HEADER]
+    lines += [_accounting_line(100, task) for task in range(1, 4)]
+    lines += [_accounting_line(101, 1, exit_status=1)]
+    lines += [_accounting_line(100, 4)]
+    path.write_text("".join(lines))
+    return path
+
+
+def test_accounting_index(tmp_path: Path, accounting_file: Path):
+
+    index = accounting.AccountingIndex(accounting_file, tmp_path / "index" / "accounting.idx")
+
+    assert index.update() == 5
+    assert index.update() == 0
+
+    records = index.read_job(100)
+    assert [record["task_number"] for record in records] == ["1", "2", "3", "4"]
+    assert index.read_job(101)[0]["exit_status"] == "1"
+    assert index.read_job(102) == []
+
+    # Appended lines are indexed from the checkpoint, a partial line is left for later
+    partial_line = _accounting_line(102, 1)
+    with open(accounting_file, "a") as f:
+        f.write(_accounting_line(101, 2))
+        f.write(partial_line[:20])
+
+    assert index.update() == 1
+    assert len(index.read_job(101)) == 2
+
+    with open(accounting_file, "a") as f:
+        f.write(partial_line[20:])
+
+    assert index.update() == 1
+    assert len(index.read_job(102)) == 1
+
+    # A new index instance reads the persisted index
+    index_ = accounting.AccountingIndex(accounting_file, index.index_path)
+    assert index_.update() == 0
+    assert len(index_.read_job(100)) == 4
+
+    # Rotated accounting file is re-indexed
+    rotated_file = tmp_path / "accounting.new"
+    rotated_file.write_text(HEADER + _accounting_line(200, 1))
+    rotated_file.replace(accounting_file)
+
+    assert index_.update() == 1
+    assert index_.read_job(100) == []
+    assert len(index_.read_job(200)) == 1
+
+
+@pytest.mark.parametrize("tail_min", [0, 4096])
+def test_accounting_index_load_appended(
+    tmp_path: Path, accounting_file: Path, monkeypatch: pytest.MonkeyPatch, tail_min: int
+):
+
+    # Records appended to the index are loaded apart, or merged into the loaded index
+    monkeypatch.setattr(accounting, "INDEX_TAIL_MIN", tail_min)
+    index = accounting.AccountingIndex(accounting_file, tmp_path / "accounting.idx")
+    assert len(index.read_lines(100)) == 4
+
+    with open(accounting_file, "a") as f:
+        f.write(_accounting_line(99, 1))
+        f.write(_accounting_line(100, 5))
+
+    with patch.object(accounting, "_sort_index", wraps=accounting._sort_index) as mock_sort:
+        lines = index.read_lines(100)
+
+    # Only the appended records are sorted
+    assert len(mock_sort.call_args.args[0]) == 2
+    assert [accounting.parse_accounting_line(line)["task_number"] for line in lines] == [
+        "1",
+        "2",
+        "3",
+        "4",
+        "5",
+    ]
+    assert len(index.read_lines(99)) == 1
+    assert len(index._tail_jobs) == (0 if tail_min == 0 else 2)
+
+
+def test_get_qacctj_from_accounting(
+    tmp_path: Path, accounting_file: Path, monkeypatch: pytest.MonkeyPatch
+):
+
+    monkeypatch.setenv(accounting.ENVIRON_ACCOUNTING, str(accounting_file))
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+
+    qacctj, _ = status.get_qacctj("100")
+    assert len(qacctj) == 4
+    assert list(qacctj["jobnumber"].unique()) == ["100"]
+    assert list(qacctj["taskid"]) == ["1", "2", "3", "4"]
+
+    assert status._uge_is_job_done("100", cross_check=True, n_total_jobs=4, status_j={})
+    assert not status._uge_is_job_done("101", cross_check=True, n_total_jobs=4, status_j={})
+
+
+def test_read_accounting(accounting_file: Path):
+
+    pdf = accounting.read_accounting(accounting_file)
+
+    assert len(pdf) == 5
+    assert pdf["jobnumber"].tolist() == [100, 100, 100, 101, 100]
+    assert pdf["exit_status"].tolist() == [0, 0, 0, 1, 0]
+    assert pdf["hostname"].dtype == "category"
+    assert pdf["start_time"][0] == pd.Timestamp("2025-05-19 09:18:20")
+    assert pdf["ru_wallclock"].sum() == 300.0
+
+    index = accounting.AccountingIndex(accounting_file, accounting_file.with_suffix(".idx"))
+    pdf = accounting.get_job(101, index=index, typed=True)
+    assert pdf["taskid"].tolist() == [1]
@@ -0,0 +1,62 @@
+import getpass
+import math
+import operator
+import os
+import subprocess
+import time
+from pathlib import Path
+
+import pytest
+
+import hpce_utils
+from hpce_utils.managers.uge.executor import TaskError, UGEExecutor
+
+
+@pytest.fixture
+def fake_uge_python(fake_uge: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    """Make hpce_utils importable by the tasks, as when installed on the nodes"""
+    monkeypatch.setenv("PYTHONPATH", str(Path(hpce_utils.__file__).parent.parent))
+    return fake_uge
+
+
+def test_executor_map(fake_uge_python: Path, tmp_path: Path):
+
+    with UGEExecutor(tmp_path / "scr", poll_interval=0.1) as executor:
+        results = list(executor.map(operator.mul, range(7), range(7), chunksize=3))
+        assert results == [i * i for i in range(7)]
+
+        # Exceptions of the function are raised from the futures
+        future = executor.submit(math.sqrt, -1)
+        with pytest.raises(ValueError):
+            future.result(timeout=30)
+
+        future = executor.submit(int, "ff", base=16)
+        assert future.result(timeout=30) == 255
+
+    # Only the array with a failed call is kept, to debug it
+    assert len(list((tmp_path / "scr").glob("executor.*"))) == 1
+
+
+def test_executor_task_failure(fake_uge_python: Path, tmp_path: Path):
+
+    with UGEExecutor(tmp_path / "scr", poll_interval=0.1, keep_files=True) as executor:
+
+        # The task exits before writing its result
+        future = executor.submit(os._exit, 3)
+
+        with pytest.raises(TaskError, match="exited with 3"):
+            future.result(timeout=30)
+
+        assert list(executor.map(abs, [])) == []
+
+
+def test_executor_deleted_task(fake_uge_python: Path, tmp_path: Path):
+
+    with UGEExecutor(tmp_path / "scr", poll_interval=0.1, check_interval=0.2) as executor:
+
+        future = executor.submit(time.sleep, 60)
+        time.sleep(0.5)
+        subprocess.run(["qdel", "-u", getpass.getuser()], capture_output=True)
+
+        with pytest.raises(TaskError, match="left qstat"):
+            future.result(timeout=30)
@@ -0,0 +1,251 @@
+import json
+import subprocess
+import threading
+import time
+from pathlib import Path
+from typing import List, Union
+from unittest.mock import patch
+
+from hpce_utils.managers.uge import fake, status, submitting
+
+
+def _wait_for_state(job_id: str, state: str, timeout: float = 10) -> None:
+    start_time = time.monotonic()
+    while time.monotonic() - start_time < timeout:
+        stdout = subprocess.run(["qstat"], capture_output=True, text=True).stdout
+        if f" {state} " in stdout and job_id in stdout:
+            return
+        time.sleep(0.1)
+    raise TimeoutError(f"Job {job_id} never reached state {state}")
+
+
+def test_format_task_ranges():
+
+    assert fake.format_task_ranges([1, 2, 3, 5, 7, 9, 10], 1) == "1-3:1,5,7,9-10:1"
+    assert fake.format_task_ranges([1, 3, 5, 8], 2) == "1-5:2,8"
+    assert fake.format_task_ranges([], 1) == ""
+
+
+def test_fake_taskarray(fake_uge: Path, tmp_path: Path):
+
+    log_dir = tmp_path / "uge_testlogs"
+    script = submitting.generate_taskarray_script(
+        "echo task ${SGE_TASK_ID} of ${SGE_TASK_LAST}",
+        cores=1,
+        cwd=tmp_path,
+        log_dir=log_dir,
+        name="TestJob",
+        task_concurrent=2,
+        task_stop=3,
+    )
+
+    job_id, _ = submitting.submit_script(script, scr=tmp_path)
+    assert job_id is not None
+
+    finished = list(status.wait_for_jobs([job_id], respiratory=1))
+    assert finished == [job_id]
+
+    stdout, stderr = submitting.read_logfiles(log_dir, job_id, ignore_stdout=False)
+    assert len(stdout) == 3
+    assert len(stderr) == 0
+    assert sorted(lines[0] for lines in stdout.values()) == [f"task {i} of 3" for i in (1, 2, 3)]
+
+    # Finished tasks are in the accounting
+    pdf, _ = status.get_qacctj(job_id)
+    assert len(pdf) == 3
+    assert set(pdf["exit_status"]) == {"0"}
+    assert set(pdf["jobname"]) == {"TestJob"}
+
+
+def test_fake_qstat(fake_uge: Path, tmp_path: Path):
+
+    script = submitting.generate_taskarray_script(
+        "sleep 30",
+        cores=1,
+        cwd=tmp_path,
+        log_dir=tmp_path / "log",
+        name="SlowJob",
+        task_concurrent=1,
+        task_stop=4,
+    )
+    job_id, _ = submitting.submit_script(script, scr=tmp_path)
+    assert job_id is not None
+    _wait_for_state(job_id, "r")
+
+    for xml in [True, False]:
+        pdf, _ = status.get_qstat("\\*", xml=xml)
+        row = pdf[pdf["job"] == job_id].iloc[0]
+        assert row["running"] == 1
+        assert row["pending"] == 3
+
+    task_ids, _ = status.get_qstat_task_ids("\\*")
+    row = task_ids[task_ids["job"] == job_id].iloc[0]
+    assert str(row["running"]) == "1"
+    assert str(row["pending"]) == "2-4:1"
+
+    qstatj, _ = status.get_qstatj(job_id)
+    assert qstatj["job_number"] == job_id
+    assert qstatj["job-array tasks"] == "1-4:1"
+    assert qstatj["job_state             1"].strip() == "r"
+
+    submitting.delete_job(job_id)
+    qstatjs, _ = status.get_qstatj_bulk([job_id])
+    assert qstatjs[job_id] == dict()
+
+
+def test_fake_error_state(fake_uge: Path, tmp_path: Path):
+
+    log_dir = tmp_path / "missing" / "log"
+    script = f"#!/bin/bash\n#$ -N BrokenJob\n#$ -t 1-1:1\n#$ -o {log_dir}/\necho never\n"
+
+    job_id, _ = submitting.submit_script(script, scr=tmp_path)
+    assert job_id is not None
+    _wait_for_state(job_id, "Eqw")
+
+    qstatj, _ = status.get_qstatj(job_id)
+    errors = status._get_errors_from_qstatj(qstatj)
+    assert len(errors) == 1
+    assert "can't make directory" in errors[0]
+
+
+def test_fake_hold_job(fake_uge: Path, tmp_path: Path):
+
+    script = submitting.generate_taskarray_script(
+        "sleep 1", cores=1, cwd=tmp_path, log_dir=tmp_path / "log", name="First", task_stop=1
+    )
+    job_id, _ = submitting.submit_script(script, scr=tmp_path)
+    assert job_id is not None
+
+    finished_file = status.wait_for_jobs_using_hold_job(
+        [job_id], scr=tmp_path, log_dir=tmp_path / "log", update_interval=1
+    )
+    assert finished_file.exists()
+
+    # The hold job only ran after the job it waited for
+    pdf, _ = status.get_qacctj(job_id)
+    assert len(pdf) == 1
+    assert finished_file.stat().st_mtime >= float(
+        time.mktime(time.strptime(pdf["end_time"][0][:19], "%m/%d/%Y %H:%M:%S"))
+    )
+
+
+def test_fake_follow_progress_summary(fake_uge: Path, tmp_path: Path, caplog):
+
+    # Tasks wait for the gate, so all arrays are still queued when following starts
+    gate = tmp_path / "gate"
+    job_ids: List[Union[int, str]] = []
+    for i in range(status.MAX_PROGRESS_BARS + 1):
+        script = submitting.generate_taskarray_script(
+            f"while [ ! -f {gate} ]; do sleep 0.1; done",
+            cores=1,
+            log_dir=tmp_path / "log",
+            name=f"Job{i}",
+            task_stop=2,
+        )
+        job_id, _ = submitting.submit_script(script, scr=tmp_path)
+        assert job_id is not None
+        job_ids.append(job_id)
+
+    timer = threading.Timer(1, gate.touch)
+    timer.start()
+
+    # More arrays than MAX_PROGRESS_BARS, so one summary bar for all
+    with patch.object(status, "ProgressRenderer", wraps=status.ProgressRenderer) as renderer:
+        status.follow_progress(username="\\*", job_ids=job_ids, update_interval=1)
+
+    timer.join()
+    assert "No task-array jobs" not in caplog.text
+    assert renderer.call_args.kwargs["summary"] is True
+    assert len(renderer.call_args.args[0]) == len(job_ids)
+
+    qstatjs, _ = status.get_qstatj_bulk(job_ids)
+    assert all(qstatj == dict() for qstatj in qstatjs.values())
+
+
+def test_fake_follow_progress_headless(fake_uge: Path, tmp_path: Path, capsys):
+
+    gate = tmp_path / "gate"
+    script = submitting.generate_taskarray_script(
+        f"while [ ! -f {gate} ]; do sleep 0.1; done",
+        cores=1,
+        log_dir=tmp_path / "log",
+        name="Headless",
+        task_stop=6,
+    )
+    job_id, _ = submitting.submit_script(script, scr=tmp_path)
+    assert job_id is not None
+
+    timer = threading.Timer(1, gate.touch)
+    timer.start()
+
+    metrics_path = tmp_path / "progress.jsonl"
+    status.follow_progress(
+        username="\\*",
+        job_ids=[job_id],
+        update_interval=1,
+        headless=True,
+        metrics_path=metrics_path,
+    )
+    timer.join()
+
+    # No progress bars, only metrics
+    assert f"{job_id} (" not in capsys.readouterr().err
+
+    records = [json.loads(line) for line in metrics_path.read_text().splitlines()]
+    assert len(records) >= 2
+    assert {record["job"] for record in records} == {job_id}
+    assert records[0]["pending"] + records[0]["running"] == 6
+    assert records[-1]["finished"] == records[-1]["total"] == 6
+
+
+def test_fake_follow_task_markers_killed(fake_uge: Path, tmp_path: Path, caplog):
+
+    marker_dir = tmp_path / "markers"
+    script = submitting.generate_taskarray_script(
+        '[ "${SGE_TASK_ID}" -eq 2 ] && kill -9 $$; true',
+        cores=1,
+        log_dir=tmp_path / "log",
+        name="Killed",
+        task_stop=3,
+        marker_dir=marker_dir,
+    )
+    job_id, _ = submitting.submit_script(script, scr=tmp_path)
+    assert job_id is not None
+
+    tracker = status.TaskMarkerTracker(job_id, marker_dir, task_stop=3)
+    status.follow_task_markers([tracker], update_interval=0.2, exit_after=100, check_interval=0)
+
+    # The killed task never wrote its marker, and is failed once the array left qstat
+    assert tracker.is_finished()
+    assert tracker.failed == dict()
+    assert tracker.vanished == [2]
+    assert f"uge {job_id}.2: left qstat without a marker" in caplog.text
+
+
+def test_fake_qacct_task_counts(fake_uge: Path, tmp_path: Path):
+
+    job_ids: List[str] = []
+    for i, n_tasks in enumerate([3, 2]):
+        script = submitting.generate_taskarray_script(
+            "true", cores=1, log_dir=tmp_path / "log", name=f"Count{i}", task_stop=n_tasks
+        )
+        job_id, _ = submitting.submit_script(script, scr=tmp_path)
+        assert job_id is not None
+        job_ids.append(job_id)
+
+    list(status.wait_for_jobs(list(job_ids), respiratory=1))
+
+    counts, _ = status.get_qacct_task_counts(job_ids, since=time.time() - 60)
+    assert counts == {job_ids[0]: 3, job_ids[1]: 2}
+
+    # Jobs started before the begin time are left out
+    counts, _ = status.get_qacct_task_counts(job_ids, since=time.time() + 120)
+    assert counts == {job_ids[0]: 0, job_ids[1]: 0}
+
+    # Jobs of other owners are left out
+    counts, _ = status.get_qacct_task_counts(job_ids, since=time.time() - 60, owner="nobody")
+    assert counts == {job_ids[0]: 0, job_ids[1]: 0}
+
+    # Without a begin time, each job is counted from its own query
+    counts, _ = status.get_qacct_task_counts(job_ids)
+    assert counts == {job_ids[0]: 3, job_ids[1]: 2}
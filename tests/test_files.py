@@ -0,0 +1,71 @@
+import asyncio
+import threading
+import time
+from pathlib import Path
+
+from hpce_utils.files import watch
+
+
+def _touch_later(path: Path, delay: float) -> threading.Timer:
+    timer = threading.Timer(delay, path.touch)
+    timer.start()
+    return timer
+
+
+def test_wait_for_file(tmp_path: Path):
+
+    finished_file = tmp_path / "job.finished"
+    assert not watch.wait_for_file(finished_file, timeout=0.1, min_interval=0.05)
+
+    _touch_later(finished_file, 0.1)
+    start_time = time.monotonic()
+    assert watch.wait_for_file(finished_file, timeout=5, min_interval=0.05, max_interval=0.2)
+    assert time.monotonic() - start_time < 5
+
+
+def test_wait_for_file_inotify(tmp_path: Path):
+
+    if not watch.Inotify.is_available(tmp_path):
+        return
+
+    # With inotify the wait ends on the event, not on the stat interval
+    finished_file = tmp_path / "job.finished"
+    _touch_later(finished_file, 0.1)
+    start_time = time.monotonic()
+    assert watch.wait_for_file(finished_file, timeout=10, min_interval=5, max_interval=5)
+    assert time.monotonic() - start_time < 2
+
+
+def test_wait_for_file_async(tmp_path: Path):
+
+    finished_file = tmp_path / "job.finished"
+    _touch_later(finished_file, 0.1)
+
+    found = asyncio.run(
+        watch.wait_for_file_async(finished_file, timeout=5, min_interval=0.05, max_interval=0.2)
+    )
+    assert found
+
+
+def test_directory_watcher(tmp_path: Path):
+
+    watcher = watch.DirectoryWatcher(tmp_path, min_interval=0.05, max_interval=0.1)
+    filenames = [f"job_{i}.finished" for i in range(100)]
+
+    for filename in filenames[:50]:
+        (tmp_path / filename).touch()
+
+    for filename in filenames[50:]:
+        _touch_later(tmp_path / filename, 0.1)
+
+    async def wait_all():
+        waits = [watcher.wait_async(filename, timeout=5) for filename in filenames]
+        return await asyncio.gather(*waits)
+
+    assert all(asyncio.run(wait_all()))
+
+    # All waiters share the scans, so far fewer scans than waiters
+    assert watcher.n_scans < len(filenames)
+
+    created = list(watcher.iter_created(filenames[:10] + ["missing"], timeout=0.2))
+    assert created == sorted(filenames[:10])
@@ -0,0 +1,48 @@
+import json
+from pathlib import Path
+
+from hpce_utils.managers.uge import metrics
+
+ARRAY_METRICS: metrics.Metrics = {
+    "time": 1747660000.0,
+    "job": "12345678",
+    "name": 'job "a"',
+    "total": 100,
+    "running": 10,
+    "pending": 80,
+    "error": 0,
+    "finished": 10,
+    "tasks_per_second": 0.5,
+    "eta_seconds": None,
+}
+
+
+def test_json_lines_writer(tmp_path: Path):
+
+    writer = metrics.get_writer(tmp_path / "progress.jsonl")
+    assert isinstance(writer, metrics.JsonLinesWriter)
+
+    writer.write([ARRAY_METRICS])
+    writer.write([{**ARRAY_METRICS, "finished": 20}])
+
+    lines = (tmp_path / "progress.jsonl").read_text().splitlines()
+    assert [json.loads(line)["finished"] for line in lines] == [10, 20]
+
+
+def test_prometheus_textfile_writer(tmp_path: Path):
+
+    writer = metrics.get_writer(tmp_path / "hpce.prom")
+    assert isinstance(writer, metrics.PrometheusTextfileWriter)
+
+    writer.write([ARRAY_METRICS])
+    writer.write([ARRAY_METRICS])
+
+    # Replaced, not appended
+    text = (tmp_path / "hpce.prom").read_text()
+    assert list(tmp_path.iterdir()) == [tmp_path / "hpce.prom"]
+    assert text.count("# TYPE hpce_uge_array_tasks gauge") == 1
+
+    labels = 'job="12345678",name="job \\"a\\""'
+    assert f'hpce_uge_array_tasks{{{labels},state="pending"}} 80' in text
+    assert f"hpce_uge_array_tasks_per_second{{{labels}}} 0.5" in text
+    assert "hpce_uge_array_eta_seconds{" not in text
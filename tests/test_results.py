@@ -0,0 +1,65 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+import hpce_utils
+from hpce_utils.managers.uge import results
+from hpce_utils.managers.uge.results import ResultStore
+from hpce_utils.managers.uge.taskset import TaskSet
+
+
+def test_result_store(tmp_path: Path):
+
+    path = tmp_path / "results.npy"
+    store = ResultStore.create(path, n_tasks=6, shape=(3,), dtype=np.float32)
+
+    assert store.read().shape == (6, 3)
+    assert store.get_missing_tasks() == TaskSet.from_string("1-6:1")
+
+    # Tasks write their rows concurrently, as on the nodes
+    script = (
+        "from hpce_utils.managers.uge import results; results.write_result({path!r}, [{i}] * 3)"
+    )
+    environ = {**os.environ, "PYTHONPATH": str(Path(hpce_utils.__file__).parent.parent)}
+    processes = [
+        subprocess.Popen(
+            [sys.executable, "-c", script.format(path=str(path), i=task_id)],
+            env={**environ, "SGE_TASK_ID": str(task_id)},
+        )
+        for task_id in (1, 2, 4, 6)
+    ]
+    assert [process.wait() for process in processes] == [0] * 4
+
+    values = ResultStore(path).read()
+    assert isinstance(values, np.memmap)
+    assert values.dtype == np.float32
+    np.testing.assert_array_equal(values[:, 0], [1, 2, 0, 4, 0, 6])
+
+    assert store.get_missing_tasks() == TaskSet.from_ids([3, 5])
+    np.testing.assert_array_equal(store.get_written(), [1, 1, 0, 1, 0, 1])
+
+    with pytest.raises(ValueError):
+        store.write(3, [1.0, 2.0])
+
+    with pytest.raises(ValueError):
+        store.write(7, [1.0, 2.0, 3.0])
+
+
+def test_result_store_scalar(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+
+    store = ResultStore.create(tmp_path / "scalars.npy", n_tasks=3, dtype=np.int64)
+
+    monkeypatch.setenv("SGE_TASK_ID", "2")
+    results.write_result(store.path, 42)
+    results.write_result(store.path, 7, task_id=3)
+
+    assert store.read().tolist() == [0, 42, 7]
+    assert store.get_missing_tasks() == TaskSet.from_ids([1])
+
+    monkeypatch.delenv("SGE_TASK_ID")
+    with pytest.raises(ValueError):
+        results.write_result(store.path, 1)
@@ -1,8 +1,11 @@
+import asyncio
+import json
 import subprocess
 
 import pytest
 
 from hpce_utils import shell
+from hpce_utils.shell import timing
 
 
 def test_subprocess_error():
@@ -15,3 +18,77 @@ def test_subprocess_error_retry():
     command_fails = "this_command_does_not_exist"
     with pytest.raises(subprocess.CalledProcessError):
         shell.execute_with_retry(command_fails, max_retries=0)
+
+
+def test_execute_async():
+    stdout, stderr = asyncio.run(shell.execute_async("echo hello"))
+    assert stdout.strip() == "hello"
+    assert stderr == ""
+
+    with pytest.raises(subprocess.CalledProcessError):
+        asyncio.run(shell.execute_async(["false"]))
+
+    with pytest.raises(FileNotFoundError):
+        asyncio.run(shell.execute_async("this_command_does_not_exist"))
+
+    with pytest.raises(subprocess.TimeoutExpired):
+        asyncio.run(shell.execute_async("sleep 10", timeout=0.1))
+
+
+@pytest.fixture
+def timings():
+    timing.TIMINGS.reset()
+    timing.enable()
+    yield timing.TIMINGS
+    timing.disable()
+    timing.TIMINGS.reset()
+
+
+def test_timing_disabled():
+    timing.TIMINGS.reset()
+    shell.execute("echo hello")
+    assert timing.TIMINGS.to_dict() == {}
+
+
+def test_timing(timings, tmp_path):
+    shell.execute("echo hello")
+    shell.execute("echo hello | cat")
+    shell.execute("false", check=False)
+    shell.execute("sleep 10", timeout=0.1, check=False)
+    list(shell.stream("printf 'a\\nb\\n'"))
+    asyncio.run(shell.execute_async("echo hello"))
+
+    with pytest.raises(subprocess.CalledProcessError):
+        shell.execute_with_retry("this_command_does_not_exist", max_retries=1, update_interval=0)
+
+    stats = timings.to_dict()
+
+    assert stats["echo"]["count"] == 3
+    assert stats["echo"]["output_bytes"] == 18
+    assert stats["echo"]["returncodes"] == {"0": 3}
+    assert stats["false"]["returncodes"] == {"1": 1}
+    assert stats["sleep"]["returncodes"] == {timing.RETURNCODE_TIMEOUT: 1}
+    assert stats["sleep"]["max_seconds"] >= 0.1
+    assert stats["printf"]["output_bytes"] == 4
+    assert stats["this_command_does_not_exist"]["count"] == 2
+    assert stats["this_command_does_not_exist"]["retries"] == 1
+    assert sum(stats["echo"]["buckets"].values()) == 3
+
+    # Sorted by total time
+    assert list(stats)[0] == "sleep"
+
+    summary = timings.format_summary()
+    assert summary.splitlines()[1].startswith("sleep")
+
+    prometheus = timings.format_prometheus()
+    assert 'hpce_shell_command_duration_seconds_count{command="echo"} 3' in prometheus
+    assert 'hpce_shell_command_duration_seconds_bucket{command="echo",le="+Inf"} 3' in prometheus
+
+    timings.write_json(tmp_path / "timings.json")
+    assert json.loads((tmp_path / "timings.json").read_text())["echo"]["count"] == 3
+
+
+def test_timing_category():
+    assert timing.get_category("qstat -u user") == "qstat"
+    assert timing.get_category(["/opt/lmod/libexec/lmod", "python", "load", "x"]) == "lmod"
+    assert timing.get_category("module load x") == "lmod"
@@ -0,0 +1,109 @@
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+from hpce_utils.managers.uge import accounting, sizing, status, submitting
+
+GIGABYTE = 1024**3
+
+
+def _accounting_line(job_name: str, task_number: int, exit_status: int = 0) -> str:
+    record = {field: "0" for field in accounting.ACCOUNTING_FIELDS}
+    record.update(
+        {
+            "qname": "all.q",
+            "hostname": "node001",
+            "job_name": job_name,
+            "job_number": "100",
+            "task_number": str(task_number),
+            "exit_status": str(exit_status),
+            "slots": "2",
+            "ru_wallclock": str(600 + 60 * task_number),
+            "cpu": str(2 * (600 + 60 * task_number)),
+            "maxvmem": str(task_number * GIGABYTE),
+        }
+    )
+    return ":".join(record[field] for field in accounting.ACCOUNTING_FIELDS) + "\n"
+
+
+@pytest.fixture
+def accounting_file(tmp_path: Path) -> Path:
+    lines = [_accounting_line("calculation", task) for task in range(1, 11)]
+    lines += [_accounting_line("calculation", 11, exit_status=1)]
+    lines += [_accounting_line("other", task) for task in range(1, 11)]
+    path = tmp_path / "accounting"
+    path.write_text("# Version: 8.1.9\n" + "".join(lines))
+    return path
+
+
+def test_suggest_resources(accounting_file: Path):
+
+    history = sizing.get_history("calc*", accounting_path=accounting_file)
+    assert len(history) == 11
+
+    suggestion = sizing.suggest_resources(history, percentile=100, margin=1.0)
+    assert suggestion is not None
+    assert suggestion.n_samples == 10
+
+    # 10 GB peak over 2 slots, 20 minutes, and all CPU time on 2 cores
+    assert suggestion.mem == 5
+    assert (suggestion.hours, suggestion.mins) == (0, 20)
+    assert suggestion.cores == 2
+
+    suggestion = sizing.suggest_resources(history, percentile=100, margin=1.5, max_cores=2)
+    assert suggestion is not None
+    assert suggestion.mem == 8
+    assert (suggestion.hours, suggestion.mins) == (0, 30)
+    assert suggestion.cores == 2
+
+    assert sizing.suggest_resources(history.iloc[:3]) is None
+
+
+def test_suggest_resources_other_cores(accounting_file: Path):
+
+    history = sizing.get_history("calc*", accounting_path=accounting_file)
+
+    # The tasks ran on 2 slots, but the 10 GB peak is requested on 1 core
+    suggestion = sizing.suggest_resources(history, percentile=100, margin=1.0, max_cores=1)
+    assert suggestion is not None
+    assert suggestion.cores == 1
+    assert suggestion.mem == 10
+
+    # and on 3 cores, with the margin
+    suggestion = sizing.suggest_resources(history, percentile=100, margin=1.2)
+    assert suggestion is not None
+    assert suggestion.cores == 3
+    assert suggestion.mem == 4
+
+
+def test_autosize(accounting_file: Path, monkeypatch: pytest.MonkeyPatch, tmp_path: Path):
+
+    monkeypatch.setenv(accounting.ENVIRON_ACCOUNTING, str(accounting_file))
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+
+    script = submitting.generate_taskarray_script(
+        "echo", name="calculation", mem=64, hours=24, cores=8, log_dir=None, autosize=True
+    )
+    assert "m_mem_free=4G" in script
+    assert "h_rt=0:24:00" in script
+    assert "-pe smp 3" in script
+
+    # Without history, the requested resources are kept
+    script = submitting.generate_taskarray_script(
+        "echo", name="unknown", mem=64, hours=24, cores=8, log_dir=None, autosize=True
+    )
+    assert "m_mem_free=64G" in script
+    assert "-pe smp 8" in script
+
+
+def test_get_history_qacct_pattern(monkeypatch: pytest.MonkeyPatch):
+
+    monkeypatch.delenv(accounting.ENVIRON_ACCOUNTING, raising=False)
+
+    # The pattern reaches qacct, not the shell
+    with patch.object(status, "execute", return_value=("", "")) as mock_execute:
+        history = sizing.get_history("calc*; ls")
+
+    assert len(history) == 0
+    assert mock_execute.call_args.args[0] == "qacct -j 'calc*; ls'"
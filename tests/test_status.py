@@ -1,21 +1,97 @@
+import asyncio
 import os
+import subprocess
+import threading
+import time
 from pathlib import Path
 from subprocess import CalledProcessError as CPError
+from typing import Any, Dict, List, Tuple
 from unittest.mock import MagicMock, patch
 
+import pandas as pd  # type: ignore
 import pytest
 
-from hpce_utils.managers.uge import status, submitting
+from hpce_utils.managers.uge import accounting, status, submitting, throttle
 
-VALID_QSTAT_OUTPUT_RUNNING = """
+VALID_QSTAT_TEXT_OUTPUT_RUNNING = """
 job-ID     prior   name       user         state submit/start at     queue                          jclass                         slots ja-task-ID
 ---------------------------------------------------------------------------------
 12345678   0.5019  job        username     r     05/19/2025 09:18:15 some.q@some.server.eu.                                        1     1
 """
+VALID_QSTAT_OUTPUT_RUNNING = """<?xml version='1.0'?>
+<job_info  xmlns:xsd="http://arc.liv.ac.uk/repos/darcs/sge/source/dist/util/resources/schemas/qstat/qstat.xsd">
+  <queue_info>
+    <job_list state="running">
+      <JB_job_number>12345678</JB_job_number>
+      <JAT_prio>0.50190</JAT_prio>
+      <JB_name>job</JB_name>
+      <JB_owner>username</JB_owner>
+      <state>r</state>
+      <JAT_start_time>2025-05-19T09:18:15</JAT_start_time>
+      <queue_name>some.q@some.server.eu.</queue_name>
+      <jclass_name></jclass_name>
+      <slots>1</slots>
+      <tasks>1</tasks>
+    </job_list>
+  </queue_info>
+  <job_info>
+  </job_info>
+</job_info>
+"""
+QSTAT_XML_OUTPUT_MIXED = """<?xml version='1.0'?>
+<job_info  xmlns:xsd="http://arc.liv.ac.uk/repos/darcs/sge/source/dist/util/resources/schemas/qstat/qstat.xsd">
+  <queue_info>
+    <job_list state="running">
+      <JB_job_number>12345678</JB_job_number>
+      <JAT_prio>0.50190</JAT_prio>
+      <JB_name>a_job_name_that_is_much_longer_than_its_column</JB_name>
+      <JB_owner>username</JB_owner>
+      <state>r</state>
+      <JAT_start_time>2025-05-19T09:18:15</JAT_start_time>
+      <queue_name>a_very_long_queue_name.q@some.very.long.server.name.eu</queue_name>
+      <slots>4</slots>
+      <tasks>1</tasks>
+    </job_list>
+    <job_list state="running">
+      <JB_job_number>12345679</JB_job_number>
+      <JAT_prio>0.50190</JAT_prio>
+      <JB_name>job</JB_name>
+      <JB_owner>other</JB_owner>
+      <state>r</state>
+      <JAT_start_time>2025-05-19T09:18:15</JAT_start_time>
+      <queue_name>some.q@some.server.eu</queue_name>
+      <slots>2</slots>
+    </job_list>
+  </queue_info>
+  <job_info>
+    <job_list state="pending">
+      <JB_job_number>12345678</JB_job_number>
+      <JAT_prio>0.00000</JAT_prio>
+      <JB_name>a_job_name_that_is_much_longer_than_its_column</JB_name>
+      <JB_owner>username</JB_owner>
+      <state>qw</state>
+      <JB_submission_time>2025-05-19T09:18:00</JB_submission_time>
+      <queue_name></queue_name>
+      <slots>4</slots>
+      <tasks>2-10:1</tasks>
+    </job_list>
+  </job_info>
+</job_info>
+"""
 QSTATJ_OUTPUT = """
-job_number:                 26936216
+job_number:                 12345678
 submission_time:            05/19/2025 13:37:07.436
-job-array tasks:            0-1
+job-array tasks:            1-1:1
+"""
+QSTATJ_OUTPUT_BULK = """==============================================================
+job_number:                 12345678
+submission_time:            05/19/2025 13:37:07.436
+job-array tasks:            1-10:1
+==============================================================
+job_number:                 12345679
+submission_time:            05/19/2025 13:38:07.436
+job_state             1:    r
+error reason    1:          05/19/2025 13:39:07 [1234:5678]: can't make directory
 """
 VALID_QSTAT_OUTPUT_FINISHED = ""
 QSTATJ_OUTPUT_FINISHED = ""
@@ -41,6 +117,605 @@ def test_qstat_error():
             status.get_qstat("username", max_retries=0)
 
 
+def test_parse_qstat_xml():
+    pdf_text = status.parse_qstat(VALID_QSTAT_TEXT_OUTPUT_RUNNING)
+    pdf_xml = status.parse_qstat_xml(VALID_QSTAT_OUTPUT_RUNNING)
+
+    assert list(pdf_xml.columns) == list(pdf_text.columns)
+    assert pdf_xml["job-ID"].tolist() == pdf_text["job-ID"].tolist()
+    assert pdf_xml["queue"].tolist() == pdf_text["queue"].tolist()
+    assert pdf_xml["slots"].tolist() == pdf_text["slots"].tolist()
+
+
+def test_iter_qstat_xml():
+    # Stream line-by-line, and make sure overflowing names are kept intact
+    jobs = list(status.iter_qstat_xml(QSTAT_XML_OUTPUT_MIXED.splitlines(keepends=True)))
+
+    assert len(jobs) == 3
+    assert jobs[0].name == "a_job_name_that_is_much_longer_than_its_column"
+    assert jobs[0].queue == "a_very_long_queue_name.q@some.very.long.server.name.eu"
+    assert jobs[0].slots == 4
+    assert jobs[1].tasks == ""
+    assert jobs[2].state == "qw"
+    assert jobs[2].tasks == "2-10:1"
+    assert jobs[2].submit_start is not None
+    assert jobs[2].submit_start.minute == 18
+
+
+def test_parse_taskarray():
+    pdf = status.parse_qstat_xml(QSTAT_XML_OUTPUT_MIXED)
+    pdf.loc[len(pdf)] = pdf.iloc[2]
+    pdf.loc[len(pdf) - 1, "state"] = "Eqw"
+    pdf.loc[len(pdf) - 1, "ja-task-ID"] = "11,13-15:1"
+
+    counts = status.parse_taskarray(pdf)
+
+    assert counts["job"].tolist() == ["12345678", "12345679"]
+    assert counts["running"].tolist() == [1, 1]
+    assert counts["pending"].tolist() == [9, 0]
+    assert counts["error"].tolist() == [4, 0]
+
+    task_ids = status.parse_taskarray_ids(pdf)
+    assert task_ids["job"].tolist() == ["12345678", "12345679"]
+    assert str(task_ids["pending"][0]) == "2-10:1"
+    assert task_ids["error"][0].to_numpy().tolist() == [11, 13, 14, 15]
+    assert len(task_ids["running"][1]) == 0
+
+
+def test_count_tasks_step():
+    tasks = pd.Series(["1-10:2", "3", "1-10:3,20", "5-4:1"])
+    assert status._count_tasks(tasks).tolist() == [5, 1, 5, 0]
+
+
+def test_count_tasks_not_array():
+    tasks = pd.Series(["", None, float("nan"), " ", "2-4:1"])
+    assert status._count_tasks(tasks).tolist() == [1, 1, 1, 1, 3]
+
+
+def test_parse_taskarray_not_array():
+    pdf = pd.DataFrame(
+        [
+            {"job-ID": "12345678", "state": "qw", "ja-task-ID": ""},
+            {"job-ID": "12345679", "state": "Eqw", "ja-task-ID": ""},
+            {"job-ID": "12345680", "state": "r", "ja-task-ID": ""},
+            {"job-ID": "12345681", "state": "Eqw", "ja-task-ID": None},
+        ]
+    )
+
+    counts = status.parse_taskarray(pdf)
+
+    assert counts["job"].tolist() == ["12345678", "12345679", "12345680", "12345681"]
+    assert counts["running"].tolist() == [0, 0, 1, 0]
+    assert counts["pending"].tolist() == [1, 0, 0, 0]
+    assert counts["error"].tolist() == [0, 1, 0, 1]
+
+
+def test_get_cluster_usage():
+    mock_proc = MagicMock()
+    mock_proc.stdout = QSTAT_XML_OUTPUT_MIXED
+    mock_proc.stderr = ""
+    mock_proc.returncode = 0
+
+    with patch("hpce_utils.shell.subprocess.run", return_value=mock_proc):
+        counts = status.get_cluster_usage()
+
+    assert counts.to_dict() == {"other": 2, "username": 4}
+
+
+def test_parse_qstatj_bulk():
+    infos = status.parse_qstatj_bulk(QSTATJ_OUTPUT_BULK)
+
+    assert list(infos.keys()) == ["12345678", "12345679"]
+    assert infos["12345678"][status.COLUMN_TASKARRAY] == "1-10:1"
+    assert status.COLUMN_TASKARRAY not in infos["12345679"]
+    assert len(status._get_errors_from_qstatj(infos["12345679"])) == 1
+
+
+def test_get_qstatj_bulk_partially_finished():
+    qstatj_partial_error = CPError(
+        cmd="qstat -j 12345678,12345679,12345680",
+        returncode=1,
+        stderr="Following jobs do not exist or permissions are not sufficient: 12345680",
+        output=QSTATJ_OUTPUT_BULK,
+    )
+
+    with patch(
+        "hpce_utils.shell.subprocess.run", side_effect=[qstatj_partial_error]
+    ) as mock_subprocess:
+        infos, _ = status.get_qstatj_bulk(["12345678", "12345679", 12345680])
+
+    assert mock_subprocess.call_count == 1
+    assert "12345678,12345679,12345680" in mock_subprocess.call_args.args[0]
+    assert infos["12345680"] == dict()
+    assert infos["12345679"]["job_number"] == "12345679"
+
+
+def test_wait_for_jobs():
+    mock_proc_qstatj = MagicMock()
+    mock_proc_qstatj.stdout = QSTATJ_OUTPUT_BULK
+    mock_proc_qstatj.stderr = ""
+    mock_proc_qstatj.returncode = 0
+
+    qstatj_finished_error = CPError(
+        cmd="qstat -j 12345678,12345679",
+        returncode=1,
+        stderr="Following jobs do not exist or permissions are not sufficient: 12345678",
+        output="",
+    )
+
+    side_effects = [mock_proc_qstatj, qstatj_finished_error]
+
+    with patch("hpce_utils.shell.subprocess.run", side_effect=side_effects) as mock_subprocess:
+        finished = list(status.wait_for_jobs(["12345678", "12345679"], respiratory=0))
+
+    # One qstat -j per poll, regardless of the number of jobs
+    assert mock_subprocess.call_count == 2
+    assert finished == ["12345678", "12345679"]
+
+
+def test_get_qstatj_bulk_chunks():
+    qstatj_missing_error = CPError(
+        cmd="qstat -j 12345680",
+        returncode=1,
+        stderr="Following jobs do not exist or permissions are not sufficient: 12345680",
+        output="",
+    )
+    side_effects = [(QSTATJ_OUTPUT_BULK, ""), qstatj_missing_error]
+
+    with patch.object(status, "QSTATJ_MAX_JOBS", 2):
+        with patch.object(status, "execute", side_effect=side_effects) as mock_execute:
+            infos, _ = status.get_qstatj_bulk(["12345678", "12345679", "12345680"])
+
+    # One qstat -j per chunk of jobs
+    assert [call.args[0] for call in mock_execute.call_args_list] == [
+        "qstat -j 12345678,12345679",
+        "qstat -j 12345680",
+    ]
+    assert list(infos) == ["12345678", "12345679", "12345680"]
+    assert infos["12345678"][status.COLUMN_TASKARRAY] == "1-10:1"
+    assert infos["12345680"] == dict()
+
+
+def test_wait_for_jobs_scheduler_busy(caplog):
+    side_effects = [throttle.CircuitOpenError("qstat -j is open"), ({"12345678": {}}, "")]
+
+    with patch.object(status, "get_qstatj_bulk", side_effect=side_effects) as mock_qstatj:
+        finished = list(status.wait_for_jobs(["12345678"], respiratory=0))
+
+    # The busy poll is skipped, and the job is found done on the next
+    assert mock_qstatj.call_count == 2
+    assert finished == ["12345678"]
+    assert "qstat -j is open" in caplog.text
+
+
+def test_cross_check_vanished_scheduler_busy():
+    array_bar = MagicMock()
+    array_bar.job_id = "12345678"
+    counter = {"12345678": 0}
+
+    with patch.object(
+        status, "get_qstatj_bulk", side_effect=throttle.SchedulerBusyError("busy")
+    ) as mock_qstatj:
+        status._cross_check_vanished([array_bar], counter, "")
+
+    # Left for the next poll, without counting as a failed cross-check
+    mock_qstatj.assert_called_once()
+    array_bar.finish.assert_not_called()
+    assert counter == {"12345678": 0}
+
+
+def test_snapshot_cache(tmp_path: Path):
+    calls = []
+
+    def run():
+        calls.append(1)
+        return f"stdout {len(calls)}", ""
+
+    cache = status.SnapshotCache(ttl=60, path=tmp_path)
+    assert cache.fetch("qstat -u username", run) == ("stdout 1", "")
+    assert cache.fetch("qstat -u username", run) == ("stdout 1", "")
+    assert cache.fetch("qstat -u \\*", run) == ("stdout 2", "")
+
+    # Another process on the same host reads the stored snapshot
+    other_cache = status.SnapshotCache(ttl=60, path=tmp_path)
+    assert other_cache.fetch("qstat -u username", run) == ("stdout 1", "")
+    assert len(calls) == 2
+
+    # Expired snapshots are refreshed
+    expired_cache = status.SnapshotCache(ttl=1e-9, path=tmp_path)
+    assert expired_cache.fetch("qstat -u username", run) == ("stdout 3", "")
+
+    # Disabled cache always runs the query
+    disabled_cache = status.SnapshotCache(ttl=0, path=tmp_path)
+    disabled_cache.fetch("qstat -u username", run)
+    assert len(calls) == 4
+
+
+def test_snapshot_cache_failed_query(tmp_path: Path):
+    calls = []
+
+    def run_missing():
+        calls.append(1)
+        raise CPError(1, "qstat -j 1", output="", stderr="jobs do not exist")
+
+    def run_qmaster():
+        calls.append(1)
+        raise CPError(1, "qstat -j 2", output="", stderr="error: commlib error")
+
+    # Queries of finished jobs are cached, and raised again
+    cache = status.SnapshotCache(ttl=60, path=tmp_path)
+    for _ in range(2):
+        with pytest.raises(CPError) as exc_info:
+            cache.fetch("qstat -j 1", run_missing)
+        assert exc_info.value.stderr == "jobs do not exist"
+    assert len(calls) == 1
+
+    other_cache = status.SnapshotCache(ttl=60, path=tmp_path)
+    with pytest.raises(CPError):
+        other_cache.fetch("qstat -j 1", run_missing)
+    assert len(calls) == 1
+
+    # Unreachable qmaster is not
+    for _ in range(2):
+        with pytest.raises(CPError):
+            cache.fetch("qstat -j 2", run_qmaster)
+    assert len(calls) == 3
+
+
+def test_snapshot_cache_lock_per_query():
+    started = threading.Event()
+    release = threading.Event()
+
+    def run_slow():
+        started.set()
+        release.wait(10)
+        return "slow", ""
+
+    cache = status.SnapshotCache(ttl=60, path=None)
+    with patch.object(status.env, "get_shm_path", return_value=None):
+        thread = threading.Thread(target=cache.fetch, args=("qstat -j 1", run_slow))
+        thread.start()
+        started.wait(10)
+
+        # Other queries are not held up by the slow one
+        assert cache.fetch("qstat -u username", lambda: ("fast", "")) == ("fast", "")
+
+        release.set()
+        thread.join()
+
+    assert cache.fetch("qstat -j 1", run_slow) == ("slow", "")
+
+
+def test_get_qstat_with_snapshot_cache(tmp_path: Path):
+    mock_proc_running = MagicMock()
+    mock_proc_running.stdout = VALID_QSTAT_OUTPUT_RUNNING
+    mock_proc_running.stderr = ""
+    mock_proc_running.returncode = 0
+
+    cache = status.SnapshotCache(ttl=60, path=tmp_path)
+
+    with patch.object(status, "SNAPSHOT_CACHE", cache):
+        with patch(
+            "hpce_utils.shell.subprocess.run", return_value=mock_proc_running
+        ) as mock_subprocess:
+            qstat_1, _ = status.get_qstat("username", max_retries=0)
+            qstat_2, _ = status.get_qstat("username", max_retries=0)
+
+    assert mock_subprocess.call_count == 1
+    assert qstat_1.equals(qstat_2)
+
+
+def test_get_qstat_async_with_snapshot_cache(tmp_path: Path):
+    mock_proc_running = MagicMock()
+    mock_proc_running.stdout = VALID_QSTAT_OUTPUT_RUNNING
+    mock_proc_running.stderr = ""
+    mock_proc_running.returncode = 0
+
+    cache = status.SnapshotCache(ttl=60, path=tmp_path)
+
+    # Async callers share the snapshot of the sync ones
+    with patch.object(status, "SNAPSHOT_CACHE", cache):
+        with patch("hpce_utils.shell.subprocess.run", return_value=mock_proc_running):
+            qstat_1, _ = status.get_qstat("username", max_retries=0)
+
+        with patch("hpce_utils.managers.uge.status.execute_async") as mock_execute:
+            qstat_2, _ = asyncio.run(status.get_qstat_async("username"))
+
+    assert mock_execute.call_count == 0
+    assert qstat_1.equals(qstat_2)
+
+    # And retry on a transient error
+    qmaster_down = CPError(1, "qstat", output="", stderr="error: commlib error")
+    with patch(
+        "hpce_utils.managers.uge.status.execute_async",
+        side_effect=[qmaster_down, (VALID_QSTAT_OUTPUT_RUNNING, "")],
+    ) as mock_execute:
+        with patch("hpce_utils.managers.uge.throttle.asyncio.sleep"):
+            qstat_3, _ = asyncio.run(status.get_qstat_async("username", max_retries=1))
+
+    assert mock_execute.call_count == 2
+    assert qstat_3.equals(qstat_1)
+
+
+def test_poll_scheduler():
+    scheduler = status.PollScheduler(min_interval=5, max_interval=100, fraction=0.1, growth=2)
+
+    # Back off without an estimate
+    assert scheduler.next_interval() == 5
+    assert scheduler.next_interval() == 10
+    assert scheduler.next_interval() == 20
+
+    # Follow the expected remaining runtime, and tighten near completion
+    assert scheduler.next_interval(36000) == 100
+    assert scheduler.next_interval(500) == 50
+    assert scheduler.next_interval(10) == 5
+
+    # Backing off is capped by the time waited, so late jobs are noticed in time
+    scheduler = status.PollScheduler(min_interval=5, max_interval=600, fraction=0.1, growth=10)
+    assert scheduler.next_interval(elapsed=0) == 5
+    assert scheduler.next_interval(elapsed=300) == 30
+    assert scheduler.next_interval(elapsed=3600) == 300
+    assert scheduler.next_interval(elapsed=36000) == 600
+
+
+def test_get_remaining():
+    assert status._get_remaining(None, 100) is None
+    assert status._get_remaining(600, 100) == 500
+    assert status._get_remaining(600, 700) is None
+
+
+def test_taskarray_progress_estimate():
+    qstat = pd.DataFrame([{"job": "12345678", "running": 10, "pending": 90, "error": 0}])
+    job_info = {
+        "job_number": "12345678",
+        "submission_time": "05/19/2025 13:37:07.436",
+        "job-array tasks": "1-100:1",
+    }
+
+    with patch("hpce_utils.managers.uge.status.tqdm"):
+        progress = status.TaskarrayProgress(qstat, "12345678", job_info=job_info)
+
+    # Seeded with the submission time
+    assert progress.n_finished == 0
+    assert progress.estimate_remaining() is None
+
+    progress.samples.clear()
+    progress.samples.append((1000.0, 0))
+    progress.samples.append((1100.0, 20))
+    progress.n_finished = 20
+
+    assert progress.tasks_per_second() == 0.2
+    assert progress.estimate_remaining() == 400.0
+
+
+@pytest.mark.parametrize(
+    "array_info, n_total",
+    [("1-100:1", 100), ("2-10:2", 5), ("5-5:1", 1)],
+)
+def test_taskarray_progress_total(array_info, n_total):
+    qstat = pd.DataFrame([{"job": "12345678", "running": 0, "pending": n_total, "error": 0}])
+    job_info = {
+        "job_number": "12345678",
+        "submission_time": "05/19/2025 13:37:07.436",
+        "job-array tasks": array_info,
+    }
+
+    with patch("hpce_utils.managers.uge.status.tqdm"):
+        progress = status.TaskarrayProgress(qstat, "12345678", job_info=job_info)
+
+    assert progress.n_total == n_total
+    assert progress.n_finished == 0
+
+
+def test_wait_for_jobs_with_poll_scheduler():
+    qstatj_finished_error = CPError(
+        cmd="qstat -j 12345678",
+        returncode=1,
+        stderr="Following jobs do not exist or permissions are not sufficient: 12345678",
+        output="",
+    )
+
+    scheduler = status.PollScheduler(min_interval=0.01, max_interval=0.1)
+
+    with patch("hpce_utils.shell.subprocess.run", side_effect=[qstatj_finished_error]):
+        with patch("hpce_utils.managers.uge.status.time.sleep") as mock_sleep:
+            finished = list(status.wait_for_jobs(["12345678"], poll_scheduler=scheduler))
+
+    assert finished == ["12345678"]
+    mock_sleep.assert_called_once_with(0.01)
+
+
+def test_await_jobs():
+    qstatj_finished_error = CPError(
+        cmd="qstat -j 12345678,12345679",
+        returncode=1,
+        stderr="Following jobs do not exist or permissions are not sufficient: 12345678",
+        output=QSTATJ_OUTPUT_BULK.split("=" * 62)[-1],
+    )
+
+    side_effects = [qstatj_finished_error, ("", "")]
+
+    async def wait():
+        finished = []
+        async for job_id in status.await_jobs(["12345678", "12345679"], respiratory=0):
+            finished.append(job_id)
+        return finished
+
+    with patch(
+        "hpce_utils.managers.uge.status.execute_async", side_effect=side_effects
+    ) as mock_execute:
+        finished = asyncio.run(wait())
+
+    # One qstat -j per poll for all jobs
+    assert mock_execute.call_count == 2
+    assert mock_execute.call_args_list[0].args[0] == "qstat -j 12345678,12345679"
+    assert mock_execute.call_args_list[1].args[0] == "qstat -j 12345679"
+    assert finished == ["12345678", "12345679"]
+
+
+def test_job_watcher_scheduler_busy():
+    side_effects = [throttle.CircuitOpenError("qstat -j is open"), ({"12345678": {}}, "")]
+
+    async def wait():
+        return [job_id async for job_id in status.await_jobs(["12345678"], respiratory=0)]
+
+    with patch.object(status, "get_qstatj_bulk_async", side_effect=side_effects) as mock_qstatj:
+        finished = asyncio.run(wait())
+
+    assert mock_qstatj.call_count == 2
+    assert finished == ["12345678"]
+
+
+def test_job_watcher_cancel():
+    async def wait():
+        watcher = status.JobWatcher(respiratory=60)
+        waiter = asyncio.ensure_future(watcher.wait("12345678"))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        await asyncio.sleep(0)
+        return watcher
+
+    with patch("hpce_utils.managers.uge.status.execute_async") as mock_execute:
+        watcher = asyncio.run(wait())
+
+    assert mock_execute.call_count == 0
+    assert len(watcher._waiters) == 0
+
+
+def test_progress_renderer():
+    job_ids = [str(12345678 + i) for i in range(30)]
+    qstat = pd.DataFrame(
+        [{"job": job_id, "running": 2, "pending": 8, "error": 0} for job_id in job_ids]
+    )
+
+    with patch("hpce_utils.managers.uge.status.tqdm") as mock_tqdm:
+        progresses = [
+            status.TaskarrayProgress(
+                qstat,
+                job_id,
+                job_info={
+                    "job_number": job_id,
+                    "submission_time": "05/19/2025 13:37:07.436",
+                    "job-array tasks": "1-10:1",
+                },
+                display=False,
+            )
+            for job_id in job_ids
+        ]
+        renderer = status.ProgressRenderer(progresses, summary=True, min_refresh_interval=60)
+
+        summary_bar = mock_tqdm.return_value
+        n_refresh = summary_bar.refresh.call_count
+
+        # One job has left qstat, the rest are updated from the same snapshot
+        qstat_ = qstat.iloc[1:].assign(running=0, pending=5)
+        vanished = renderer.update(qstat_)
+
+    assert [bar.job_id for bar in vanished] == [job_ids[0]]
+    assert progresses[1].n_finished == 5
+    assert not renderer.is_finished()
+
+    # Throttled, so the update did not redraw
+    assert summary_bar.refresh.call_count == n_refresh
+
+    renderer.refresh(force=True)
+    assert summary_bar.n == 29 * 5 + 0
+    assert summary_bar.refresh.call_count == n_refresh + 1
+
+
+def test_qacct_cross_check():
+
+    def _record(job_id, task_id):
+        return f"""==============================================================
+qname                    some.q
+jobnumber                {job_id}
+taskid                   {task_id}
+exit_status              0
+"""
+
+    # Task 1 of job 100 was rescheduled, so it has two records
+    qacct_output = "".join(
+        _record(*record) for record in [(100, 1), (100, 1), (100, 2), (101, 1), (99, 1)]
+    )
+
+    cross_check = status.QacctCrossCheck(owner="username")
+    with patch.object(status, "execute", return_value=(qacct_output, "")) as mock_execute:
+        is_done = cross_check.check({"100": 2, "101": 2}, since=1747660000)
+        assert is_done == {"100": True, "101": False}
+
+        # One query for all jobs of the owner started since the earliest submission
+        mock_execute.assert_called_once()
+        assert mock_execute.call_args.args[0].startswith("qacct -o username -b ")
+
+        # Finished jobs are cached, only the unfinished job is queried again
+        is_done = cross_check.check({"100": 2, "101": 2}, since=1747660000)
+        assert mock_execute.call_args.args[0] == "qacct -j 101"
+        assert is_done == {"100": True, "101": False}
+
+        cross_check.check({"100": 2})
+        assert mock_execute.call_count == 2
+
+    # Without a submission time, each job is queried on its own
+    cross_check = status.QacctCrossCheck(owner="username")
+    with patch.object(status, "execute", return_value=(qacct_output, "")) as mock_execute:
+        is_done = cross_check.check({"100": 2, "101": 2})
+        assert is_done == {"100": True, "101": False}
+
+    assert [call.args[0] for call in mock_execute.call_args_list] == [
+        "qacct -j 100",
+        "qacct -j 101",
+    ]
+
+
+def test_split_vanished_since_submission():
+    qstat = pd.DataFrame([{"job": "12345678", "running": 10, "pending": 90, "error": 0}])
+    job_info = {
+        "job_number": "12345678",
+        "submission_time": "05/19/2025 13:37:07.436",
+        "job-array tasks": "1-100:1",
+    }
+
+    with patch("hpce_utils.managers.uge.status.tqdm"):
+        progress = status.TaskarrayProgress(qstat, "12345678", job_info=job_info)
+
+    # The submission is pushed out of the samples by later updates
+    for _ in range(status.PROGRESS_SAMPLES):
+        progress.update({"running": 10, "pending": 90})
+
+    in_qstatj, n_totals, since = status._split_vanished([progress], {"12345678": {}})
+
+    assert in_qstatj == []
+    assert n_totals == {"12345678": 100}
+    assert since == progress.submitted
+    assert since < progress.samples[0][0]
+
+
+def test_follow_progress_async():
+    side_effects = [
+        (VALID_QSTAT_OUTPUT_RUNNING, ""),
+        (QSTATJ_OUTPUT, ""),
+        (VALID_QSTAT_OUTPUT_RUNNING, ""),
+        (VALID_QSTAT_OUTPUT_FINISHED, ""),
+        (QSTATJ_OUTPUT_FINISHED, ""),
+        (QACCTJ_OUTPUT_FINISHED, ""),
+        (QSTATJ_OUTPUT_FINISHED, ""),
+    ]
+
+    with patch(
+        "hpce_utils.managers.uge.status.execute_async", side_effect=side_effects
+    ) as mock_execute:
+        with patch("hpce_utils.managers.uge.status.tqdm"):
+            asyncio.run(
+                status.follow_progress_async(
+                    username="username", job_ids=["12345678"], update_interval=0.01
+                )
+            )
+
+    assert mock_execute.call_count == 7
+
+
 def test_follow_progress():
     # Prepare mock process objects
     mock_proc_running = MagicMock()
@@ -93,6 +768,61 @@ def test_follow_progress():
         assert mock_subprocess.call_count == 7
 
 
+def test_follow_progress_with_poll_scheduler():
+    mock_proc_running = MagicMock()
+    mock_proc_running.stdout = VALID_QSTAT_OUTPUT_RUNNING
+    mock_proc_running.stderr = ""
+    mock_proc_running.returncode = 0
+
+    mock_proc_qstatj = MagicMock()
+    mock_proc_qstatj.stdout = QSTATJ_OUTPUT
+    mock_proc_qstatj.stderr = ""
+    mock_proc_qstatj.returncode = 0
+
+    mock_proc_finished = MagicMock()
+    mock_proc_finished.stdout = VALID_QSTAT_OUTPUT_FINISHED
+    mock_proc_finished.stderr = ""
+    mock_proc_finished.returncode = 0
+
+    qstatj_finished_error = CPError(
+        cmd="qstat -j 12345678",
+        returncode=1,
+        stderr="Following jobs do not exist or permissions are not sufficient: 12345678",
+        output="",
+    )
+
+    qacctj_finished = MagicMock()
+    qacctj_finished.stdout = QACCTJ_OUTPUT_FINISHED
+    qacctj_finished.stderr = ""
+    qacctj_finished.returncode = 0
+
+    side_effects = [
+        mock_proc_running,
+        mock_proc_qstatj,
+        mock_proc_running,
+        mock_proc_finished,
+        qstatj_finished_error,
+        qacctj_finished,
+        qstatj_finished_error,
+    ]
+
+    scheduler = status.PollScheduler(min_interval=0.01, max_interval=0.1)
+
+    with patch("hpce_utils.shell.subprocess.run", side_effect=side_effects) as mock_subprocess:
+        with patch("hpce_utils.managers.uge.status.tqdm"):
+            with patch("hpce_utils.managers.uge.status.time.sleep") as mock_sleep:
+                status.follow_progress(
+                    username="username",
+                    job_ids=["12345678"],
+                    poll_scheduler=scheduler,
+                )
+
+    assert mock_subprocess.call_count == 7
+
+    # One sleep per poll cycle
+    assert mock_sleep.call_count == 2
+
+
 def test_follow_progress_with_qstat_failures(caplog):
     # Simulate: success, success, failure, success, finished
 
@@ -279,3 +1009,276 @@ def test_wait_for_jobs_using_hold_job(home_tmp_path: Path):
 
     assert job_id_1 not in qstat["job"]
     assert job_id_2 not in qstat["job"]
+
+
+def test_generate_taskarray_scripts(tmp_path: Path):
+
+    log_dir = tmp_path / "logs"
+    marker_dir = tmp_path / "markers"
+    parameters: List[Dict[str, Any]] = [
+        {"cmd": f"echo {i}", "name": f"Job{i}", "task_stop": i + 1} for i in range(3)
+    ]
+
+    scripts = submitting.generate_taskarray_scripts(
+        parameters, log_dir=log_dir, marker_dir=marker_dir, cores=2
+    )
+
+    expected = [
+        submitting.generate_taskarray_script(
+            **parameters_, log_dir=log_dir, marker_dir=marker_dir, cores=2
+        )
+        for parameters_ in parameters
+    ]
+    assert scripts == expected
+    assert log_dir.is_dir()
+    assert marker_dir.is_dir()
+
+    # Defaults are overruled by each parameter set
+    (script,) = submitting.generate_taskarray_scripts([{"cores": 4}], cmd="hostname", log_dir=None)
+    assert "#$ -pe smp 4" in script
+
+    with pytest.raises(TypeError):
+        submitting.generate_taskarray_scripts([{"not_an_argument": 1}], cmd="hostname")
+
+
+def test_command_list(tmp_path: Path):
+
+    commands = ["echo first", "echo 'ünïcode' && echo second", "", "exit 3"]
+    commands_path, index_path, n_commands = submitting.write_command_list(
+        commands, tmp_path / "list"
+    )
+    assert n_commands == 4
+
+    for task_id, command in enumerate(commands, 1):
+        assert submitting.read_command(commands_path, index_path, task_id) == command
+
+    # Run the dispatch as each task would
+    script_path = tmp_path / "dispatch.sh"
+    script_path.write_text(submitting.generate_command_dispatch(commands_path, index_path))
+
+    outputs = []
+    for task_id in range(1, 5):
+        environ = {**os.environ, "SGE_TASK_ID": str(task_id)}
+        process = subprocess.run(
+            ["bash", str(script_path)], env=environ, capture_output=True, text=True
+        )
+        outputs.append((process.stdout, process.returncode))
+
+    assert outputs == [("first\n", 0), ("ünïcode\nsecond\n", 0), ("", 0), ("", 3)]
+
+    with pytest.raises(ValueError):
+        submitting.write_command_list(["echo\nrm"], tmp_path / "invalid")
+
+
+def test_get_packing():
+
+    # Without a runtime, one item per task
+    assert submitting.get_packing(50) == (1, 50, 50)
+
+    # 5 second items for 10 minute tasks, from an estimate or measured runtimes
+    assert submitting.get_packing(50_000, 5.0, target_seconds=600) == (120, 417, 100)
+    assert submitting.get_packing(50_000, [4.0, 5.0, 60.0], target_seconds=600) == (120, 417, 100)
+    assert submitting.get_packing(50_000, 5.0, target_seconds=600, cores=4) == (480, 105, 100)
+
+    # Few items are spread over the concurrent tasks
+    assert submitting.get_packing(250, 5.0, task_concurrent=100) == (3, 84, 84)
+
+    # Items longer than the target are never combined
+    assert submitting.get_packing(10, 3600.0) == (1, 10, 10)
+
+
+def test_command_list_packed(tmp_path: Path):
+
+    commands = [f"echo {i}" for i in range(1, 8)] + ["false"]
+    commands_path, index_path, _ = submitting.write_command_list(commands, tmp_path / "list")
+
+    def run(dispatch: str, task_id: int) -> Tuple[List[str], int]:
+        script_path = tmp_path / "dispatch.sh"
+        script_path.write_text(dispatch)
+        environ = {**os.environ, "SGE_TASK_ID": str(task_id)}
+        process = subprocess.run(
+            ["bash", str(script_path)], env=environ, capture_output=True, text=True
+        )
+        return process.stdout.split(), process.returncode
+
+    dispatch = submitting.generate_command_dispatch(commands_path, index_path, items_per_task=3)
+    assert run(dispatch, 1) == (["1", "2", "3"], 0)
+    assert run(dispatch, 2) == (["4", "5", "6"], 0)
+    assert run(dispatch, 3) == (["7"], 1)
+
+    dispatch = submitting.generate_command_dispatch(
+        commands_path, index_path, items_per_task=3, parallel_cores=3
+    )
+    stdout, returncode = run(dispatch, 2)
+    assert sorted(stdout) == ["4", "5", "6"]
+    assert returncode == 0
+    assert run(dispatch, 3)[1] != 0
+
+
+def test_task_marker_tracker(tmp_path: Path):
+
+    # Scratch paths with spaces are quoted in the script
+    marker_dir = tmp_path / "scratch dir" / "markers"
+    script = submitting.generate_taskarray_script(
+        'test "$SGE_TASK_ID" != "3"',
+        task_stop=5,
+        log_dir=None,
+        marker_dir=marker_dir,
+    )
+    script_path = tmp_path / "job.sh"
+    script_path.write_text(script)
+
+    tracker = status.TaskMarkerTracker("123", marker_dir, task_stop=5)
+    assert tracker.update() == 0
+
+    # Run tasks as the scheduler would
+    for task_id in [1, 3, 4]:
+        environ = {**os.environ, "JOB_ID": "123", "SGE_TASK_ID": str(task_id)}
+        subprocess.run(["bash", str(script_path)], env=environ, cwd=tmp_path)
+
+    # Other jobs and unfinished markers are ignored
+    (marker_dir / "124.2.0.done").touch()
+    (marker_dir / "123.5.done").touch()
+    (marker_dir / "123.5.0.done.tmp").touch()
+
+    assert tracker.update() == 3
+    assert tracker.update() == 0
+    assert tracker.n_finished == 3
+    assert tracker.failed == {3: 1}
+    assert tracker.is_task_finished(4)
+    assert not tracker.is_task_finished(2)
+    assert tracker.get_unfinished_task_ids() == [2, 5]
+    assert tracker.get_unfinished_tasks().to_numpy().tolist() == [2, 5]
+    assert not tracker.is_finished()
+    assert sorted(os.listdir(marker_dir)) == sorted(
+        [
+            "123.1.0.done",
+            "123.3.1.done",
+            "123.4.0.done",
+            "123.5.0.done.tmp",
+            "123.5.done",
+            "124.2.0.done",
+        ]
+    )
+
+    status.follow_task_markers([tracker], exit_after=0)
+
+
+def test_task_marker_tracker_poll_interval(tmp_path: Path):
+    marker_dir = tmp_path / "markers"
+    marker_dir.mkdir()
+
+    tracker = status.TaskMarkerTracker("123", marker_dir, task_stop=10, submitted=time.time() - 30)
+    scheduler = status.PollScheduler(min_interval=1, max_interval=600, fraction=0.1, growth=10)
+
+    # Without finished tasks, backing off is capped by the time since the submission
+    assert status._get_poll_interval([tracker], scheduler) == 1
+    assert status._get_poll_interval([tracker], scheduler) == pytest.approx(3, abs=0.1)
+    assert tracker.estimate_remaining() is None
+
+    tracker.samples.clear()
+    tracker.samples.append((1000.0, 0))
+    tracker.samples.append((1010.0, 5))
+    tracker.n_finished = 5
+
+    # Then from the completion rate of the markers
+    assert tracker.estimate_remaining() == 10.0
+    assert status._get_poll_interval([tracker], scheduler) == 1
+
+
+QACCTJ_OUTPUT_TASKS = """==============================================================
+qname                    some.q
+hostname                 node001.server.eu
+group                    some_group
+owner                    username
+jobname                  some_name
+jobnumber                12345678
+taskid                   1
+qsub_time                05/19/2025 09:18:15.342
+start_time               05/19/2025 09:18:20.123
+end_time                 05/19/2025 09:19:20.456
+granted_pe               smp
+slots                    4
+failed                   0
+exit_status              0
+ru_wallclock             60.333
+ru_maxrss                2048
+cpu                      58.444s
+mem                      12.345GBs
+maxvmem                  1.500G
+arid                     undefined
+==============================================================
+qname                    some.q
+hostname                 node002.server.eu
+group                    some_group
+owner                    username
+jobname                  some_name
+jobnumber                12345678
+taskid                   2
+qsub_time                05/19/2025 09:18:15.342
+start_time               -/-
+end_time                 -/-
+granted_pe               smp
+slots                    4
+failed                   100 : assumedly after job
+exit_status              137
+ru_wallclock             0s
+ru_maxrss                0
+cpu                      0.000
+mem                      0.000
+maxvmem                  512.000M
+arid                     undefined
+"""
+
+
+def test_parse_qacctj_typed():
+    pdf = status.parse_qacctj_typed(QACCTJ_OUTPUT_TASKS)
+
+    assert len(pdf) == 2
+    assert pdf["taskid"].tolist() == [1, 2]
+    assert pdf["failed"].tolist() == [0, 100]
+    assert pdf["exit_status"].tolist() == [0, 137]
+    assert pdf["ru_wallclock"].tolist() == [60.333, 0.0]
+    assert pdf["cpu"].tolist() == [58.444, 0.0]
+    assert pdf["ru_maxrss"].tolist() == [2048 * 1024, 0]
+    assert pdf["maxvmem"].tolist() == [1.5 * 1024**3, 512 * 1024**2]
+    assert pdf["arid"].isna().all()
+    assert pdf["hostname"].dtype == "category"
+    assert pdf["qname"].dtype == "category"
+    assert pd.api.types.is_datetime64_any_dtype(pdf["start_time"])
+    assert pdf["start_time"][0] == pd.Timestamp("2025-05-19 09:18:20.123")
+    assert pd.isna(pdf["end_time"][1])
+
+    assert len(status.parse_qacctj_typed("")) == 0
+
+
+def test_parse_qacctj_typed_unaligned():
+    # Keys longer than the value column, and keys without values
+    stdout = (
+        "==============================================================\n"
+        "qname        some.q\n"
+        "a_very_long_key_name 1\n"
+        "project\n"
+        "taskid       1   \n"
+        "==============================================================\n"
+        "qname        other.q\n"
+        "taskid       2\n"
+    )
+    pdf = status.parse_qacctj_typed(stdout)
+
+    assert list(pdf.columns) == ["qname", "a_very_long_key_name", "project", "taskid"]
+    assert pdf["qname"].tolist() == ["some.q", "other.q"]
+    assert pdf["a_very_long_key_name"][0] == "1"
+    assert pd.isna(pdf["a_very_long_key_name"][1])
+    assert pdf["project"][0] == ""
+    assert pd.isna(pdf["project"][1])
+    assert pdf["taskid"].tolist() == [1, 2]
+
+
+def test_split_qacct_text_columns():
+    # Aligned records are split per key, the same as line by line
+    pdf = accounting.split_qacct_text(QACCTJ_OUTPUT_TASKS)
+    expected = accounting._split_qacct_lines(QACCTJ_OUTPUT_TASKS.split("\n"))
+
+    pd.testing.assert_frame_equal(pdf, expected)
+    assert pdf["maxvmem"].tolist() == ["1.500G", "512.000M"]
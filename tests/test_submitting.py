@@ -0,0 +1,114 @@
+import subprocess
+from pathlib import Path
+from typing import List
+from unittest.mock import patch
+
+from hpce_utils.managers.uge import status, submitting
+
+
+def test_submit_scripts(fake_uge: Path, tmp_path: Path):
+
+    scripts = [
+        submitting.generate_taskarray_script(
+            f"echo job {i}", cwd=tmp_path, log_dir=tmp_path / "logs", name=f"Job{i}"
+        )
+        for i in range(6)
+    ]
+    filenames = [f"job{i}.sh" for i in range(6)]
+
+    # The third script fails once, as if qmaster dropped the request
+    execute = submitting.execute
+    failed: List[str] = []
+
+    def flaky_execute(cmd, **kwargs):
+        if cmd.endswith("job2.sh") and not failed:
+            failed.append(cmd)
+            raise subprocess.CalledProcessError(1, cmd, "", "error: commlib error")
+        return execute(cmd, **kwargs)
+
+    with patch.object(submitting, "execute", side_effect=flaky_execute):
+        results = submitting.submit_scripts(
+            scripts, scr=tmp_path, filenames=filenames, max_workers=3, update_interval=0
+        )
+
+    assert [result.script_path for result in results] == [tmp_path / name for name in filenames]
+    assert all(result.job_id is not None for result in results)
+    assert [result.attempts for result in results] == [1, 1, 2, 1, 1, 1]
+
+    job_ids = [result.job_id for result in results if result.job_id is not None]
+    assert len(set(job_ids)) == 6
+
+    finished = list(status.wait_for_jobs(list(job_ids), respiratory=1))
+    assert sorted(finished) == sorted(job_ids)
+
+    # Failures that persist are reported per script
+    qmaster_error = subprocess.CalledProcessError(1, "qsub", "", "error: commlib error")
+    with patch.object(submitting, "execute", side_effect=qmaster_error):
+        results = submitting.submit_scripts(
+            scripts[:2], scr=tmp_path, max_retries=1, update_interval=0
+        )
+
+    assert [result.job_id for result in results] == [None, None]
+    assert [result.attempts for result in results] == [2, 2]
+    assert all(result.error for result in results)
+
+    # Only qmaster errors are retried, and a timeout is never resubmitted
+    for error in [
+        subprocess.CalledProcessError(1, "qsub", "", "Unable to read script file"),
+        subprocess.TimeoutExpired("qsub", 60),
+    ]:
+        with patch.object(submitting, "execute", side_effect=error) as mock_execute:
+            results = submitting.submit_scripts(
+                scripts[:1], scr=tmp_path, max_retries=1, update_interval=0
+            )
+
+        mock_execute.assert_called_once()
+        assert results[0].job_id is None
+        assert results[0].attempts == 1
+        assert results[0].error
+
+
+def test_submit_command_list(fake_uge: Path, tmp_path: Path):
+
+    output_dir = tmp_path / "outputs"
+    output_dir.mkdir()
+    commands = [f"echo {i} > {output_dir}/{i}.txt" for i in range(1, 8)]
+
+    job_id, script_path = submitting.submit_command_list(
+        commands, scr=tmp_path, log_dir=tmp_path / "logs", task_concurrent=4
+    )
+    assert job_id is not None
+    assert script_path is not None
+    assert "-t 1-7:1" in script_path.read_text()
+
+    finished = list(status.wait_for_jobs([job_id], respiratory=1))
+    assert finished == [job_id]
+
+    outputs = {path.name: path.read_text() for path in output_dir.iterdir()}
+    assert outputs == {f"{i}.txt": f"{i}\n" for i in range(1, 8)}
+
+
+def test_submit_command_list_packed(fake_uge: Path, tmp_path: Path):
+
+    output_dir = tmp_path / "outputs"
+    output_dir.mkdir()
+    commands = [f"echo $SGE_TASK_ID > {output_dir}/{i}.txt" for i in range(1, 11)]
+
+    job_id, script_path = submitting.submit_command_list(
+        commands,
+        scr=tmp_path,
+        log_dir=tmp_path / "logs",
+        item_seconds=1.0,
+        target_seconds=4.0,
+        task_concurrent=2,
+    )
+    assert job_id is not None
+    assert script_path is not None
+    assert "-t 1-3:1" in script_path.read_text()
+    assert "-tc 2" in script_path.read_text()
+
+    finished = list(status.wait_for_jobs([job_id], respiratory=1))
+    assert finished == [job_id]
+
+    task_ids = [(output_dir / f"{i}.txt").read_text().strip() for i in range(1, 11)]
+    assert task_ids == ["1"] * 4 + ["2"] * 4 + ["3"] * 2
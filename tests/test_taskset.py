@@ -0,0 +1,64 @@
+import numpy as np
+
+from hpce_utils.managers.uge.taskset import TaskSet, count_tasks
+
+
+def test_parse_and_format():
+
+    tasks = TaskSet.from_string("1-10:1,12,20-30:2")
+
+    assert str(tasks) == "1-10:1,12,20-30:2"
+    assert len(tasks) == 17
+    assert 22 in tasks
+    assert 23 not in tasks
+    assert 11 not in tasks
+    assert tasks.min() == 1
+    assert tasks.max() == 30
+
+    # Inclusive last task, with step
+    assert count_tasks("2-10:1") == 9
+    assert count_tasks("1-10:3") == 4
+    assert count_tasks("11,13-15:1") == 4
+    assert count_tasks("") == 0
+
+    # Overlapping and adjacent ranges are merged
+    assert str(TaskSet.from_string("1-3:1,4-6:1,5-8:1")) == "1-8:1"
+
+
+def test_set_operations():
+
+    tasks = TaskSet.from_string("1-10:1,12,20-30:2")
+    other = TaskSet.from_string("5-25:1")
+
+    assert str(tasks | other) == "1-26:1,28,30"
+    assert str(tasks - other) == "1-4:1,26,28,30"
+    assert str(tasks & other) == "5-10:1,12,20,22,24"
+
+    # Different steps fall back to the task IDs
+    odd = TaskSet.from_string("1-9:2")
+    assert str(odd | TaskSet.from_string("2-10:2")) == "1-10:1"
+    assert str(odd - TaskSet.from_string("3")) == "1,5-9:2"
+
+    # Huge arrays stay a few ranges
+    pending = TaskSet.from_string("1-1000000:1") - TaskSet.from_string("500,600-700:1")
+    assert len(pending) == 1000000 - 102
+    assert len(pending.ranges) == 3
+
+
+def test_random_against_python_sets():
+
+    rng = np.random.default_rng(42)
+
+    for _ in range(200):
+        step = int(rng.choice([1, 2, 3]))
+        ids_a = set(range(int(rng.integers(1, 20)), int(rng.integers(20, 60)), step))
+        ids_b = set(int(i) for i in rng.integers(1, 60, size=int(rng.integers(0, 15))))
+
+        a = TaskSet.from_ids(ids_a)
+        b = TaskSet.from_ids(ids_b)
+
+        assert set(a | b) == ids_a | ids_b
+        assert set(a - b) == ids_a - ids_b
+        assert set(a & b) == ids_a & ids_b
+        assert a.to_numpy().tolist() == sorted(ids_a)
+        assert TaskSet.from_string(str(a)) == a
@@ -0,0 +1,159 @@
+import asyncio
+import subprocess
+import time
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+from hpce_utils.managers.uge import throttle
+from hpce_utils.managers.uge.throttle import (
+    CircuitOpenError,
+    CommandLimits,
+    SchedulerBusyError,
+    SchedulerThrottle,
+)
+
+QMASTER_DOWN = subprocess.CalledProcessError(
+    1, "qstat", "", "error: commlib error: got select error (Connection refused)"
+)
+
+
+def test_get_command():
+    assert throttle.get_command("qstat -j 1 | head -n 100") == "qstat"
+    assert throttle.get_command("/opt/uge/bin/qsub script.sh") == "qsub"
+    assert throttle.get_command("") == ""
+
+
+def test_rate_limit_shared(tmp_path: Path):
+    limits = {"qstat": CommandLimits(rate=10.0, burst=2.0)}
+    throttle_a = SchedulerThrottle(limits, path=tmp_path)
+    throttle_b = SchedulerThrottle(limits, path=tmp_path)
+
+    # The burst is shared between both throttles, as between processes
+    assert throttle_a.acquire("qstat") == 0.0
+    assert throttle_b.acquire("qstat") == 0.0
+    assert throttle_a.acquire("qstat") == pytest.approx(0.1, abs=0.02)
+    assert throttle_b.acquire("qstat") == pytest.approx(0.2, abs=0.02)
+
+    # Unlimited commands are not counted
+    assert throttle_a.acquire("qacct") == 0.0
+    assert not (tmp_path / "qacct.json").exists()
+
+
+def test_rate_limit_max_wait():
+    limits = {"qsub": CommandLimits(rate=1.0, burst=1.0, max_wait=0.5)}
+    throttle_ = SchedulerThrottle(limits)
+
+    with patch.object(SchedulerThrottle, "path", None):
+        assert throttle_.acquire("qsub") == 0.0
+        with pytest.raises(SchedulerBusyError):
+            throttle_.acquire("qsub")
+
+
+def test_circuit_breaker(tmp_path: Path):
+    limits = {"qstat": CommandLimits(failure_threshold=2, reset_timeout=0.2)}
+    throttle_ = SchedulerThrottle(limits, path=tmp_path)
+
+    def fail():
+        raise QMASTER_DOWN
+
+    def missing_job():
+        raise subprocess.CalledProcessError(1, "qstat", "", "Following jobs do not exist: 1")
+
+    # Errors of a responsive qmaster do not count
+    for _ in range(3):
+        with pytest.raises(subprocess.CalledProcessError):
+            throttle_.call("qstat -j 1", missing_job)
+
+    for _ in range(2):
+        with pytest.raises(subprocess.CalledProcessError):
+            throttle_.call("qstat -u user", fail)
+
+    with pytest.raises(CircuitOpenError):
+        throttle_.call("qstat -u user", lambda: ("", ""))
+
+    # After the reset timeout, a failed probe opens the circuit again
+    time.sleep(0.25)
+    with pytest.raises(subprocess.CalledProcessError):
+        throttle_.call("qstat -u user", fail)
+    with pytest.raises(CircuitOpenError):
+        throttle_.call("qstat -u user", lambda: ("", ""))
+
+    # and a successful probe closes it
+    time.sleep(0.25)
+    assert throttle_.call("qstat -u user", lambda: ("out", "")) == ("out", "")
+    assert throttle_.call("qstat -u user", lambda: ("out", "")) == ("out", "")
+
+
+def test_slow_call_opens_circuit(tmp_path: Path):
+    limits = {"qacct": CommandLimits(failure_threshold=1, slow_call=0.01)}
+    throttle_ = SchedulerThrottle(limits, path=tmp_path)
+
+    throttle_.call("qacct -j 1", lambda: time.sleep(0.02))
+
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(throttle_.call_async("qacct -j 1", lambda: asyncio.sleep(0)))
+
+
+def test_call_with_retry(tmp_path: Path):
+    limits = {"qstat": CommandLimits(failure_threshold=2, reset_timeout=60)}
+    throttle_ = SchedulerThrottle(limits, path=tmp_path)
+
+    calls = []
+
+    def fail():
+        calls.append(1)
+        raise QMASTER_DOWN
+
+    # Retries stop when the circuit opens, instead of piling on
+    with patch.object(throttle.time, "sleep") as mock_sleep:
+        with pytest.raises(CircuitOpenError):
+            throttle_.call_with_retry("qstat", fail, max_retries=5, update_interval=1)
+
+    assert len(calls) == 2
+    assert mock_sleep.call_count == 2
+    assert all(0 <= call.args[0] <= 2 for call in mock_sleep.call_args_list)
+
+
+def test_call_with_retry_async(tmp_path: Path):
+    throttle_ = SchedulerThrottle(path=tmp_path)
+
+    outputs = [QMASTER_DOWN, ("stdout", "")]
+
+    async def run():
+        output = outputs.pop(0)
+        if isinstance(output, BaseException):
+            raise output
+        return output
+
+    with patch.object(throttle.asyncio, "sleep") as mock_sleep:
+        result = asyncio.run(
+            throttle_.call_with_retry_async("qstat", run, max_retries=1, update_interval=1)
+        )
+
+    assert result == ("stdout", "")
+    assert mock_sleep.call_count == 1
+
+
+def test_limits_from_environ(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setenv(throttle.ENVIRON_LIMITS, '{"qstat": {"rate": 2, "burst": 5}}')
+    limits = throttle.get_limits_from_environ()
+    assert limits == {"qstat": CommandLimits(rate=2, burst=5)}
+
+    monkeypatch.setenv(throttle.ENVIRON_LIMITS, "not json")
+    assert throttle.get_limits_from_environ() == {}
+
+    # Misspelled keys and values that are not objects disable the limits, as at import
+    for text in ['{"qstat": {"rate": 2, "brust": 5}}', '{"qstat": 2}', "[1, 2]"]:
+        monkeypatch.setenv(throttle.ENVIRON_LIMITS, text)
+        assert throttle.get_limits_from_environ() == {}
+
+
+def test_configure_unknown_limits():
+    scheduler = SchedulerThrottle()
+
+    with pytest.raises(ValueError, match="brust"):
+        scheduler.configure("qstat", rate=2, brust=5)
+
+    assert "qstat" not in scheduler.limits